@@ -0,0 +1,395 @@
+"""
+Import-time and synth-time benchmarks for pl_x_cdk_utils
+
+    python benchmarks/run_benchmarks.py                    # compare
+    python benchmarks/run_benchmarks.py --update-baseline  # new baseline
+    python benchmarks/run_benchmarks.py --output out.json
+
+Every result is compared with benchmarks/baseline.json, a result worse than
+its baseline by more than the threshold is a regression, and a result
+without baseline entry or a baselined benchmark that couldn't run is a
+failure, the script exits with 1 for any of them. The benchmarks that need
+aws_cdk only run with the cdk extra installed. The numbers are absolute, so
+the baseline records the python minor version and the machine architecture
+it was measured on, a run on another one fails as well unless
+--ignore-platform is given or the baseline is regenerated.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(ROOT, "benchmarks", "baseline.json")
+DEFAULT_THRESHOLD = 0.25
+
+MODULES = [
+    "api_gateway_utils",
+    "autoscaling",
+    "boto3_utils",
+    "ec2_utils",
+    "ecs_utils",
+    "events_utils",
+    "firehose_utils",
+    "glue_utils",
+    "helpers",
+    "iam_utils",
+    "lambda_utils",
+    "logs_utils",
+    "pipelines_utils",
+    "s3_utils",
+    "sns_utils",
+    "ssm_utils",
+    "step_function_json_utils",
+    "stepfunctions_utils",
+]
+
+
+class Skipped(Exception):
+    pass
+
+
+def measure_import(module, repeat=5):
+    """
+    Cold import time of a module, every run is a new interpreter
+    :param module: string
+                   Module name inside pl_x_cdk_utils
+    :param repeat: int
+                   Number of interpreters to start, the median is kept
+    :return: float
+             Import time in milliseconds
+    """
+    name = f"pl_x_cdk_utils.{module}"
+    env = dict(os.environ, PYTHONPATH=ROOT, PYTHONDONTWRITEBYTECODE="1")
+    timings = []
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {name}"],
+            capture_output=True,
+            text=True,
+            env=env,
+        )
+        if result.returncode:
+            raise Skipped(result.stderr.strip().splitlines()[-1])
+        for line in result.stderr.splitlines():
+            # import time: self [us] | cumulative | imported package
+            parts = [part.strip() for part in line.split("|")]
+            if len(parts) == 3 and parts[2] == name:
+                timings.append(int(parts[1]) / 1000)
+    return statistics.median(timings)
+
+
+def _get_cdk_stack():
+    try:
+        import aws_cdk as cdk
+    except ImportError as e:
+        raise Skipped(str(e))
+    app = cdk.App()
+    return app, cdk.Stack(app, "benchmark-stack")
+
+
+def _throughput(create, count):
+    started = time.perf_counter()
+    for i in range(count):
+        create(i)
+    return count / (time.perf_counter() - started)
+
+
+def bench_deploy_state_machine(count):
+    app, stack = _get_cdk_stack()
+    from aws_cdk import aws_stepfunctions as sfn
+
+    from pl_x_cdk_utils.stepfunctions_utils import deploy_state_machine
+
+    def create(i):
+        deploy_state_machine(
+            stack, f"state-machine-{i}", sfn.Pass(stack, f"pass-{i}")
+        )
+
+    return _throughput(create, count), app
+
+
+def bench_implement_lambda_function(count):
+    app, stack = _get_cdk_stack()
+    from pl_x_cdk_utils.lambda_utils import implement_lambda_function
+
+    lambda_path = tempfile.mkdtemp()
+    with open(os.path.join(lambda_path, "lambda_handler.py"), "w") as f:
+        f.write("def lambda_handler(event, context):\n    return event\n")
+
+    def create(i):
+        implement_lambda_function(stack, lambda_path, function_name=f"fn-{i}")
+
+    return _throughput(create, count), app
+
+
+def bench_create_glue_table(count):
+    app, stack = _get_cdk_stack()
+    from aws_cdk import aws_glue_alpha as glue, aws_s3 as s3
+
+    from pl_x_cdk_utils.glue_utils import create_glue_table
+
+    database = glue.Database(stack, "database", database_name="benchmark")
+    bucket = s3.Bucket(stack, "bucket")
+    columns = [glue.Column(name="id", type=glue.Schema.STRING)]
+
+    def create(i):
+        create_glue_table(
+            stack, database, f"table_{i}", bucket, f"table_{i}/", columns
+        )
+
+    return _throughput(create, count), app
+
+
+def bench_get_delivery_stream_for_s3_destination(count):
+    app, stack = _get_cdk_stack()
+    from aws_cdk.aws_kinesisfirehose import CfnDeliveryStream as Firehose
+
+    from pl_x_cdk_utils.firehose_utils import (
+        get_delivery_stream_for_s3_destination,
+    )
+
+    config = Firehose.ExtendedS3DestinationConfigurationProperty(
+        bucket_arn="arn:aws:s3:::benchmark",
+        role_arn="arn:aws:iam::123456789012:role/benchmark",
+    )
+
+    def create(i):
+        get_delivery_stream_for_s3_destination(stack, f"stream-{i}", config)
+
+    return _throughput(create, count), app
+
+
+def bench_asl_generation(count):
+    """
+    States per second for a definition of count lambda steps behind a map
+    and a parallel state, serialized as the state machine would get it
+    """
+    from pl_x_cdk_utils import step_function_json_utils as sfj
+
+    started = time.perf_counter()
+    states = {}
+    for i in range(count):
+        next_state = f"step-{i + 1}" if i + 1 < count else "done"
+        states[f"step-{i}"] = sfj.get_json_for_lambda(
+            f"arn:aws:lambda:eu-central-1:123456789012:function:fn-{i}",
+            next_state=next_state,
+            catch=sfj.get_catch_state("notify"),
+        )
+    states["done"] = sfj.get_json_for_succeed_state()
+    states["notify"] = sfj.get_json_for_sns(
+        "arn:aws:sns:eu-central-1:123456789012:alerts", next_state="failed"
+    )
+    states["failed"] = sfj.get_json_for_failed_state()
+    definition = {
+        "StartAt": "map",
+        "States": {
+            "map": sfj.get_map_state(
+                {"StartAt": "step-0", "States": states}, next_state="parallel"
+            ),
+            "parallel": sfj.get_parallel_step(
+                branches={"succeed": sfj.get_json_for_succeed_state()}
+            ),
+        },
+    }
+    json.dumps(definition)
+    return count / (time.perf_counter() - started)
+
+
+def run(construct_count, asl_count, import_repeat):
+    results = {}
+
+    def record(name, value, unit, higher_is_better):
+        results[name] = {
+            "value": round(value, 3),
+            "unit": unit,
+            "higher_is_better": higher_is_better,
+        }
+
+    def skip(name, reason):
+        results[name] = {"skipped": reason}
+
+    for module in MODULES:
+        name = f"import.{module}"
+        try:
+            record(name, measure_import(module, import_repeat), "ms", False)
+        except Skipped as e:
+            skip(name, str(e))
+
+    for bench in [
+        bench_deploy_state_machine,
+        bench_implement_lambda_function,
+        bench_create_glue_table,
+        bench_get_delivery_stream_for_s3_destination,
+    ]:
+        name = bench.__name__[len("bench_"):]
+        try:
+            rate, app = bench(construct_count)
+        except Skipped as e:
+            skip(f"construct.{name}", str(e))
+            skip(f"synth.{name}", str(e))
+            continue
+        record(f"construct.{name}", rate, "constructs/s", True)
+        started = time.perf_counter()
+        app.synth()
+        record(f"synth.{name}", (time.perf_counter() - started) * 1000, "ms",
+               False)
+
+    rates = [bench_asl_generation(asl_count) for _ in range(5)]
+    record("asl.step_function_json_utils", statistics.median(rates),
+           "states/s", True)
+    return results
+
+
+def get_platform():
+    """
+    :return: dict
+             Python minor version and machine architecture, the parts of the
+             platform the numbers depend on that stay the same across patch
+             releases and kernel updates
+    """
+    return {
+        "python": "{}.{}".format(*sys.version_info[:2]),
+        "machine": platform.machine(),
+    }
+
+
+def get_platform_mismatch(baseline):
+    """
+    :param baseline: dict
+                     Content of the baseline file
+    :return: string
+             Description of the difference, None when the results can be
+             compared with the baseline
+    """
+    for key, value in get_platform().items():
+        if baseline.get(key) != value:
+            return (
+                f"{key} {value} differs from the baseline's "
+                f"{baseline.get(key)}"
+            )
+    return None
+
+
+def compare(results, baseline):
+    """
+    :param results: dict
+                    Results of run
+    :param baseline: dict
+                     Content of the baseline file
+    :return: tuple
+             Names and changes of the results beyond their threshold, and
+             the names and reasons of the failures without a comparison
+    """
+    regressions = []
+    failures = []
+    for name, base in baseline.get("results", {}).items():
+        if "skipped" in results.get(name, {"skipped": "not run"}):
+            failures.append(
+                (name, f"has a baseline but was skipped: "
+                       f"{results.get(name, {}).get('skipped', 'not run')}")
+            )
+    for name, result in results.items():
+        base = baseline.get("results", {}).get(name)
+        if "skipped" in result:
+            continue
+        if not base or "value" not in base:
+            failures.append((name, "has no baseline"))
+            continue
+        threshold = base.get(
+            "threshold", baseline.get("threshold", DEFAULT_THRESHOLD)
+        )
+        change = (result["value"] - base["value"]) / base["value"]
+        if result["higher_is_better"]:
+            change = -change
+        result["baseline"] = base["value"]
+        result["change"] = round(change, 3)
+        if change > threshold:
+            regressions.append((name, change, threshold))
+    return regressions, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--constructs", type=int, default=50)
+    parser.add_argument("--states", type=int, default=300)
+    parser.add_argument("--import-repeat", type=int, default=5)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--output")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--ignore-platform", action="store_true")
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    results = run(args.constructs, args.states, args.import_repeat)
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    regressions, failures = [], []
+    mismatch = get_platform_mismatch(baseline)
+    if args.update_baseline:
+        pass
+    elif mismatch and not args.ignore_platform:
+        failures = [
+            ("baseline", f"{mismatch}, regenerate it with --update-baseline "
+                         f"or compare anyway with --ignore-platform")
+        ]
+    else:
+        regressions, failures = compare(results, baseline)
+    report = {
+        **get_platform(),
+        "compared": not args.update_baseline
+        and not (mismatch and not args.ignore_platform),
+        "results": results,
+        "regressions": [name for name, _, _ in regressions],
+        "failures": {name: reason for name, reason in failures},
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.update_baseline:
+        thresholds = {
+            name: value["threshold"]
+            for name, value in baseline.get("results", {}).items()
+            if "threshold" in value
+        }
+        new_baseline = {
+            **get_platform(),
+            "threshold": baseline.get("threshold", DEFAULT_THRESHOLD),
+            "results": {},
+        }
+        for name, result in results.items():
+            if "skipped" in result:
+                # keep the old numbers of benchmarks that could not run
+                if name in baseline.get("results", {}):
+                    new_baseline["results"][name] = baseline["results"][name]
+                continue
+            new_baseline["results"][name] = dict(result)
+            if name in thresholds:
+                new_baseline["results"][name]["threshold"] = thresholds[name]
+        with open(args.baseline, "w") as f:
+            json.dump(new_baseline, f, indent=2)
+            f.write("\n")
+
+    for name, change, threshold in regressions:
+        print(
+            f"----- Regression on {name}: {change:.0%} worse than the "
+            f"baseline, threshold {threshold:.0%} -----",
+            file=sys.stderr,
+        )
+    for name, reason in failures:
+        print(f"----- Failure on {name}: {reason} -----", file=sys.stderr)
+    sys.exit(1 if regressions or failures else 0)
+
+
+if __name__ == "__main__":
+    main()
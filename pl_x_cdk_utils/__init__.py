@@ -0,0 +1,36 @@
+import importlib
+
+# Submodules are imported on first access (PEP 562), so that runtime code
+# using boto3_utils does not pay for aws_cdk and jsii on import
+__all__ = [
+        "api_gateway_utils",
+        "autoscaling",
+        "boto3_utils",
+        "ec2_utils",
+        "ecs_utils",
+        "events_utils",
+        "firehose_utils",
+        "glue_utils",
+        "helpers",
+        "iam_utils",
+        "lambda_utils",
+        "logs_utils",
+        "pipelines_utils",
+        "s3_utils",
+        "sns_utils",
+        "ssm_utils",
+        "step_function_json_utils",
+        "stepfunctions_utils",
+        ]
+
+
+def __getattr__(name):
+    if name in __all__:
+        module = importlib.import_module(f"{__name__}.{name}")
+        globals()[name] = module
+        return module
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
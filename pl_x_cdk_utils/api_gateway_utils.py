@@ -3,16 +3,32 @@ from aws_cdk import aws_apigateway as api_gateway
 DEFAULT_THROTTLE = {"rate_limit": 10000, "burst_limit": 1000}
 DEFAULT_QUOTA = {"limit": 100000, "period": api_gateway.Period.DAY}
 DEFAULT_REQUEST_TEMPLATE = {"application/json": '{ "statusCode": "200" }'}
-DEFAULT_CORS = {
-    "allow_origins": api_gateway.Cors.ALL_ORIGINS,
-    "allow_methods": api_gateway.Cors.ALL_METHODS,
-}
 DEFAULT_DEPLOY_OPTIONS = {
     "logging_level": api_gateway.MethodLoggingLevel.INFO,
     "data_trace_enabled": True,
 }
 
 
+def get_default_cors():
+    """
+    Default CORS for APIs and resources, built on call since the Cors
+    constants are read through jsii
+    :return: dict
+             CORS options allowing all origins and methods
+    """
+    return {
+        "allow_origins": api_gateway.Cors.ALL_ORIGINS,
+        "allow_methods": api_gateway.Cors.ALL_METHODS,
+    }
+
+
+def __getattr__(name):
+    # DEFAULT_CORS stays importable without being built on import
+    if name == "DEFAULT_CORS":
+        return get_default_cors()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 def deploy_rest_api(
     construct,
     api_name,
@@ -43,7 +59,7 @@ def deploy_rest_api(
     """
     param_id = id if id else f"profile-for-api-{api_name}"
     description = description if description else f"API for {api_name}"
-    api_cors = api_cors if api_cors else DEFAULT_CORS
+    api_cors = api_cors if api_cors else get_default_cors()
     deploy_options = deploy_options if deploy_options else DEFAULT_DEPLOY_OPTIONS
     api = api_gateway.RestApi(
         construct,
@@ -112,7 +128,7 @@ def add_resource_to_api(api_object, name, root=True, api_cors=None):
     :return: object
             Updated API object after resource
     """
-    api_cors = api_cors if api_cors else DEFAULT_CORS
+    api_cors = api_cors if api_cors else get_default_cors()
     if root:
         updated_api = api_object.root.add_resource(
             name, default_cors_preflight_options=api_cors
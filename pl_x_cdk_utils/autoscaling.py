@@ -1,6 +1,7 @@
-import uuid
 from aws_cdk import aws_autoscaling as autoscaling
 
+from pl_x_cdk_utils.helpers import get_unique_logical_id
+
 
 def get_autoscaling_group(construct, vpc, id=None,
                           auto_scaling_group_name=None, instance_type=None,
@@ -30,7 +31,10 @@ def get_autoscaling_group(construct, vpc, id=None,
     -------
 
     """
-    id = id if id else f"autoscaling-profile-{uuid.uuid4()}"
+    id = id if id else get_unique_logical_id(
+            construct, "autoscaling-profile", vpc, auto_scaling_group_name,
+            instance_type, machine_image, min_capacity, max_capacity
+            )
     group = autoscaling.AutoScalingGroup(
             construct, id=id, vpc=vpc,
             auto_scaling_group_name=auto_scaling_group_name,
@@ -1,9 +1,683 @@
+import bisect
+import collections
+import collections.abc
+import concurrent.futures
+import copy
+import datetime
+import gzip
+import hashlib
+import inspect
+import itertools
 import json
+import mmap
+import os
+import queue
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
 import uuid
 import boto3
+from boto3.s3.transfer import TransferConfig
+import botocore.session
+from botocore.config import Config
+from botocore.credentials import Credentials, RefreshableCredentials
+from botocore.exceptions import ClientError
 
+from pl_x_cdk_utils.helpers import (
+    dynamic_output_path,
+    get_partition_prefixes_for_date_range,
+)
 
-def get_ssm_value(ssm_param, region='eu-central-1', aws_credentials=None):
+DEFAULT_MAX_POOL_CONNECTIONS = 25
+CLIENT_CACHE_MAX_SIZE = 64
+# upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (
+        0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300
+        )
+DEFAULT_RETRY_MODE = 'standard'
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_READ_TIMEOUT = 60
+# Seconds before expiration when cached credentials are assumed again
+CREDENTIALS_EXPIRY_MARGIN = 300
+# Seconds SSM values are served from the in-process cache
+SSM_CACHE_TTL = 300
+SSM_CACHE_MAX_SIZE = 1024
+SSM_GET_PARAMETERS_BATCH_SIZE = 10
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+S3_CACHE_DIR = os.path.join(tempfile.gettempdir(), "pl_x_cdk_utils_s3_cache")
+S3_CACHE_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_MULTIPART_THRESHOLD = 64 * 1024 * 1024
+DEFAULT_MULTIPART_CHUNKSIZE = 64 * 1024 * 1024
+DEFAULT_TRANSFER_CONCURRENCY = 10
+S3_DELETE_BATCH_SIZE = 1000
+THROTTLING_ERROR_CODES = {
+        'Throttling',
+        'ThrottlingException',
+        'ThrottledException',
+        'TooManyRequestsException',
+        'RequestLimitExceeded',
+        'ProvisionedThroughputExceededException',
+        'SlowDown',
+        }
+LAMBDA_SYNC_PAYLOAD_LIMIT = 6 * 1024 * 1024
+LAMBDA_ASYNC_PAYLOAD_LIMIT = 256 * 1024
+# Bytes kept free below the lambda limits for the invocation envelope
+CLAIM_CHECK_HEADROOM = 1024
+CLAIM_CHECK_KEY = "__claim_check__"
+CLAIM_CHECK_PREFIX = "claim-check/"
+GLUE_BATCH_GET_PARTITION_SIZE = 1000
+GLUE_BATCH_CREATE_PARTITION_SIZE = 100
+GLUE_BATCH_GET_CRAWLERS_SIZE = 100
+QUICKSIGHT_RETRY_ERROR_CODES = {
+        'LimitExceededException',
+        'ThrottlingException',
+        'ResourceUnavailableException',
+        }
+
+_session_lock = threading.Lock()
+_shared_session = None
+_client_cache = collections.OrderedDict()
+_thread_local = threading.local()
+_client_settings = {
+        'retry_mode': DEFAULT_RETRY_MODE,
+        'max_attempts': DEFAULT_MAX_ATTEMPTS,
+        'connect_timeout': DEFAULT_CONNECT_TIMEOUT,
+        'read_timeout': DEFAULT_READ_TIMEOUT,
+        'max_pool_connections': DEFAULT_MAX_POOL_CONNECTIONS,
+        }
+# bumped on every configuration change so no stale client is reused
+_client_settings_generation = 0
+_rate_limiters = {}
+_instrumentation_backends = []
+_credentials_lock = threading.RLock()
+_credentials_cache = {}
+_refreshable_credentials_cache = {}
+_s3_cache_lock = threading.Lock()
+
+
+def _get_credentials_fingerprint(aws_credentials):
+    """
+    Stable fingerprint for the credentials used as part of the client key
+    :param aws_credentials: object
+                            AWS credentials object
+    :return: string
+             Hash of the credentials or None for the default chain
+    """
+    if not aws_credentials:
+        return None
+    if isinstance(aws_credentials, Credentials):
+        # refreshable credentials rotate in place, the object is the identity
+        return f"credentials-{id(aws_credentials)}"
+    credentials = aws_credentials['Credentials']
+    raw = "|".join([
+            credentials['AccessKeyId'],
+            credentials['SecretAccessKey'],
+            credentials.get('SessionToken') or ''
+            ])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def _get_credentials_expiry(aws_credentials):
+    """
+    Expiry of assume_role credentials as a timestamp, None when they don't
+    expire or refresh themselves
+    """
+    if not aws_credentials or isinstance(aws_credentials, Credentials):
+        return None
+    expiration = aws_credentials['Credentials'].get('Expiration')
+    if isinstance(expiration, str):
+        try:
+            expiration = datetime.datetime.fromisoformat(expiration)
+        except ValueError:
+            return None
+    if not isinstance(expiration, datetime.datetime):
+        return None
+    if expiration.tzinfo is None:
+        expiration = expiration.replace(tzinfo=datetime.timezone.utc)
+    return expiration.timestamp()
+
+
+def _get_cached_client(cache, key, create, aws_credentials):
+    """
+    Least recently used client cache, the clients of expired credentials
+    are dropped first so rotated assume_role credentials don't pile up
+    """
+    entry = cache.get(key)
+    if entry is not None:
+        cache.move_to_end(key)
+        return entry[0]
+    now = time.time()
+    for expired_key in [
+            cached_key for cached_key, (_, expires_at) in cache.items()
+            if expires_at is not None and expires_at < now
+            ]:
+        del cache[expired_key]
+    client = create()
+    cache[key] = (client, _get_credentials_expiry(aws_credentials))
+    while len(cache) > CLIENT_CACHE_MAX_SIZE:
+        cache.popitem(last=False)
+    return client
+
+
+def _get_session(per_thread=False):
+    """
+    Session used for creating clients, boto3 sessions are not thread-safe
+    so either a shared one guarded by a lock or one per thread is used
+    :param per_thread: bool
+                       Flag to use a session bound to the current thread
+    :return: object
+             boto3 session
+    """
+    global _shared_session
+    if per_thread:
+        session = getattr(_thread_local, 'session', None)
+        if session is None:
+            session = boto3.session.Session()
+            _thread_local.session = session
+        return session
+    if _shared_session is None:
+        _shared_session = boto3.session.Session()
+    return _shared_session
+
+
+def get_boto3_client(
+        service_name, region_name=None, aws_credentials=None,
+        max_pool_connections=None, per_thread=False, config_options=None
+        ):
+    """
+    Get a cached boto3 client, keyed by service, region and credentials.
+    Clients are thread-safe and keep their HTTP connections alive, so reusing
+    them avoids the client creation and TLS handshake on every call. At most
+    CLIENT_CACHE_MAX_SIZE clients are kept, the least recently used and the
+    ones of expired credentials are released first.
+    :param service_name: string
+                         AWS service name, e.g. s3
+    :param region_name: string
+                        AWS region, None for the environment default
+    :param aws_credentials: object
+                            AWS credentials object in case of cross account,
+                            either the assume_role response or the
+                            refreshable credentials
+    :param max_pool_connections: int
+                                 Size of the HTTP connection pool
+    :param per_thread: bool
+                       Flag to create the client from a session bound to the
+                       current thread
+    :param config_options: dict
+                           Additional botocore Config options, e.g.
+                           {"read_timeout": 30}
+    :return: object
+             boto3 client
+    """
+    max_pool_connections = max_pool_connections if max_pool_connections \
+        else _client_settings['max_pool_connections']
+    config_options = config_options if config_options else {}
+    key = (
+            _client_settings_generation, service_name, region_name,
+            _get_credentials_fingerprint(aws_credentials),
+            max_pool_connections,
+            json.dumps(config_options, sort_keys=True, default=str)
+            )
+    if per_thread:
+        cache = getattr(_thread_local, 'clients', None)
+        if cache is None:
+            cache = _thread_local.clients = collections.OrderedDict()
+        return _get_cached_client(
+                cache, key,
+                lambda: _create_client(
+                        _get_session(per_thread=True), service_name,
+                        region_name, aws_credentials, max_pool_connections,
+                        config_options
+                        ),
+                aws_credentials
+                )
+
+    with _session_lock:
+        return _get_cached_client(
+                _client_cache, key,
+                lambda: _create_client(
+                        _get_session(), service_name, region_name,
+                        aws_credentials, max_pool_connections, config_options
+                        ),
+                aws_credentials
+                )
+
+
+def _create_client(
+        session, service_name, region_name, aws_credentials,
+        max_pool_connections, config_options
+        ):
+    config = Config(
+            max_pool_connections=max_pool_connections,
+            tcp_keepalive=True,
+            connect_timeout=_client_settings['connect_timeout'],
+            read_timeout=_client_settings['read_timeout'],
+            retries={
+                    'mode': _client_settings['retry_mode'],
+                    'total_max_attempts': _client_settings['max_attempts']
+                    }
+            ).merge(Config(**config_options))
+    if isinstance(aws_credentials, Credentials):
+        botocore_session = botocore.session.get_session()
+        botocore_session._credentials = aws_credentials
+        client = boto3.session.Session(
+                botocore_session=botocore_session
+                ).client(service_name, region_name=region_name, config=config)
+    elif aws_credentials:
+        client = session.client(
+                service_name, region_name=region_name, config=config,
+                aws_access_key_id=aws_credentials['Credentials'][
+                    'AccessKeyId'],
+                aws_secret_access_key=aws_credentials['Credentials'][
+                    'SecretAccessKey'],
+                aws_session_token=aws_credentials['Credentials'].get(
+                    'SessionToken')
+                )
+    else:
+        client = session.client(
+                service_name, region_name=region_name, config=config
+                )
+
+    def rate_limit(**kwargs):
+        limiter = _rate_limiters.get(service_name)
+        if limiter is not None:
+            limiter.acquire()
+
+    # before-send runs once per HTTP attempt, so retries take tokens too,
+    # and first so no other handler answers the request before it
+    client.meta.events.register_first('before-send', rate_limit)
+    client.meta.events.register('before-call', _start_instrumentation)
+    client.meta.events.register('after-call', _record_instrumentation)
+    client.meta.events.register(
+            'after-call-error', _record_instrumentation_error
+            )
+    return client
+
+
+def configure_boto3_clients(
+        retry_mode=None, max_attempts=None, connect_timeout=None,
+        read_timeout=None, max_pool_connections=None, rate_limits=None
+        ):
+    """
+    Configure every client created by get_boto3_client, and so every helper
+    of this module. Only the given settings are changed, the clients created
+    before are not reused afterwards.
+    :param retry_mode: string
+                       botocore retry mode, adaptive or standard
+    :param max_attempts: int
+                         Total number of attempts per call, retries included
+    :param connect_timeout: int
+                            Seconds to wait for a connection
+    :param read_timeout: int
+                         Seconds to wait for a response
+    :param max_pool_connections: int
+                                 Default size of the HTTP connection pools
+    :param rate_limits: dict
+                        Client-side calls per second by service name, e.g.
+                        {"glue": 10}, or (rate, burst) tuples, None as value
+                        removes the limit of the service. Every HTTP
+                        attempt takes a token, retries included
+    :return: dict
+             The resulting settings
+    """
+    global _client_settings_generation
+    settings = {
+            'retry_mode': retry_mode,
+            'max_attempts': max_attempts,
+            'connect_timeout': connect_timeout,
+            'read_timeout': read_timeout,
+            'max_pool_connections': max_pool_connections
+            }
+    with _session_lock:
+        _client_settings.update({
+                name: value for name, value in settings.items()
+                if value is not None
+                })
+        _client_settings_generation += 1
+        _client_cache.clear()
+    for service_name, limit in (rate_limits or {}).items():
+        if limit is None:
+            _rate_limiters.pop(service_name, None)
+        elif isinstance(limit, (tuple, list)):
+            _rate_limiters[service_name] = _RateLimiter(*limit)
+        else:
+            _rate_limiters[service_name] = _RateLimiter(limit)
+
+    return dict(_client_settings)
+
+
+def _get_body_size(body):
+    if isinstance(body, (bytes, bytearray)):
+        return len(body)
+    if isinstance(body, str):
+        return len(body.encode('utf-8'))
+    if isinstance(body, dict):
+        # form encoded bodies of query protocol services
+        return len(urllib.parse.urlencode(body, doseq=True))
+    if hasattr(body, 'seek') and hasattr(body, 'tell'):
+        # file like bodies are measured without being read
+        try:
+            position = body.tell()
+            size = body.seek(0, os.SEEK_END) - position
+            body.seek(position)
+            return size
+        except (OSError, ValueError):
+            return None
+    return None
+
+
+def _start_instrumentation(params=None, context=None, **kwargs):
+    if not _instrumentation_backends or context is None:
+        return
+    request_bytes = None
+    if params:
+        content_length = params.get('headers', {}).get('Content-Length')
+        request_bytes = int(content_length) if content_length \
+            else _get_body_size(params.get('body'))
+    context['instrumentation'] = (time.perf_counter(), request_bytes)
+
+
+def _emit_instrumentation(context, model, record):
+    started, request_bytes = context.pop('instrumentation')
+    record.update({
+            'Service': model.service_model.service_name if model else None,
+            'Operation': model.name if model else None,
+            'Latency': time.perf_counter() - started,
+            'RequestBytes': request_bytes,
+            })
+    for backend in list(_instrumentation_backends):
+        try:
+            backend(record)
+        except Exception as e:
+            print(f"----- Error on instrumentation backend. Error: {e} -----")
+
+
+def _record_instrumentation(
+        http_response=None, parsed=None, model=None, context=None, **kwargs
+        ):
+    if context is None or 'instrumentation' not in context:
+        return
+    metadata = (parsed or {}).get('ResponseMetadata', {})
+    content_length = http_response.headers.get('Content-Length') \
+        if http_response is not None else None
+    _emit_instrumentation(context, model, {
+            'Retries': metadata.get('RetryAttempts', 0),
+            'ResponseBytes': int(content_length) if content_length else None,
+            'StatusCode': http_response.status_code
+            if http_response is not None else None,
+            'Error': (parsed or {}).get('Error', {}).get('Code'),
+            })
+
+
+def _record_instrumentation_error(exception=None, context=None, **kwargs):
+    if context is None or 'instrumentation' not in context:
+        return
+    _emit_instrumentation(context, None, {
+            'Retries': None,
+            'ResponseBytes': None,
+            'StatusCode': None,
+            'Error': type(exception).__name__,
+            })
+
+
+def add_instrumentation_backend(backend):
+    """
+    Record every AWS call made through get_boto3_client, and so every helper
+    of this module. Without backends the hooks return right away.
+    :param backend: callable
+                    Called with a dict holding Service, Operation, Latency in
+                    seconds, Retries, RequestBytes, ResponseBytes, StatusCode
+                    and Error of every call, e.g. an InMemoryMetrics or
+                    EmbeddedMetricsLogger instance or any function
+    :return: callable
+             The backend, to remove it later
+    """
+    _instrumentation_backends.append(backend)
+    return backend
+
+
+def remove_instrumentation_backend(backend=None):
+    """
+    :param backend: callable
+                    Backend to remove, None to remove all of them
+    :return:
+    """
+    if backend is None:
+        _instrumentation_backends.clear()
+    elif backend in _instrumentation_backends:
+        _instrumentation_backends.remove(backend)
+
+
+class InMemoryMetrics:
+    """
+    Instrumentation backend keeping, per service and operation, running
+    counters and a latency histogram with fixed buckets, so its memory
+    doesn't grow with the number of calls. summary() gives the counts,
+    bytes and latency percentiles, estimated as the upper bound of the
+    bucket they fall in.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, record):
+        key = (record['Service'], record['Operation'])
+        latency = record['Latency']
+        with self._lock:
+            metrics = self._metrics.get(key)
+            if metrics is None:
+                metrics = self._metrics[key] = {
+                        'Count': 0,
+                        'Errors': 0,
+                        'Retries': 0,
+                        'RequestBytes': 0,
+                        'ResponseBytes': 0,
+                        'TotalLatency': 0.0,
+                        'Min': latency,
+                        'Max': latency,
+                        # one count per bucket and one for slower calls
+                        'Histogram': [0] * (len(self.buckets) + 1)
+                        }
+            metrics['Count'] += 1
+            metrics['Errors'] += 1 if record['Error'] else 0
+            metrics['Retries'] += record['Retries'] or 0
+            metrics['RequestBytes'] += record['RequestBytes'] or 0
+            metrics['ResponseBytes'] += record['ResponseBytes'] or 0
+            metrics['TotalLatency'] += latency
+            metrics['Min'] = min(metrics['Min'], latency)
+            metrics['Max'] = max(metrics['Max'], latency)
+            metrics['Histogram'][
+                    bisect.bisect_left(self.buckets, latency)
+                    ] += 1
+
+    def _percentile(self, metrics, value):
+        rank = value / 100 * metrics['Count']
+        seen = 0
+        for bound, count in zip(self.buckets, metrics['Histogram']):
+            seen += count
+            if seen >= rank:
+                return min(bound, metrics['Max'])
+        return metrics['Max']
+
+    def summary(self):
+        with self._lock:
+            metrics_by_key = {
+                    key: dict(metrics, Histogram=list(metrics['Histogram']))
+                    for key, metrics in self._metrics.items()
+                    }
+        summary = {}
+        for (service, operation), metrics in metrics_by_key.items():
+            stats = dict(metrics)
+            stats['Mean'] = metrics['TotalLatency'] / metrics['Count']
+            for value in (50, 90, 99):
+                stats[f"P{value}"] = self._percentile(metrics, value)
+            stats['Histogram'] = {
+                    bound: count for bound, count in zip(
+                            self.buckets + (float('inf'),),
+                            metrics['Histogram']
+                            )
+                    }
+            summary[f"{service}.{operation}"] = stats
+        return summary
+
+    def clear(self):
+        with self._lock:
+            self._metrics.clear()
+
+
+class EmbeddedMetricsLogger:
+    """
+    Instrumentation backend printing every call as a CloudWatch Embedded
+    Metric Format line, which lambda turns into metrics from its logs
+    """
+
+    def __init__(self, namespace="pl_x_cdk_utils", stream=None):
+        self.namespace = namespace
+        self.stream = stream
+
+    def __call__(self, record):
+        line = {
+                '_aws': {
+                        'Timestamp': int(time.time() * 1000),
+                        'CloudWatchMetrics': [{
+                                'Namespace': self.namespace,
+                                'Dimensions': [['Service', 'Operation']],
+                                'Metrics': [
+                                        {'Name': 'Latency',
+                                         'Unit': 'Milliseconds'},
+                                        {'Name': 'Retries', 'Unit': 'Count'},
+                                        {'Name': 'RequestBytes',
+                                         'Unit': 'Bytes'},
+                                        {'Name': 'ResponseBytes',
+                                         'Unit': 'Bytes'},
+                                        ]
+                                }]
+                        },
+                'Service': record['Service'] or 'unknown',
+                'Operation': record['Operation'] or 'unknown',
+                'Latency': record['Latency'] * 1000,
+                'Retries': record['Retries'] or 0,
+                'RequestBytes': record['RequestBytes'] or 0,
+                'ResponseBytes': record['ResponseBytes'] or 0,
+                'StatusCode': record['StatusCode'],
+                'Error': record['Error']
+                }
+        print(json.dumps(line), file=self.stream or sys.stdout, flush=True)
+
+
+def clear_boto3_client_cache():
+    """
+    Drop all cached clients, per-thread clients are only dropped for the
+    calling thread
+    :return:
+    """
+    global _shared_session
+    with _session_lock:
+        _client_cache.clear()
+        _shared_session = None
+    with _credentials_lock:
+        _credentials_cache.clear()
+        _refreshable_credentials_cache.clear()
+    _thread_local.__dict__.clear()
+
+
+class _TTLCache:
+    """
+    Thread-safe in-process cache with a time to live per entry and least
+    recently used eviction once max_size is reached
+    """
+
+    def __init__(self, ttl, max_size):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def configure(self, ttl=None, max_size=None):
+        with self._lock:
+            if ttl is not None:
+                # entries already cached keep their expiry
+                self.ttl = ttl
+            if max_size is not None:
+                self.max_size = max_size
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class _RateLimiter:
+    """
+    Thread-safe token bucket allowing rate calls per second on average with
+    bursts of up to burst calls
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst if burst else max(1.0, rate))
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                        self.burst,
+                        self._tokens + (now - self._updated) * self.rate
+                        )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+_ssm_cache = _TTLCache(ttl=SSM_CACHE_TTL, max_size=SSM_CACHE_MAX_SIZE)
+
+
+def _ssm_cache_key(name, region, aws_credentials, with_decryption):
+    return (
+            name, region, _get_credentials_fingerprint(aws_credentials),
+            with_decryption
+            )
+
+
+def get_ssm_value(
+        ssm_param, region='eu-central-1', aws_credentials=None,
+        with_decryption=False, use_cache=True
+        ):
     """
     :param ssm_param: string
                       Name for the parameter we want to retrieve
@@ -11,27 +685,162 @@ def get_ssm_value(ssm_param, region='eu-central-1', aws_credentials=None):
                    AWS region
     :param aws_credentials: object
                             AWS credentials
+    :param with_decryption: bool
+                            Flag to decrypt SecureString parameters
+    :param use_cache: bool
+                      Flag to serve the value from the in-process cache
     :return: string
              Value for the SSM
     """
-    if aws_credentials:
-        access_key = aws_credentials['Credentials']['AccessKeyId']
-        secret_key = aws_credentials['Credentials']['SecretAccessKey']
-        session_token = aws_credentials['Credentials']['SessionToken']
-        ssm_client = boto3.client(
-            'ssm', aws_access_key_id=access_key,
-            aws_secret_access_key=secret_key,
-            aws_session_token=session_token,
-            region_name=region
+    key = _ssm_cache_key(ssm_param, region, aws_credentials, with_decryption)
+    if use_cache:
+        value = _ssm_cache.get(key)
+        if value is not None:
+            return value
+
+    ssm_client = get_boto3_client(
+            'ssm', region_name=region,
+            aws_credentials=aws_credentials
             )
-    else:
-        ssm_client = boto3.client('ssm', region_name=region)
     target_val = ssm_client.get_parameter(
             Name=ssm_param,
-            WithDecryption=False
+            WithDecryption=with_decryption
+            )
+
+    value = target_val["Parameter"]["Value"]
+    _ssm_cache.set(key, value)
+    return value
+
+
+def get_ssm_values(
+        ssm_params, region='eu-central-1', aws_credentials=None,
+        with_decryption=False, use_cache=True
+        ):
+    """
+    Get many SSM parameters at once, in chunks of 10 per get_parameters call,
+    serving the already cached ones without any call
+    :param ssm_params: list
+                       Names for the parameters we want to retrieve
+    :param region: string
+                   AWS region
+    :param aws_credentials: object
+                            AWS credentials
+    :param with_decryption: bool
+                            Flag to decrypt SecureString parameters
+    :param use_cache: bool
+                      Flag to serve the values from the in-process cache
+    :return: dict
+             Values by parameter name, parameters not found are left out
+    """
+    values = {}
+    missing = []
+    for name in dict.fromkeys(ssm_params):
+        value = _ssm_cache.get(
+                _ssm_cache_key(name, region, aws_credentials, with_decryption)
+                ) if use_cache else None
+        if value is None:
+            missing.append(name)
+        else:
+            values[name] = value
+    if not missing:
+        return values
+
+    ssm_client = get_boto3_client(
+            'ssm', region_name=region,
+            aws_credentials=aws_credentials
+            )
+    for i in range(0, len(missing), SSM_GET_PARAMETERS_BATCH_SIZE):
+        response = ssm_client.get_parameters(
+                Names=missing[i:i + SSM_GET_PARAMETERS_BATCH_SIZE],
+                WithDecryption=with_decryption
+                )
+        for parameter in response["Parameters"]:
+            values[parameter["Name"]] = parameter["Value"]
+            _ssm_cache.set(
+                    _ssm_cache_key(
+                            parameter["Name"], region, aws_credentials,
+                            with_decryption
+                            ),
+                    parameter["Value"]
+                    )
+
+    return values
+
+
+def get_ssm_values_by_path(
+        path, recursive=True, region='eu-central-1', aws_credentials=None,
+        with_decryption=False, use_cache=True
+        ):
+    """
+    Get all the SSM parameters under a path, following every page
+    :param path: string
+                 Hierarchy path of the parameters, e.g. /app/prod/
+    :param recursive: bool
+                      Flag to include the parameters of nested paths
+    :param region: string
+                   AWS region
+    :param aws_credentials: object
+                            AWS credentials
+    :param with_decryption: bool
+                            Flag to decrypt SecureString parameters
+    :param use_cache: bool
+                      Flag to serve the values from the in-process cache
+    :return: dict
+             Values by parameter name
+    """
+    key = _ssm_cache_key(
+            ("path", path, recursive), region, aws_credentials,
+            with_decryption
             )
+    if use_cache:
+        values = _ssm_cache.get(key)
+        if values is not None:
+            return dict(values)
+
+    ssm_client = get_boto3_client(
+            'ssm', region_name=region,
+            aws_credentials=aws_credentials
+            )
+    values = {}
+    for page in ssm_client.get_paginator('get_parameters_by_path').paginate(
+            Path=path, Recursive=recursive, WithDecryption=with_decryption
+            ):
+        for parameter in page["Parameters"]:
+            values[parameter["Name"]] = parameter["Value"]
+            _ssm_cache.set(
+                    _ssm_cache_key(
+                            parameter["Name"], region, aws_credentials,
+                            with_decryption
+                            ),
+                    parameter["Value"]
+                    )
+    _ssm_cache.set(key, values)
+
+    return dict(values)
+
+
+def configure_ssm_cache(ttl=None, max_size=None):
+    """
+    Configure the in-process SSM cache, only the given settings are changed
+    :param ttl: int
+                Seconds a value is served from the cache, for the values
+                cached from now on
+    :param max_size: int
+                     Maximum number of cached values, the least recently
+                     used ones are dropped first
+    :return: dict
+             The resulting settings
+    """
+    _ssm_cache.configure(ttl=ttl, max_size=max_size)
+    return {'ttl': _ssm_cache.ttl, 'max_size': _ssm_cache.max_size}
 
-    return target_val["Parameter"]["Value"]
+
+def clear_ssm_cache():
+    """
+    Drop all the cached SSM values
+    :return:
+    """
+    _ssm_cache.clear()
 
 
 def trigger_glue_crawler(
@@ -39,77 +848,1719 @@ def trigger_glue_crawler(
         region_name='eu-central-1'
         ):
     """
-    :param gc_name: string
-                    Glue-Crawler name
-    :param aws_credentials: dict
-                            AWS credentials object in case of cross account
+    :param gc_name: string
+                    Glue-Crawler name
+    :param aws_credentials: dict
+                            AWS credentials object in case of cross account
+    :param region_name: string
+                        AWS region
+    :return: object
+            Response from boto3 client
+    """
+    client = get_boto3_client(
+            'glue', region_name=region_name,
+            aws_credentials=aws_credentials
+            )
+
+    resp = client.start_crawler(Name=gc_name)
+
+    return resp
+
+
+def trigger_glue_crawlers(
+        crawler_names, max_workers=4, wait=False, timeout=3600,
+        poll_interval=5, max_poll_interval=60, aws_credentials=None,
+        region_name='eu-central-1'
+        ):
+    """
+    Start many Glue crawlers under a concurrency cap. A crawler which is
+    already running is coalesced with the running crawl instead of failing,
+    throttled calls are retried with backoff by the client's retry mode.
+    :param crawler_names: list
+                          Glue-Crawler names
+    :param max_workers: int
+                        Maximum number of concurrent start calls
+    :param wait: bool
+                 Flag to wait until every crawler is done
+    :param timeout: int
+                    Seconds to wait for the crawlers at most
+    :param poll_interval: int
+                          Seconds between the first status polls, growing
+                          while the crawlers keep running
+    :param max_poll_interval: int
+                              Upper bound for the seconds between polls
+    :param aws_credentials: dict
+                            AWS credentials object in case of cross account
+    :param region_name: string
+                        AWS region
+    :return: dict
+             Per crawler name, the Status (STARTED, COALESCED, FAILED, or
+             when waiting the state of the last crawl, e.g. SUCCEEDED, or
+             TIMEOUT), the Error if any, and the Duration in seconds from
+             the trigger until the crawler was seen done
+    """
+    client = get_boto3_client(
+            'glue', region_name=region_name, aws_credentials=aws_credentials,
+            max_pool_connections=max(max_workers, DEFAULT_MAX_POOL_CONNECTIONS)
+            )
+    crawler_names = list(dict.fromkeys(crawler_names))
+    started_at = {}
+
+    def start(name):
+        started_at[name] = datetime.datetime.now(datetime.timezone.utc)
+        try:
+            client.start_crawler(Name=name)
+            return {'Status': 'STARTED', 'Error': None, 'Duration': None}
+        except ClientError as e:
+            if e.response['Error'].get('Code') == 'CrawlerRunningException':
+                return {'Status': 'COALESCED', 'Error': None, 'Duration': None}
+            return {'Status': 'FAILED', 'Error': e, 'Duration': None}
+        except Exception as e:
+            # e.g. connection errors, reported without losing the others
+            return {'Status': 'FAILED', 'Error': e, 'Duration': None}
+
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers
+            ) as executor:
+        report = dict(zip(crawler_names, executor.map(start, crawler_names)))
+    if not wait:
+        return report
+
+    waiting = {
+            name for name, result in report.items()
+            if result['Status'] != 'FAILED'
+            }
+    seen_running = set()
+    delay = poll_interval
+    deadline = time.monotonic() + timeout
+    while waiting:
+        for names in _chunks(sorted(waiting), GLUE_BATCH_GET_CRAWLERS_SIZE):
+            response = client.batch_get_crawlers(CrawlerNames=names)
+            for crawler in response['Crawlers']:
+                name = crawler['Name']
+                if crawler['State'] != 'READY':
+                    seen_running.add(name)
+                    continue
+                last_crawl = crawler.get('LastCrawl', {})
+                crawl_start = last_crawl.get('StartTime')
+                coalesced = report[name]['Status'] == 'COALESCED'
+                if name not in seen_running and not coalesced and not (
+                        crawl_start and crawl_start >= started_at[name]
+                        ):
+                    # the crawl may not have left READY yet, a coalesced
+                    # crawl was running already and READY means it's done
+                    continue
+                waiting.discard(name)
+                report[name]['Status'] = last_crawl.get('Status', 'UNKNOWN')
+                report[name]['Duration'] = (
+                        datetime.datetime.now(datetime.timezone.utc)
+                        - started_at[name]
+                        ).total_seconds()
+                if last_crawl.get('ErrorMessage'):
+                    report[name]['Error'] = last_crawl['ErrorMessage']
+        if not waiting:
+            break
+        if time.monotonic() + delay > deadline:
+            for name in waiting:
+                report[name]['Status'] = 'TIMEOUT'
+            break
+        time.sleep(delay)
+        delay = min(delay * 1.5, max_poll_interval)
+
+    return report
+
+
+def _compile_partition_template(template):
+    """
+    Regex for a partition path template with {name} placeholders, e.g.
+    "year={year}/month={month}/{day}_rand={rand}", matching up to a folder
+    """
+    pattern = []
+    position = 0
+    for match in re.finditer(r"\{(\w+)\}", template):
+        pattern.append(re.escape(template[position:match.start()]))
+        pattern.append(f"(?P<{match.group(1)}>[^/]+)")
+        position = match.end()
+    pattern.append(re.escape(template[position:]))
+    return re.compile("".join(pattern) + "(?=/)")
+
+
+def _get_partition_from_key(key, partition_keys, template_regex):
+    """
+    Partition values and location prefix of an object key, None when the
+    key doesn't carry a value for every partition key
+    """
+    if template_regex:
+        match = template_regex.search(key)
+        if not match:
+            return None
+        found = match.groupdict()
+        location = key[:match.end()]
+    else:
+        # hive style, name=value folders
+        found = {}
+        location = None
+        folders = key.split("/")[:-1]
+        for i, folder in enumerate(folders):
+            name, separator, value = folder.partition("=")
+            if separator and name in partition_keys:
+                found[name] = value
+                location = "/".join(folders[:i + 1])
+    if any(name not in found for name in partition_keys):
+        return None
+    return tuple(found[name] for name in partition_keys), location
+
+
+def register_glue_partitions(
+        database_name, table_name, bucket_name, keys, template=None,
+        max_workers=8, max_retries=5, region_name='eu-central-1',
+        aws_credentials=None
+        ):
+    """
+    Register the partitions of newly written objects directly in the Glue
+    table, as a fast alternative to running a crawler. Partition values are
+    derived from the keys, the ones missing in the table are created with
+    the storage descriptor of the table, in concurrent batches of 100.
+    Unprocessed lookups and throttled creations are retried with backoff.
+    :param database_name: string
+                          Glue database name
+    :param table_name: string
+                       Glue table name
+    :param bucket_name: string
+                        Bucket of the objects
+    :param keys: iterable
+                 Object keys, or object dicts from iterate_s3_objects
+    :param template: string
+                     Partition path template with a {name} placeholder per
+                     partition key, e.g. "year={year}/month={month}/{day}_"
+                     "rand={rand}" for firehose output, None for hive style
+                     name=value folders
+    :param max_workers: int
+                        Maximum number of concurrent Glue calls
+    :param max_retries: int
+                        Number of retries of unprocessed lookups and
+                        throttled creations
+    :param region_name: string
+                        AWS region
+    :param aws_credentials: object
+                            AWS credentials object in case of cross account
+    :return: dict
+             Partition values created, already existing, in conflict (the
+             same values found in different folders, e.g. the random suffix
+             of firehose folders, which can't be registered), the keys
+             skipped for lacking partition values, and the Errors from Glue,
+             including the partitions still unprocessed after the retries
+             with the UnprocessedKeys error code
+    """
+    client = get_boto3_client(
+            'glue', region_name=region_name, aws_credentials=aws_credentials
+            )
+    table = client.get_table(
+            DatabaseName=database_name, Name=table_name
+            )['Table']
+    partition_keys = [key['Name'] for key in table['PartitionKeys']]
+    template_regex = _compile_partition_template(template) if template \
+        else None
+
+    locations = {}
+    skipped = []
+    conflicts = set()
+    for key in keys:
+        key = key['Key'] if isinstance(key, dict) else key
+        partition = _get_partition_from_key(key, partition_keys, template_regex)
+        if partition is None:
+            skipped.append(key)
+            continue
+        values, location = partition
+        if locations.setdefault(values, location) != location:
+            # one partition can only point to a single folder
+            conflicts.add(values)
+    candidates = [values for values in locations if values not in conflicts]
+
+    def get_existing(values_batch):
+        found = []
+        to_get = [{'Values': list(values)} for values in values_batch]
+        attempt = 0
+        while True:
+            response = client.batch_get_partition(
+                    DatabaseName=database_name, TableName=table_name,
+                    PartitionsToGet=to_get
+                    )
+            found.extend(tuple(partition['Values'])
+                         for partition in response['Partitions'])
+            to_get = response.get('UnprocessedKeys', [])
+            if not to_get or attempt >= max_retries:
+                break
+            time.sleep(_backoff_delay(attempt))
+            attempt += 1
+        return found, [tuple(values['Values']) for values in to_get]
+
+    def create(values_batch):
+        errors = []
+        attempt = 0
+        while True:
+            partition_inputs = []
+            for values in values_batch:
+                storage_descriptor = copy.deepcopy(table['StorageDescriptor'])
+                storage_descriptor['Location'] = \
+                    f"s3://{bucket_name}/{locations[values]}/"
+                partition_inputs.append({
+                        'Values': list(values),
+                        'StorageDescriptor': storage_descriptor
+                        })
+            response = client.batch_create_partition(
+                    DatabaseName=database_name, TableName=table_name,
+                    PartitionInputList=partition_inputs
+                    )
+            throttled = []
+            for error in response.get('Errors', []):
+                if error['ErrorDetail'].get('ErrorCode') \
+                        in THROTTLING_ERROR_CODES and attempt < max_retries:
+                    throttled.append(tuple(error['PartitionValues']))
+                else:
+                    errors.append(error)
+            if not throttled:
+                return errors
+            values_batch = throttled
+            time.sleep(_backoff_delay(attempt))
+            attempt += 1
+
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers
+            ) as executor:
+        existing = set()
+        unprocessed = set()
+        for found, not_processed in executor.map(
+                get_existing,
+                _chunks(candidates, GLUE_BATCH_GET_PARTITION_SIZE)
+                ):
+            existing.update(found)
+            unprocessed.update(not_processed)
+        # unknown whether the unprocessed ones exist, they aren't created
+        missing = [
+                values for values in candidates
+                if values not in existing and values not in unprocessed
+                ]
+        errors = [
+                {
+                        'PartitionValues': list(values),
+                        'ErrorDetail': {
+                                'ErrorCode': 'UnprocessedKeys',
+                                'ErrorMessage': 'Partition lookup still '
+                                                'unprocessed after retries'
+                                }
+                        }
+                for values in candidates if values in unprocessed
+                ]
+        for batch_errors in executor.map(
+                create, _chunks(missing, GLUE_BATCH_CREATE_PARTITION_SIZE)
+                ):
+            for error in batch_errors:
+                if error['ErrorDetail'].get('ErrorCode') \
+                        == 'AlreadyExistsException':
+                    # created concurrently since the lookup
+                    existing.add(tuple(error['PartitionValues']))
+                else:
+                    errors.append(error)
+
+    failed = {tuple(error['PartitionValues']) for error in errors}
+    return {
+            'created': [
+                    values for values in missing
+                    if values not in failed and values not in existing
+                    ],
+            'existing': [values for values in candidates if values in existing],
+            'conflicts': sorted(conflicts),
+            'skipped': skipped,
+            'Errors': errors
+            }
+
+
+def _chunks(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def invoke_lambda(
+        lambda_func, payload=None, invocation_type="RequestResponse",
+        region_name=None, aws_credentials=None, claim_check_bucket=None,
+        claim_check_prefix=CLAIM_CHECK_PREFIX
+        ):
+    """
+    Invoke lambda function
+    :param lambda_func: string
+                         Name for the lambda function
+    :param payload: dict
+                    Payload i.e. event for lambda
+    :param invocation_type: string
+                            RequestResponse, or Event for fire-and-forget
+    :param region_name: string
+                        AWS region
+    :param aws_credentials: object
+                            AWS credentials object in case of cross account
+    :param claim_check_bucket: string
+                               Bucket to offload payloads over the lambda
+                               limit to, and to resolve offloaded responses
+                               from, None to disable it, see
+                               offload_payload_to_s3 for the lifecycle rule
+                               it needs
+    :param claim_check_prefix: string
+                               Path for the offloaded payloads
+    :return: object
+            Response from boto3 client, None for Event invocations
+    """
+    boto_conn = get_boto3_client(
+            "lambda", region_name=region_name, aws_credentials=aws_credentials
+            )
+    return _invoke_lambda_once(
+            boto_conn, lambda_func, payload if payload is not None else {},
+            invocation_type, raise_function_error=False,
+            claim_check=_get_claim_check_options(
+                    claim_check_bucket, claim_check_prefix, region_name,
+                    aws_credentials
+                    )
+            )
+
+
+class LambdaFunctionError(Exception):
+    """
+    Raised when the invoked lambda function itself failed
+    """
+
+    def __init__(self, lambda_func, function_error, payload):
+        super().__init__(
+                f"Lambda {lambda_func} failed with {function_error}: "
+                f"{payload}"
+                )
+        self.function_error = function_error
+        self.payload = payload
+
+
+def _get_claim_check_options(
+        bucket_name, prefix, region_name, aws_credentials
+        ):
+    if not bucket_name:
+        return None
+    return {
+            'bucket_name': bucket_name,
+            'prefix': prefix,
+            'region_name': region_name,
+            'aws_credentials': aws_credentials
+            }
+
+
+def _invoke_lambda_once(
+        client, lambda_func, payload, invocation_type,
+        raise_function_error=True, claim_check=None
+        ):
+    body = json.dumps(payload)
+    offloaded = None
+    if claim_check:
+        limit = LAMBDA_SYNC_PAYLOAD_LIMIT \
+            if invocation_type == "RequestResponse" \
+            else LAMBDA_ASYNC_PAYLOAD_LIMIT
+        pointer = offload_payload_to_s3(
+                payload, threshold=limit - CLAIM_CHECK_HEADROOM,
+                serialized=body, **claim_check
+                )
+        if pointer is not payload:
+            offloaded = pointer
+            body = json.dumps(pointer)
+    try:
+        resp = client.invoke(
+                FunctionName=lambda_func,
+                InvocationType=invocation_type,
+                Payload=body
+                )
+    finally:
+        # an Event invocation reads the payload later, maybe more than once,
+        # it is left to the lifecycle rule of the prefix
+        if offloaded and invocation_type == "RequestResponse":
+            delete_claim_check(
+                    offloaded, region_name=claim_check['region_name'],
+                    aws_credentials=claim_check['aws_credentials']
+                    )
+    if invocation_type != "RequestResponse":
+        return None
+    out = json.loads(resp["Payload"].read())
+    if raise_function_error and "FunctionError" in resp:
+        raise LambdaFunctionError(lambda_func, resp["FunctionError"], out)
+    if claim_check:
+        out = resolve_claim_check(
+                out, delete=True, region_name=claim_check['region_name'],
+                aws_credentials=claim_check['aws_credentials']
+                )
+    return out
+
+
+def offload_payload_to_s3(
+        payload, bucket_name, prefix=CLAIM_CHECK_PREFIX,
+        threshold=LAMBDA_ASYNC_PAYLOAD_LIMIT - CLAIM_CHECK_HEADROOM,
+        serialized=None, region_name=None, aws_credentials=None
+        ):
+    """
+    Claim-check a payload: when its JSON is over the threshold it is written
+    to s3 and replaced by a small pointer which resolve_claim_check turns
+    back into the payload. Used on both sides, for lambda events and for
+    lambda responses. invoke_lambda deletes the objects of RequestResponse
+    calls and of the responses it resolved, the events of Event calls may
+    be read again by lambda retries and are kept, so the bucket needs a
+    lifecycle rule expiring the prefix, e.g. after a day, for them and for
+    the objects of failed handlers.
+    :param payload: object
+                    JSON serializable payload
+    :param bucket_name: string
+                        Bucket to offload the payload to
+    :param prefix: string
+                   Path for the offloaded payloads
+    :param threshold: int
+                      Size in bytes from which the payload is offloaded
+    :param serialized: string
+                       Already serialized JSON of the payload
+    :param region_name: string
+                        AWS region
+    :param aws_credentials: object
+                            AWS credentials object in case of cross account
+    :return: object
+             The payload itself, or the pointer to it
+    """
+    body = serialized if serialized is not None else json.dumps(payload)
+    if len(body.encode('utf-8')) <= threshold:
+        return payload
+
+    key = f"{prefix.rstrip('/')}/{uuid.uuid4()}.json" if prefix \
+        else f"{uuid.uuid4()}.json"
+    s3_client = get_boto3_client(
+            "s3", region_name=region_name, aws_credentials=aws_credentials
+            )
+    s3_client.put_object(
+            Bucket=bucket_name, Key=key, Body=body.encode('utf-8'),
+            ContentType="application/json"
+            )
+    return {CLAIM_CHECK_KEY: {'Bucket': bucket_name, 'Key': key}}
+
+
+def is_claim_check(payload):
+    """
+    :param payload: object
+                    Lambda event or response
+    :return: bool
+             True if the payload is a claim-check pointer
+    """
+    return isinstance(payload, dict) and list(payload) == [CLAIM_CHECK_KEY]
+
+
+def resolve_claim_check(
+        payload, lazy=False, delete=False, region_name=None,
+        aws_credentials=None
+        ):
+    """
+    Turn a claim-check pointer back into the offloaded payload, e.g. on the
+    handler side: event = resolve_claim_check(event). Other payloads are
+    returned unchanged.
+    :param payload: object
+                    Lambda event or response
+    :param lazy: bool
+                 Flag to return a mapping which reads the payload from s3
+                 only on first access, for payloads which are JSON objects
+    :param delete: bool
+                   Flag to delete the object once it is read, for payloads
+                   read only once, e.g. not for the events of Event
+                   invocations, which lambda retries
+    :param region_name: string
+                        AWS region
+    :param aws_credentials: object
+                            AWS credentials object in case of cross account
+    :return: object
+             The resolved payload
+    """
+    if not is_claim_check(payload):
+        return payload
+    pointer = payload[CLAIM_CHECK_KEY]
+
+    def load():
+        s3_client = get_boto3_client(
+                "s3", region_name=region_name,
+                aws_credentials=aws_credentials
+                )
+        response = s3_client.get_object(
+                Bucket=pointer['Bucket'], Key=pointer['Key']
+                )
+        loaded = json.loads(response['Body'].read())
+        if delete:
+            delete_claim_check(
+                    payload, region_name=region_name,
+                    aws_credentials=aws_credentials
+                    )
+        return loaded
+
+    if lazy:
+        return _LazyPayload(load)
+    return load()
+
+
+def delete_claim_check(payload, region_name=None, aws_credentials=None):
+    """
+    Delete the object a claim-check pointer refers to, other payloads are
+    ignored
+    :param payload: object
+                    Lambda event or response
+    :param region_name: string
+                        AWS region
+    :param aws_credentials: object
+                            AWS credentials object in case of cross account
+    :return:
+    """
+    if not is_claim_check(payload):
+        return
+    pointer = payload[CLAIM_CHECK_KEY]
+    s3_client = get_boto3_client(
+            "s3", region_name=region_name, aws_credentials=aws_credentials
+            )
+    s3_client.delete_object(Bucket=pointer['Bucket'], Key=pointer['Key'])
+
+
+class _LazyPayload(collections.abc.Mapping):
+    """
+    Read-only mapping which loads the offloaded payload on first access
+    """
+
+    def __init__(self, load):
+        self._load = load
+        self._payload = None
+        self._lock = threading.Lock()
+
+    @property
+    def payload(self):
+        if self._payload is None:
+            with self._lock:
+                if self._payload is None:
+                    self._payload = self._load()
+        return self._payload
+
+    def __getitem__(self, key):
+        return self.payload[key]
+
+    def __iter__(self):
+        return iter(self.payload)
+
+    def __len__(self):
+        return len(self.payload)
+
+
+def _is_throttling_error(error):
+    return isinstance(error, ClientError) and \
+        error.response['Error'].get('Code') in THROTTLING_ERROR_CODES
+
+
+def _backoff_delay(attempt, base=0.1, cap=20.0):
+    # full jitter exponential backoff
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def iterate_lambda_invocations(
+        lambda_func, payloads, invocation_type="RequestResponse",
+        max_workers=16, timeout=None, max_retries=5, region_name=None,
+        aws_credentials=None, claim_check_bucket=None,
+        claim_check_prefix=CLAIM_CHECK_PREFIX
+        ):
+    """
+    Invoke a lambda function for every payload through a bounded thread
+    pool, yielding the outcomes as they complete. Throttled calls are retried
+    with exponential backoff, which is the only retry: the client has the
+    botocore retries disabled, so a RequestResponse call running past the
+    timeout, or failing otherwise, is reported and never invoked again, as
+    the function may not be idempotent. Payloads may be a generator, at most
+    twice max_workers of them are in flight at once.
+    :param lambda_func: string
+                         Name for the lambda function
+    :param payloads: iterable
+                     Payloads i.e. events for lambda
+    :param invocation_type: string
+                            RequestResponse, or Event for fire-and-forget
+    :param max_workers: int
+                        Maximum number of concurrent invocations
+    :param timeout: int
+                    Read timeout in seconds for every call, timed out calls
+                    are not retried
+    :param max_retries: int
+                        Number of retries of a throttled call
+    :param region_name: string
+                        AWS region
+    :param aws_credentials: object
+                            AWS credentials object in case of cross account
+    :param claim_check_bucket: string
+                               Bucket for claim-checking oversized payloads
+                               and responses, see invoke_lambda
+    :param claim_check_prefix: string
+                               Path for the offloaded payloads
+    :return: generator
+             Dicts with Index of the payload, Result, Error and Latency in
+             seconds
+    """
+    # the backoff below is the only retry layer
+    config_options = {'retries': {'total_max_attempts': 1}}
+    if timeout:
+        config_options['read_timeout'] = timeout
+    client = get_boto3_client(
+            "lambda", region_name=region_name,
+            aws_credentials=aws_credentials,
+            max_pool_connections=max(max_workers, DEFAULT_MAX_POOL_CONNECTIONS),
+            config_options=config_options
+            )
+    claim_check = _get_claim_check_options(
+            claim_check_bucket, claim_check_prefix, region_name,
+            aws_credentials
+            )
+
+    def invoke(index, payload):
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            try:
+                result = _invoke_lambda_once(
+                        client, lambda_func, payload, invocation_type,
+                        claim_check=claim_check
+                        )
+                error = None
+                break
+            except Exception as e:
+                if _is_throttling_error(e) and attempt < max_retries:
+                    time.sleep(_backoff_delay(attempt))
+                    attempt += 1
+                    continue
+                result, error = None, e
+                break
+        return {
+                'Index': index,
+                'Result': result,
+                'Error': error,
+                'Latency': time.monotonic() - started,
+                'Retries': attempt
+                }
+
+    payloads = enumerate(payloads)
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers
+            ) as executor:
+        pending = set()
+        for index, payload in itertools.islice(payloads, max_workers * 2):
+            pending.add(executor.submit(invoke, index, payload))
+        while pending:
+            finished, pending = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED
+                    )
+            for index, payload in itertools.islice(payloads, len(finished)):
+                pending.add(executor.submit(invoke, index, payload))
+            for future in finished:
+                yield future.result()
+
+
+def _get_latency_stats(latencies):
+    if not latencies:
+        return {}
+    latencies = sorted(latencies)
+
+    def percentile(value):
+        return latencies[min(len(latencies) - 1,
+                             int(value / 100 * len(latencies)))]
+
+    return {
+            'Min': latencies[0],
+            'Max': latencies[-1],
+            'Mean': sum(latencies) / len(latencies),
+            'P50': percentile(50),
+            'P90': percentile(90),
+            'P99': percentile(99)
+            }
+
+
+def invoke_lambda_bulk(
+        lambda_func, payloads, invocation_type="RequestResponse",
+        max_workers=16, timeout=None, max_retries=5, region_name=None,
+        aws_credentials=None, claim_check_bucket=None,
+        claim_check_prefix=CLAIM_CHECK_PREFIX
+        ):
+    """
+    Invoke a lambda function for every payload concurrently and aggregate
+    the outcomes, see iterate_lambda_invocations for streaming them instead
+    :param lambda_func: string
+                         Name for the lambda function
+    :param payloads: iterable
+                     Payloads i.e. events for lambda
+    :param invocation_type: string
+                            RequestResponse, or Event for fire-and-forget
+    :param max_workers: int
+                        Maximum number of concurrent invocations
+    :param timeout: int
+                    Read timeout in seconds for every call, timed out calls
+                    are not retried
+    :param max_retries: int
+                        Number of retries of a throttled call
+    :param region_name: string
+                        AWS region
+    :param aws_credentials: object
+                            AWS credentials object in case of cross account
+    :param claim_check_bucket: string
+                               Bucket for claim-checking oversized payloads
+                               and responses, see invoke_lambda
+    :param claim_check_prefix: string
+                               Path for the offloaded payloads
+    :return: dict
+             Results in payload order (None for failed calls), Errors by
+             payload index, and Stats with the counts, retries, Duration and
+             latency percentiles
+    """
+    started = time.monotonic()
+    outcomes = sorted(
+            iterate_lambda_invocations(
+                    lambda_func, payloads, invocation_type=invocation_type,
+                    max_workers=max_workers, timeout=timeout,
+                    max_retries=max_retries, region_name=region_name,
+                    aws_credentials=aws_credentials,
+                    claim_check_bucket=claim_check_bucket,
+                    claim_check_prefix=claim_check_prefix
+                    ),
+            key=lambda outcome: outcome['Index']
+            )
+    stats = {
+            'Count': len(outcomes),
+            'Failed': sum(1 for outcome in outcomes if outcome['Error']),
+            'Retries': sum(outcome['Retries'] for outcome in outcomes),
+            'Duration': time.monotonic() - started
+            }
+    stats.update(_get_latency_stats(
+            [outcome['Latency'] for outcome in outcomes]
+            ))
+    return {
+            'Results': [outcome['Result'] for outcome in outcomes],
+            'Errors': {
+                    outcome['Index']: outcome['Error']
+                    for outcome in outcomes if outcome['Error']
+                    },
+            'Stats': stats
+            }
+
+
+# Function to read file from s3
+def get_object_from_s3(
+        bucket_name, object_key, region='eu-central-1', mode=None,
+        use_cache=False, **kwargs
+        ):
+    """
+    Read an object from s3
+    :param bucket_name: string
+                        Bucket name
+    :param object_key: string
+                       Key of the object
+    :param region: string
+                   AWS region
+    :param mode: string
+                 None to read the whole body as utf-8 text, "chunks" for
+                 iterate_s3_object_chunks, "lines" for iterate_s3_object_lines
+                 or "parallel" for download_s3_object_parallel
+    :param use_cache: bool
+                      Flag to read the text through the local disk cache,
+                      see get_cached_object_from_s3
+    :param kwargs: dict
+                   Additional arguments for the selected mode
+    :return: string/generator/object
+             Object body, or the result of the selected mode
+    """
+    if mode == "chunks":
+        return iterate_s3_object_chunks(
+                bucket_name, object_key, region_name=region, **kwargs
+                )
+    if mode == "lines":
+        return iterate_s3_object_lines(
+                bucket_name, object_key, region_name=region, **kwargs
+                )
+    if mode == "parallel":
+        return download_s3_object_parallel(
+                bucket_name, object_key, region_name=region, **kwargs
+                )
+    if mode is not None:
+        raise ValueError(f"Invalid mode: {mode}")
+    if use_cache:
+        body = get_cached_object_from_s3(
+                bucket_name, object_key, region_name=region, **kwargs
+                )
+        try:
+            return bytes(body).decode('utf-8')
+        finally:
+            if isinstance(body, mmap.mmap):
+                body.close()
+
+    s3_client = get_boto3_client("s3", region_name=region)
+    response = s3_client.get_object(
+            Bucket=bucket_name,
+            Key=object_key
+            )
+    response_json = response['Body'].read().decode('utf-8')
+    return response_json
+
+
+def _get_cache_paths(cache_dir, bucket_name, object_key, region_name):
+    name = hashlib.sha256(
+            f"{region_name}/{bucket_name}/{object_key}".encode('utf-8')
+            ).hexdigest()
+    return (
+            os.path.join(cache_dir, f"{name}.body"),
+            os.path.join(cache_dir, f"{name}.json")
+            )
+
+
+def _evict_s3_cache(cache_dir, max_bytes):
+    """
+    Delete the least recently used cached bodies until the cache fits in
+    max_bytes, the modification time of a body is bumped on every hit
+    """
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if entry.name.endswith(".body"):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        for stale in (path, path[:-len(".body")] + ".json"):
+            try:
+                os.remove(stale)
+            except FileNotFoundError:
+                pass
+        total -= size
+
+
+def _map_file(path):
+    with open(path, "rb") as f:
+        if not os.fstat(f.fileno()).st_size:
+            # empty files can't be memory-mapped
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def get_cached_object_from_s3(
+        bucket_name, object_key, cache_dir=None, max_bytes=None,
+        revalidate=True, region_name=None, aws_credentials=None
+        ):
+    """
+    Read an object through a local disk cache, e.g. in /tmp of a warm
+    lambda. Cached bodies are revalidated with If-None-Match so unchanged
+    objects cost a 304 instead of a transfer, and are evicted least
+    recently used first once the cache grows past max_bytes.
+    :param bucket_name: string
+                        Bucket name
+    :param object_key: string
+                       Key of the object
+    :param cache_dir: string
+                      Directory for the cache, defaults to S3_CACHE_DIR
+    :param max_bytes: int
+                      Size cap of the cache, defaults to S3_CACHE_MAX_BYTES
+    :param revalidate: bool
+                       Flag to check the ETag with s3 on a hit, False serves
+                       cached bodies without any call
+    :param region_name: string
+                        AWS region
+    :param aws_credentials: object
+                            AWS credentials object in case of cross account
+    :return: object
+             Read-only mmap of the cached body which the caller has to
+             close, bytes for empty objects or objects bigger than the cap
+    """
+    cache_dir = cache_dir if cache_dir else S3_CACHE_DIR
+    max_bytes = max_bytes if max_bytes else S3_CACHE_MAX_BYTES
+    os.makedirs(cache_dir, exist_ok=True)
+    body_path, meta_path = _get_cache_paths(
+            cache_dir, bucket_name, object_key, region_name
+            )
+
+    etag = None
+    try:
+        with open(meta_path) as f:
+            etag = json.load(f)['ETag']
+    except (OSError, ValueError, KeyError):
+        pass
+    if etag and not os.path.exists(body_path):
+        etag = None
+
+    if etag and not revalidate:
+        os.utime(body_path)
+        return _map_file(body_path)
+
+    s3_client = get_boto3_client(
+            "s3", region_name=region_name, aws_credentials=aws_credentials
+            )
+    params = {'Bucket': bucket_name, 'Key': object_key}
+    if etag:
+        params['IfNoneMatch'] = etag
+    try:
+        response = s3_client.get_object(**params)
+    except ClientError as e:
+        status = e.response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+        if etag and (status == 304
+                     or e.response['Error'].get('Code') == '304'):
+            os.utime(body_path)
+            return _map_file(body_path)
+        raise
+
+    if response['ContentLength'] > max_bytes:
+        return response['Body'].read()
+
+    # the temp file is unique per download, only the swap needs the lock
+    temp_path = f"{body_path}.{uuid.uuid4()}.tmp"
+    try:
+        with open(temp_path, "wb") as f:
+            for chunk in response['Body'].iter_chunks(DEFAULT_CHUNK_SIZE):
+                f.write(chunk)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    with _s3_cache_lock:
+        os.replace(temp_path, body_path)
+        with open(meta_path, "w") as f:
+            json.dump({
+                    'Bucket': bucket_name,
+                    'Key': object_key,
+                    'ETag': response['ETag']
+                    }, f)
+        _evict_s3_cache(cache_dir, max_bytes)
+
+    return _map_file(body_path)
+
+
+def clear_s3_cache(cache_dir=None):
+    """
+    Delete all the bodies of the local s3 object cache
+    :param cache_dir: string
+                      Directory for the cache, defaults to S3_CACHE_DIR
+    :return:
+    """
+    cache_dir = cache_dir if cache_dir else S3_CACHE_DIR
+    if not os.path.isdir(cache_dir):
+        return
+    with _s3_cache_lock:
+        _evict_s3_cache(cache_dir, -1)
+
+
+def _get_compression(object_key, content_encoding, compression):
+    if compression != "auto":
+        return compression
+    content_encoding = (content_encoding or "").lower()
+    if content_encoding in ("gzip", "zstd"):
+        return content_encoding
+    if object_key.endswith(".gz"):
+        return "gzip"
+    if object_key.endswith(".zst"):
+        return "zstd"
+    return None
+
+
+def _open_s3_object_stream(
+        bucket_name, object_key, compression="auto", region_name=None,
+        aws_credentials=None
+        ):
+    s3_client = get_boto3_client(
+            "s3", region_name=region_name, aws_credentials=aws_credentials
+            )
+    response = s3_client.get_object(Bucket=bucket_name, Key=object_key)
+    body = response['Body']
+    compression = _get_compression(
+            object_key, response.get('ContentEncoding'), compression
+            )
+    if compression == "gzip":
+        return gzip.GzipFile(fileobj=body, mode="rb")
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError(
+                    "zstandard is required to read zstd compressed objects, "
+                    "install it with: pip install zstandard"
+                    )
+        return zstandard.ZstdDecompressor().stream_reader(
+                body, read_across_frames=True
+                )
+    if compression:
+        raise ValueError(f"Invalid compression: {compression}")
+    return body
+
+
+def iterate_s3_object_chunks(
+        bucket_name, object_key, chunk_size=DEFAULT_CHUNK_SIZE,
+        compression="auto", region_name=None, aws_credentials=None
+        ):
+    """
+    Stream an object from s3 in chunks, decompressing it on the fly
+    :param bucket_name: string
+                        Bucket name
+    :param object_key: string
+                       Key of the object
+    :param chunk_size: int
+                       Number of bytes per chunk
+    :param compression: string
+                        "gzip", "zstd", None, or "auto" to detect it from
+                        the ContentEncoding or the key extension
+    :param region_name: string
+                        AWS region
+    :param aws_credentials: object
+                            AWS credentials object in case of cross account
+    :return: generator
+             Chunks of bytes
+    """
+    stream = _open_s3_object_stream(
+            bucket_name, object_key, compression=compression,
+            region_name=region_name, aws_credentials=aws_credentials
+            )
+    try:
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+    finally:
+        stream.close()
+
+
+def iterate_s3_object_lines(
+        bucket_name, object_key, json_lines=False, encoding='utf-8',
+        chunk_size=DEFAULT_CHUNK_SIZE, compression="auto", region_name=None,
+        aws_credentials=None
+        ):
+    """
+    Stream an object from s3 line by line, e.g. csv or JSON lines files
+    :param bucket_name: string
+                        Bucket name
+    :param object_key: string
+                       Key of the object
+    :param json_lines: bool
+                       Flag to parse every non empty line as JSON
+    :param encoding: string
+                     Encoding of the text
+    :param chunk_size: int
+                       Number of bytes read per call
+    :param compression: string
+                        "gzip", "zstd", None, or "auto" to detect it from
+                        the ContentEncoding or the key extension
+    :param region_name: string
+                        AWS region
+    :param aws_credentials: object
+                            AWS credentials object in case of cross account
+    :return: generator
+             Lines without the line break, or the parsed JSON objects
+    """
+    pending = b""
+    for chunk in iterate_s3_object_chunks(
+            bucket_name, object_key, chunk_size=chunk_size,
+            compression=compression, region_name=region_name,
+            aws_credentials=aws_credentials
+            ):
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            yield from _parse_line(line, encoding, json_lines)
+    if pending:
+        yield from _parse_line(pending, encoding, json_lines)
+
+
+def _parse_line(line, encoding, json_lines):
+    line = line.rstrip(b"\r").decode(encoding)
+    if not json_lines:
+        yield line
+    elif line.strip():
+        yield json.loads(line)
+
+
+def download_s3_object_parallel(
+        bucket_name, object_key, part_size=DEFAULT_PART_SIZE, max_workers=8,
+        file_path=None, region_name=None, aws_credentials=None
+        ):
+    """
+    Download an object with concurrent ranged GETs, each part written
+    straight into its slice of a preallocated buffer, or of a memory-mapped
+    local file when file_path is given. The body is returned as stored, it
+    is not decompressed.
+    :param bucket_name: string
+                        Bucket name
+    :param object_key: string
+                       Key of the object
+    :param part_size: int
+                      Number of bytes per ranged GET
+    :param max_workers: int
+                        Maximum number of concurrent GETs
+    :param file_path: string
+                      Local file to download into, None for memory
     :param region_name: string
                         AWS region
+    :param aws_credentials: object
+                            AWS credentials object in case of cross account
     :return: object
-            Response from boto3 client
+             bytearray with the body, or the mmap of file_path which the
+             caller has to close
     """
-    if aws_credentials:
-        access_key = aws_credentials['Credentials']['AccessKeyId']
-        secret_key = aws_credentials['Credentials']['SecretAccessKey']
-        session_token = aws_credentials['Credentials']['SessionToken']
-        client = boto3.client(
-            'glue', aws_access_key_id=access_key,
-            aws_secret_access_key=secret_key,
-            aws_session_token=session_token,
-            region_name=region_name
+    s3_client = get_boto3_client(
+            "s3", region_name=region_name, aws_credentials=aws_credentials,
+            max_pool_connections=max(max_workers, DEFAULT_MAX_POOL_CONNECTIONS)
             )
+    head = s3_client.head_object(Bucket=bucket_name, Key=object_key)
+    size = head['ContentLength']
+    if file_path:
+        with open(file_path, "wb") as f:
+            f.truncate(size)
+    if not size:
+        # empty files can't be memory-mapped
+        return bytearray()
+    if file_path:
+        with open(file_path, "r+b") as f:
+            buffer = mmap.mmap(f.fileno(), size)
     else:
-        client = boto3.client('glue', region_name=region_name)
+        buffer = bytearray(size)
+    view = memoryview(buffer)
 
-    resp = client.start_crawler(Name=gc_name)
+    def download_part(offset):
+        last = min(offset + part_size, size) - 1
+        response = s3_client.get_object(
+                Bucket=bucket_name, Key=object_key,
+                Range=f"bytes={offset}-{last}", IfMatch=head['ETag']
+                )
+        data = response['Body'].read()
+        view[offset:offset + len(data)] = data
 
-    return resp
+    try:
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=max_workers
+                ) as executor:
+            list(executor.map(download_part, range(0, size, part_size)))
+    finally:
+        view.release()
 
+    return buffer
 
-def invoke_lambda(lambda_func, payload={}):
+
+def get_transfer_config(
+        multipart_threshold=DEFAULT_MULTIPART_THRESHOLD,
+        multipart_chunksize=DEFAULT_MULTIPART_CHUNKSIZE,
+        max_concurrency=DEFAULT_TRANSFER_CONCURRENCY, use_threads=True
+        ):
     """
-    Invoke lambda function
-    :param lambda_func: string
-                         Name for the lambda function
-    :param payload: dict
-                    Payload i.e. event for lambda
+    Transfer configuration for managed uploads, the defaults are tuned for
+    large artifacts such as parquet files and jars
+    :param multipart_threshold: int
+                                Size in bytes from which multipart is used
+    :param multipart_chunksize: int
+                                Size in bytes of every part
+    :param max_concurrency: int
+                            Number of parts transferred concurrently
+    :param use_threads: bool
+                        Flag to transfer the parts in threads
     :return: object
-            Response from boto3 client
+             boto3 TransferConfig
     """
-    boto_conn = boto3.client("lambda")
-    resp = boto_conn.invoke(
-            FunctionName=lambda_func,
-            Payload=json.dumps(payload)
+    return TransferConfig(
+            multipart_threshold=multipart_threshold,
+            multipart_chunksize=multipart_chunksize,
+            max_concurrency=max_concurrency,
+            use_threads=use_threads
             )
-    out = json.loads(resp["Payload"].read())
-    return out
 
 
-# Function to read file from s3
-def get_object_from_s3(bucket_name, object_key, region='eu-central-1'):
-    s3_client = boto3.client("s3", region_name=region)
-    response = s3_client.get_object(
-            Bucket=bucket_name,
-            Key=object_key
+# Function to Upload file to s3
+def upload_file_to_s3(
+        file_path, bucket_name, prefix, region='eu-central-1',
+        transfer_config=None, progress_callback=None,
+        checksum_algorithm='CRC32', extra_args=None, aws_credentials=None
+        ):
+    """
+    Upload a file to s3, in parts for files over the multipart threshold
+    :param file_path: string
+                      Local path of the file
+    :param bucket_name: string
+                        Bucket name
+    :param prefix: string
+                   Key of the uploaded object
+    :param region: string
+                   AWS region
+    :param transfer_config: object
+                            TransferConfig, defaults to get_transfer_config()
+    :param progress_callback: callable
+                              Called with the bytes uploaded so far and the
+                              total bytes, from the transfer threads
+    :param checksum_algorithm: string
+                               Checksum s3 computes and verifies for every
+                               part, e.g. CRC32 or SHA256, None to disable
+    :param extra_args: dict
+                       Extra arguments for the upload, e.g. ContentType
+    :param aws_credentials: object
+                            AWS credentials object in case of cross account
+    :return: dict
+             Bucket, Key, Bytes, Duration in seconds, ETag and Checksum of
+             the uploaded object
+    """
+    transfer_config = transfer_config if transfer_config \
+        else get_transfer_config()
+    s3_client = get_boto3_client(
+            "s3", region_name=region, aws_credentials=aws_credentials,
+            max_pool_connections=max(
+                    transfer_config.max_request_concurrency,
+                    DEFAULT_MAX_POOL_CONNECTIONS
+                    )
             )
-    response_json = response['Body'].read().decode('utf-8')
-    return response_json
+    extra_args = dict(extra_args) if extra_args else {}
+    if checksum_algorithm:
+        extra_args['ChecksumAlgorithm'] = checksum_algorithm
 
+    total_bytes = os.path.getsize(file_path)
+    callback = None
+    if progress_callback:
+        progress = {'bytes': 0}
+        progress_lock = threading.Lock()
 
-# Function to Upload file to s3
-def upload_file_to_s3(file_path, bucket_name, prefix, region='eu-central-1'):
-    s3_client = boto3.client("s3", region_name=region)
+        def callback(bytes_transferred):
+            with progress_lock:
+                progress['bytes'] += bytes_transferred
+                uploaded = progress['bytes']
+            progress_callback(uploaded, total_bytes)
+
+    started = time.monotonic()
     try:
-        response = s3_client.upload_file(file_path, bucket_name, prefix)
-        print(
-            f"----- File Uploaded to Bucket: {bucket_name}, "
-            f"Path: {prefix} -----"
-            )
+        s3_client.upload_file(
+                file_path, bucket_name, prefix, ExtraArgs=extra_args,
+                Callback=callback, Config=transfer_config
+                )
     except Exception as e:
         print(
             f"----- Error on Uploading File to Bucket: {bucket_name}, "
             f"Error: {e} -----"
             )
+        raise
+    duration = time.monotonic() - started
+    print(
+        f"----- File Uploaded to Bucket: {bucket_name}, "
+        f"Path: {prefix} -----"
+        )
+
+    head_args = {'Bucket': bucket_name, 'Key': prefix}
+    if checksum_algorithm:
+        head_args['ChecksumMode'] = 'ENABLED'
+    head = s3_client.head_object(**head_args)
+    return {
+            'Bucket': bucket_name,
+            'Key': prefix,
+            'Bytes': total_bytes,
+            'Duration': duration,
+            'ETag': head['ETag'],
+            'Checksum': head.get(f"Checksum{checksum_algorithm}")
+            if checksum_algorithm else None
+            }
+
+
+def _compute_s3_etag(file_path, transfer_config):
+    """
+    ETag s3 computes for the file when uploaded with the transfer config,
+    the md5 of the body or the md5 of the part md5s for multipart uploads
+    """
+    size = os.path.getsize(file_path)
+    chunk_size = transfer_config.multipart_chunksize
+    with open(file_path, "rb") as f:
+        if size < transfer_config.multipart_threshold:
+            digest = hashlib.md5()
+            for chunk in iter(lambda: f.read(DEFAULT_CHUNK_SIZE), b""):
+                digest.update(chunk)
+            return f'"{digest.hexdigest()}"'
+        part_digests = [
+                hashlib.md5(part).digest()
+                for part in iter(lambda: f.read(chunk_size), b"")
+                ]
+    digest = hashlib.md5(b"".join(part_digests))
+    return f'"{digest.hexdigest()}-{len(part_digests)}"'
+
+
+def sync_directory_to_s3(
+        local_dir, bucket_name, prefix, delete=False, max_workers=8,
+        transfer_config=None, dry_run=False, region='eu-central-1',
+        aws_credentials=None
+        ):
+    """
+    Upload only the new or changed files of a local directory to s3,
+    compared by size and MD5/ETag against a listing of the prefix
+    :param local_dir: string
+                      Local directory to sync
+    :param bucket_name: string
+                        Bucket name
+    :param prefix: string
+                   Path the directory is synced to
+    :param delete: bool
+                   Flag to delete the keys under the prefix which don't exist
+                   locally anymore
+    :param max_workers: int
+                        Maximum number of concurrent file uploads
+    :param transfer_config: object
+                            TransferConfig, defaults to get_transfer_config()
+    :param dry_run: bool
+                    Flag to only report the changes without applying them
+    :param region: string
+                   AWS region
+    :param aws_credentials: object
+                            AWS credentials object in case of cross account
+    :return: dict
+             Keys uploaded, deleted and unchanged, plus Bytes uploaded and
+             Duration in seconds
+    """
+    transfer_config = transfer_config if transfer_config \
+        else get_transfer_config()
+    prefix = prefix.rstrip("/") + "/" if prefix else ""
+    started = time.monotonic()
+
+    local_files = {}
+    for root, _, files in os.walk(local_dir):
+        for file_name in files:
+            path = os.path.join(root, file_name)
+            relative_path = os.path.relpath(path, local_dir)
+            key = prefix + relative_path.replace(os.sep, "/")
+            local_files[key] = path
+
+    remote_objects = {
+            obj['Key']: obj for obj in iterate_s3_objects(
+                    bucket_name, prefix, region_name=region,
+                    aws_credentials=aws_credentials
+                    )
+            }
+
+    changed = []
+    unchanged = []
+    for key, path in sorted(local_files.items()):
+        remote = remote_objects.get(key)
+        if remote and remote['Size'] == os.path.getsize(path) and \
+                remote['ETag'] == _compute_s3_etag(path, transfer_config):
+            unchanged.append(key)
+        else:
+            changed.append(key)
+    stale = sorted(set(remote_objects) - set(local_files)) if delete else []
+
+    uploaded_bytes = 0
+    if not dry_run:
+        def upload(key):
+            return upload_file_to_s3(
+                    local_files[key], bucket_name, key, region=region,
+                    transfer_config=transfer_config,
+                    aws_credentials=aws_credentials
+                    )
+
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=max_workers
+                ) as executor:
+            for result in executor.map(upload, changed):
+                uploaded_bytes += result['Bytes']
+
+        s3_client = get_boto3_client(
+                "s3", region_name=region, aws_credentials=aws_credentials
+                )
+        for i in range(0, len(stale), S3_DELETE_BATCH_SIZE):
+            response = s3_client.delete_objects(
+                    Bucket=bucket_name,
+                    Delete={
+                            'Objects': [
+                                    {'Key': key}
+                                    for key in stale[i:i + S3_DELETE_BATCH_SIZE]
+                                    ],
+                            'Quiet': True
+                            }
+                    )
+            if response.get('Errors'):
+                raise RuntimeError(
+                        f"Failed to delete stale keys: {response['Errors']}"
+                        )
+
+    return {
+            'uploaded': changed,
+            'deleted': stale,
+            'unchanged': unchanged,
+            'Bytes': uploaded_bytes,
+            'Duration': time.monotonic() - started
+            }
+
+
+def _prefetch(iterable, prefetch=1):
+    """
+    Consume the iterable in a background thread, keeping at most prefetch
+    items ready so the next page is fetched while the current one is used
+    :param iterable: object
+                     Iterable to consume, e.g. a paginator
+    :param prefetch: int
+                     Number of items to buffer ahead, 0 disables it
+    :return: generator
+             Items of the iterable
+    """
+    if not prefetch:
+        yield from iterable
+        return
+
+    buffer = queue.Queue(maxsize=prefetch)
+    stop = threading.Event()
+    done = object()
+
+    def put(entry):
+        while not stop.is_set():
+            try:
+                buffer.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+            put((done, None))
+        except Exception as e:
+            put((done, e))
+
+    worker = threading.Thread(target=produce, daemon=True)
+    worker.start()
+    try:
+        while True:
+            item, error = buffer.get()
+            if error is not None:
+                raise error
+            if item is done:
+                return
+            yield item
+    finally:
+        stop.set()
+
+
+def _iterate_list_objects_pages(
+        bucket, prefix, delimiter=None, start_after=None, page_size=1000,
+        prefetch=1, region_name=None, aws_credentials=None
+        ):
+    client = get_boto3_client(
+            's3', region_name=region_name, aws_credentials=aws_credentials
+            )
+    params = {'Bucket': bucket, 'Prefix': prefix}
+    if delimiter:
+        params['Delimiter'] = delimiter
+    if start_after:
+        params['StartAfter'] = start_after
+    pages = client.get_paginator('list_objects_v2').paginate(
+            PaginationConfig={'PageSize': page_size}, **params
+            )
+    return _prefetch(pages, prefetch=prefetch)
+
+
+def iterate_s3_objects(
+        bucket, prefix='', delimiter=None, start_after=None, max_keys=None,
+        page_size=1000, prefetch=1, region_name=None, aws_credentials=None
+        ):
+    """
+    Lazily list all the objects under given bucket and prefix, following
+    every page of list_objects_v2 while the next page is prefetched
+    :param bucket: string
+                   Bucket name
+    :param prefix: string
+                   Path for the files
+    :param delimiter: string
+                      Delimiter to stop at, e.g. "/" for one level only
+    :param start_after: string
+                        Key to start listing after
+    :param max_keys: int
+                     Maximum number of objects to yield, None for all
+    :param page_size: int
+                      Number of keys requested per call
+    :param prefetch: int
+                     Number of pages fetched ahead of the consumer
+    :param region_name: string
+                        AWS region
+    :param aws_credentials: object
+                            AWS credentials object in case of cross account
+    :return: generator
+             Dicts with Key, Size, ETag and LastModified of the objects
+    """
+    if max_keys is not None and max_keys <= 0:
+        return
+    count = 0
+    for page in _iterate_list_objects_pages(
+            bucket, prefix, delimiter=delimiter, start_after=start_after,
+            page_size=page_size, prefetch=prefetch, region_name=region_name,
+            aws_credentials=aws_credentials
+            ):
+        for obj in page.get('Contents', []):
+            yield {
+                    'Key': obj['Key'],
+                    'Size': obj['Size'],
+                    'ETag': obj['ETag'],
+                    'LastModified': obj['LastModified']
+                    }
+            count += 1
+            if max_keys is not None and count >= max_keys:
+                return
+
+
+def iterate_s3_sub_folders(
+        bucket, prefix='', delimiter='/', start_after=None, max_keys=None,
+        page_size=1000, prefetch=1, region_name=None, aws_credentials=None
+        ):
+    """
+    Lazily list the sub folders (CommonPrefixes) directly under a prefix
+    :param bucket: string
+                   Bucket name
+    :param prefix: string
+                   Path to list the sub folders of
+    :param delimiter: string
+                      Delimiter for the folders
+    :param start_after: string
+                        Key to start listing after
+    :param max_keys: int
+                     Maximum number of prefixes to yield, None for all
+    :param page_size: int
+                      Number of keys requested per call
+    :param prefetch: int
+                     Number of pages fetched ahead of the consumer
+    :param region_name: string
+                        AWS region
+    :param aws_credentials: object
+                            AWS credentials object in case of cross account
+    :return: generator
+             Sub folder prefixes
+    """
+    if max_keys is not None and max_keys <= 0:
+        return
+    count = 0
+    for page in _iterate_list_objects_pages(
+            bucket, prefix, delimiter=delimiter, start_after=start_after,
+            page_size=page_size, prefetch=prefetch, region_name=region_name,
+            aws_credentials=aws_credentials
+            ):
+        for common_prefix in page.get('CommonPrefixes', []):
+            yield common_prefix['Prefix']
+            count += 1
+            if max_keys is not None and count >= max_keys:
+                return
+
+
+def walk_s3_prefixes(
+        bucket, prefix='', max_depth=None, max_workers=16, leaves_only=False,
+        delimiter='/', region_name=None, aws_credentials=None
+        ):
+    """
+    Walk the folder tree under a prefix, listing the CommonPrefixes of every
+    discovered folder concurrently, e.g. year=/month=/day= partitions
+    :param bucket: string
+                   Bucket name
+    :param prefix: string
+                   Root path for the walk
+    :param max_depth: int
+                      Number of levels to descend, None for no limit
+    :param max_workers: int
+                        Maximum number of concurrent listings
+    :param leaves_only: bool
+                        Flag to yield only the folders without sub folders
+                        (or at max_depth) instead of every folder
+    :param delimiter: string
+                      Delimiter for the folders
+    :param region_name: string
+                        AWS region
+    :param aws_credentials: object
+                            AWS credentials object in case of cross account
+    :return: generator
+             Tuples of folder prefix and its depth, in discovery order
+    """
+    if max_depth is not None and max_depth <= 0:
+        return
+
+    def list_level(level_prefix):
+        return list(iterate_s3_sub_folders(
+                bucket, level_prefix, delimiter=delimiter, prefetch=0,
+                region_name=region_name, aws_credentials=aws_credentials
+                ))
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+    pending = {executor.submit(list_level, prefix): (prefix, 0)}
+    try:
+        while pending:
+            finished, _ = concurrent.futures.wait(
+                    pending,
+                    return_when=concurrent.futures.FIRST_COMPLETED
+                    )
+            for future in finished:
+                parent, depth = pending.pop(future)
+                children = future.result()
+                if leaves_only and not children and depth > 0:
+                    yield parent, depth
+                for child in children:
+                    child_depth = depth + 1
+                    at_limit = max_depth is not None and \
+                        child_depth >= max_depth
+                    if not leaves_only or at_limit:
+                        yield child, child_depth
+                    if not at_limit:
+                        pending[executor.submit(list_level, child)] = (
+                                child, child_depth
+                                )
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+
+def list_s3_objects_for_date_range(
+        bucket, prefix, start, end, template=dynamic_output_path,
+        predicate=None, max_workers=16, region_name=None,
+        aws_credentials=None
+        ):
+    """
+    List the objects of the partitions between two timestamps. Only the
+    candidate partition prefixes rendered from the template are listed,
+    concurrently, so the number of calls follows the selected partitions
+    instead of all the partitions under the prefix. At most max_workers
+    partitions are listed ahead of the one being yielded, so the memory
+    follows max_workers instead of the whole range.
+    :param bucket: string
+                   Bucket name
+    :param prefix: string
+                   Base path the partition template is appended to
+    :param start: datetime
+                  First partition timestamp, inclusive
+    :param end: datetime
+                Last partition timestamp, inclusive
+    :param template: string
+                     Firehose style partition template
+    :param predicate: callable
+                      Optional filter on each candidate timestamp
+    :param max_workers: int
+                        Maximum number of concurrent listings
+    :param region_name: string
+                        AWS region
+    :param aws_credentials: object
+                            AWS credentials object in case of cross account
+    :return: generator
+             Object dicts as yielded by iterate_s3_objects, in partition order
+    """
+    partitions = get_partition_prefixes_for_date_range(
+            prefix, start, end, template=template, predicate=predicate
+            )
+
+    def list_partition(partition):
+        return list(iterate_s3_objects(
+                bucket, partition, prefetch=0, region_name=region_name,
+                aws_credentials=aws_credentials
+                ))
+
+    partitions = iter(partitions)
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers
+            ) as executor:
+        # at most max_workers listings are held besides the one yielded
+        pending = collections.deque(
+                executor.submit(list_partition, partition)
+                for partition in itertools.islice(partitions, max_workers)
+                )
+        while pending:
+            objects = pending.popleft().result()
+            for partition in itertools.islice(partitions, 1):
+                pending.append(executor.submit(list_partition, partition))
+            yield from objects
 
 
 def get_files_under_given_bucket_prefix(bucket, prefix):
@@ -122,32 +2573,34 @@ def get_files_under_given_bucket_prefix(bucket, prefix):
     :return: list
             List of files under given bucket and prefix
     """
-    s3 = boto3.client("s3")
-    all_objects = s3.list_objects(Bucket=bucket, Prefix=prefix, Delimiter="/")
-
-    files_path_list = []
-    for file in all_objects["Contents"] if "Contents" in all_objects else {}:
-        files_path_list.append(file['Key']) if file['Size'] > 0 else ''
+    files_path_list = [
+            file['Key'] for file in iterate_s3_objects(
+                    bucket, prefix, delimiter="/"
+                    )
+            if file['Size'] > 0
+            ]
 
     return files_path_list
 
 
 def get_sub_folders_under_given_prefix(bucket, s3_prefix):
-    client = boto3.client('s3')
-    response = client.list_objects(
-        Bucket=bucket, Prefix=s3_prefix ,Delimiter='/')
-
-    sub_folders = []
-    if 'CommonPrefixes' in response:
-        for o in response.get('CommonPrefixes'):
-            sub_folders.append(o.get('Prefix'))
+    """
+    Get all the sub folders under given bucket and path
+    :param bucket: string
+                   Bucket name
+    :param s3_prefix: string
+                      Path for the sub folders
+    :return: list
+            List of sub folder prefixes
+    """
+    sub_folders = list(iterate_s3_sub_folders(bucket, s3_prefix))
 
     return sub_folders
 
 
 def get_cross_account_credentials(
         account_id, role_name,
-        region_name='eu-central-1'
+        region_name='eu-central-1', use_cache=True
         ):
     """
     :param account_id: string
@@ -156,22 +2609,87 @@ def get_cross_account_credentials(
                       Role name we want to use
     :param region_name: string
                         Region for the AWS account
+    :param use_cache: bool
+                      Flag to reuse the credentials until shortly before
+                      they expire
     :return: object
              AWS credentials object
     """
-    sts_connection = boto3.client('sts', region_name=region_name)
+    key = (account_id, role_name, region_name)
+    if use_cache:
+        aws_credentials = _credentials_cache.get(key)
+        if aws_credentials and not _is_expiring(aws_credentials):
+            return aws_credentials
+
+    sts_connection = get_boto3_client('sts', region_name=region_name)
     role_arn = f"arn:aws:iam::{account_id}:role/{role_name}"
     aws_credentials = sts_connection.assume_role(
             RoleArn=role_arn,
             RoleSessionName=f"cross_acct_lambda_{role_name}"
             )
+    with _credentials_lock:
+        _credentials_cache[key] = aws_credentials
     return aws_credentials
 
 
+def _is_expiring(aws_credentials):
+    expiration = aws_credentials['Credentials'].get('Expiration')
+    if expiration is None:
+        return False
+    margin = datetime.timedelta(seconds=CREDENTIALS_EXPIRY_MARGIN)
+    return datetime.datetime.now(datetime.timezone.utc) + margin >= expiration
+
+
+def get_refreshable_cross_account_credentials(
+        account_id, role_name,
+        region_name='eu-central-1'
+        ):
+    """
+    Credentials for the cross account role which refresh themselves before
+    they expire. The object is cached per account, role and region and can
+    be passed as aws_credentials to every helper in this module.
+    :param account_id: string
+                    AWS account Id
+    :param role_name: string
+                      Role name we want to use
+    :param region_name: string
+                        Region for the AWS account
+    :return: object
+             botocore RefreshableCredentials object
+    """
+    key = (account_id, role_name, region_name)
+    credentials = _refreshable_credentials_cache.get(key)
+    if credentials is not None:
+        return credentials
+
+    def refresh():
+        response = get_cross_account_credentials(
+                account_id, role_name, region_name=region_name,
+                use_cache=False
+                )['Credentials']
+        return {
+                'access_key': response['AccessKeyId'],
+                'secret_key': response['SecretAccessKey'],
+                'token': response['SessionToken'],
+                'expiry_time': response['Expiration'].isoformat()
+                }
+
+    with _credentials_lock:
+        credentials = _refreshable_credentials_cache.get(key)
+        if credentials is None:
+            credentials = RefreshableCredentials.create_from_metadata(
+                    metadata=refresh(), refresh_using=refresh,
+                    method='sts-assume-role'
+                    )
+            _refreshable_credentials_cache[key] = credentials
+    return credentials
+
+
 def initiate_quicksight_ingestion(
         dataset_id, quicksight_account_id,
         aws_credentials=None,
-        region_name='eu-central-1'
+        region_name='eu-central-1',
+        ingestion_type=None
         ):
     """
     :param dataset_id: string
@@ -182,31 +2700,153 @@ def initiate_quicksight_ingestion(
                             AWS credentials object
     :param region_name: string
                         AWS region
+    :param ingestion_type: string
+                           FULL_REFRESH or INCREMENTAL_REFRESH, None for the
+                           Quicksight default
     :return: tuple
              Ingestion id and response from the ingestion
     """
-    if aws_credentials:
-        access_key = aws_credentials['Credentials']['AccessKeyId']
-        secret_key = aws_credentials['Credentials']['SecretAccessKey']
-        session_token = aws_credentials['Credentials']['SessionToken']
-        client = boto3.client(
-            'quicksight', aws_access_key_id=access_key,
-            aws_secret_access_key=secret_key,
-            aws_session_token=session_token,
-            region_name=region_name
+    client = get_boto3_client(
+            'quicksight', region_name=region_name,
+            aws_credentials=aws_credentials
             )
-    else:
-        client = boto3.client('quicksight', region_name=region_name)
 
     ingestion_id = str(uuid.uuid4())
+    params = {}
+    if ingestion_type:
+        params['IngestionType'] = ingestion_type
     response = client.create_ingestion(
             DataSetId=dataset_id,
             IngestionId=ingestion_id,
-            AwsAccountId=quicksight_account_id
+            AwsAccountId=quicksight_account_id,
+            **params
             )
     return response, ingestion_id
 
 
+def _get_ingestion_result(
+        ingestion_id, status, rows_ingested=None, rows_dropped=None,
+        duration=None, error=None
+        ):
+    return {
+            'IngestionId': ingestion_id,
+            'Status': status,
+            'RowsIngested': rows_ingested,
+            'RowsDropped': rows_dropped,
+            'Duration': duration,
+            'Error': error
+            }
+
+
+def refresh_quicksight_datasets(
+        dataset_ids, quicksight_account_id, ingestion_type=None,
+        max_concurrent=5, timeout=3600, poll_interval=5,
+        max_poll_interval=60, aws_credentials=None,
+        region_name='eu-central-1'
+        ):
+    """
+    Refresh many SPICE datasets, keeping at most max_concurrent ingestions
+    running to stay under the concurrent ingestion quota of the account.
+    Ingestions refused for the quota or throttling are retried once a slot
+    frees up, and every ingestion is polled with a growing interval until
+    it is done.
+    :param dataset_ids: list
+                        Dataset Ids for Quicksight datasets
+    :param quicksight_account_id: string
+                                  AWS account id for Quicksight
+    :param ingestion_type: string
+                           FULL_REFRESH or INCREMENTAL_REFRESH, None for the
+                           Quicksight default
+    :param max_concurrent: int
+                           Maximum number of running ingestions
+    :param timeout: int
+                    Seconds to wait for all the ingestions at most
+    :param poll_interval: int
+                          Seconds between the first status polls
+    :param max_poll_interval: int
+                              Upper bound for the seconds between polls
+    :param aws_credentials: object
+                            AWS credentials object
+    :param region_name: string
+                        AWS region
+    :return: dict
+             Per dataset id, the IngestionId, Status (COMPLETED, FAILED,
+             CANCELLED or TIMEOUT), RowsIngested, RowsDropped, Duration in
+             seconds and Error if any
+    """
+    client = get_boto3_client(
+            'quicksight', region_name=region_name,
+            aws_credentials=aws_credentials
+            )
+    queued = collections.deque(dict.fromkeys(dataset_ids))
+    running = {}
+    report = {}
+    delay = poll_interval
+    deadline = time.monotonic() + timeout
+
+    while queued or running:
+        while queued and len(running) < max_concurrent:
+            dataset_id = queued[0]
+            try:
+                _, ingestion_id = initiate_quicksight_ingestion(
+                        dataset_id, quicksight_account_id,
+                        aws_credentials=aws_credentials,
+                        region_name=region_name,
+                        ingestion_type=ingestion_type
+                        )
+            except ClientError as e:
+                code = e.response['Error'].get('Code')
+                if code in QUICKSIGHT_RETRY_ERROR_CODES:
+                    # quota or rate reached, retry when a slot frees up
+                    break
+                queued.popleft()
+                report[dataset_id] = _get_ingestion_result(
+                        None, 'FAILED', error=e
+                        )
+                continue
+            queued.popleft()
+            running[dataset_id] = (ingestion_id, time.monotonic())
+
+        if time.monotonic() + delay > deadline:
+            for dataset_id, (ingestion_id, _) in running.items():
+                report[dataset_id] = _get_ingestion_result(
+                        ingestion_id, 'TIMEOUT'
+                        )
+            for dataset_id in queued:
+                report[dataset_id] = _get_ingestion_result(None, 'TIMEOUT')
+            break
+        time.sleep(delay)
+
+        finished = False
+        for dataset_id, (ingestion_id, started) in list(running.items()):
+            ingestion = client.describe_ingestion(
+                    AwsAccountId=quicksight_account_id,
+                    DataSetId=dataset_id, IngestionId=ingestion_id
+                    )['Ingestion']
+            status = ingestion['IngestionStatus']
+            if status not in ('COMPLETED', 'FAILED', 'CANCELLED'):
+                continue
+            finished = True
+            del running[dataset_id]
+            row_info = ingestion.get('RowInfo', {})
+            report[dataset_id] = _get_ingestion_result(
+                    ingestion_id, status,
+                    rows_ingested=row_info.get('RowsIngested'),
+                    rows_dropped=row_info.get('RowsDropped'),
+                    duration=ingestion.get(
+                            'IngestionTimeInSeconds',
+                            time.monotonic() - started
+                            ),
+                    error=ingestion.get('ErrorInfo', {}).get('Message')
+                    )
+        # poll quickly again once a slot freed up for queued datasets
+        delay = poll_interval if finished \
+            else min(delay * 1.5, max_poll_interval)
+
+    return {dataset_id: report[dataset_id]
+            for dataset_id in dict.fromkeys(dataset_ids)}
+
+
 def change_s3_policy(
         sid, bucket_name, principal_arn, actions,
         resources=['*'], region='eu-central-1', aws_credentials=None
@@ -235,18 +2875,10 @@ def change_s3_policy(
     dict
             put_bucket_policy response
     """
-    if aws_credentials:
-        access_key = aws_credentials['Credentials']['AccessKeyId']
-        secret_key = aws_credentials['Credentials']['SecretAccessKey']
-        session_token = aws_credentials['Credentials']['SessionToken']
-        s3 = boto3.client(
-            's3', aws_access_key_id=access_key,
-            aws_secret_access_key=secret_key,
-            aws_session_token=session_token,
-            region_name=region
+    s3 = get_boto3_client(
+            's3', region_name=region,
+            aws_credentials=aws_credentials
             )
-    else:
-        s3 = boto3.client('s3', region_name=region)
 
     current_sids = []
     try:
@@ -301,3 +2933,397 @@ def change_s3_policy(
                 }
     else:
         return response
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    return list(value) if isinstance(value, (list, tuple, set)) else [value]
+
+
+def _statement_scope(statement):
+    """
+    Everything of a statement but its Sid and AWS principals, statements
+    with the same scope can share their principals
+    """
+    principal = statement.get('Principal', {})
+    other_principals = {
+            key: sorted(_as_list(value))
+            for key, value in principal.items() if key != 'AWS'
+            } if isinstance(principal, dict) else principal
+    return json.dumps({
+            'Effect': statement.get('Effect'),
+            'Action': sorted(_as_list(statement.get('Action'))),
+            'NotAction': sorted(_as_list(statement.get('NotAction'))),
+            'Resource': sorted(_as_list(statement.get('Resource'))),
+            'NotResource': sorted(_as_list(statement.get('NotResource'))),
+            'Condition': statement.get('Condition'),
+            'Principal': other_principals
+            }, sort_keys=True)
+
+
+def _normalize_principals(statement):
+    """
+    Copy of the statement with account id principals written as the root
+    ARN, the form s3 stores and returns them in
+    """
+    statement = copy.deepcopy(statement)
+    principal = statement.get('Principal')
+    if not isinstance(principal, dict) or 'AWS' not in principal:
+        return statement
+    principals = [
+            f"arn:aws:iam::{value}:root"
+            if isinstance(value, str) and re.fullmatch(r"\d{12}", value)
+            else value
+            for value in _as_list(principal['AWS'])
+            ]
+    principal['AWS'] = principals if isinstance(principal['AWS'], list) \
+        else principals[0]
+    return statement
+
+
+def _merge_principals(statement, new_statement):
+    if not isinstance(statement.get('Principal'), dict) or \
+            not isinstance(new_statement.get('Principal'), dict):
+        # e.g. "*", which already covers every principal, statements with
+        # the same scope have the same principal then
+        return copy.deepcopy(statement)
+    principals = _as_list(statement['Principal'].get('AWS'))
+    for principal in _as_list(new_statement['Principal'].get('AWS')):
+        if principal not in principals:
+            principals.append(principal)
+    merged = copy.deepcopy(statement)
+    merged['Principal']['AWS'] = principals[0] if len(principals) == 1 \
+        else principals
+    return merged
+
+
+def _canonical_statements(statements):
+    """
+    Comparable form of policy statements, s3 may return single values
+    where lists were written
+    """
+    statements = [_normalize_principals(statement) for statement in statements]
+    return [
+            (
+                    statement.get('Sid'), _statement_scope(statement),
+                    sorted(_as_list(
+                            statement.get('Principal', {}).get('AWS')
+                            )) if isinstance(
+                            statement.get('Principal'), dict
+                            ) else None
+                    )
+            for statement in statements
+            ]
+
+
+def _apply_policy_changes(statements, add, replace, remove_sids):
+    statements = [_normalize_principals(statement) for statement in statements]
+    add = [_normalize_principals(statement) for statement in add]
+    replace = [_normalize_principals(statement) for statement in replace]
+    for new_statement in replace:
+        if not new_statement.get('Sid'):
+            raise ValueError(
+                    "statements to replace need a Sid to find the statement "
+                    "they replace"
+                    )
+        index = next((
+                i for i, statement in enumerate(statements)
+                if statement.get('Sid') == new_statement.get('Sid')
+                ), None)
+        if index is None:
+            statements.append(copy.deepcopy(new_statement))
+        else:
+            statements[index] = copy.deepcopy(new_statement)
+    for new_statement in add:
+        sid = new_statement.get('Sid')
+        for i, statement in enumerate(statements):
+            same_sid = sid is not None and statement.get('Sid') == sid
+            if not same_sid and sid is not None:
+                continue
+            if _statement_scope(statement) == _statement_scope(new_statement):
+                statements[i] = _merge_principals(statement, new_statement)
+                break
+            if same_sid:
+                raise ValueError(
+                        f"sid: {sid} already exists in bucket policy with a "
+                        f"different scope, replace it instead"
+                        )
+        else:
+            statements.append(copy.deepcopy(new_statement))
+    remove_sids = set(remove_sids)
+    return [
+            statement for statement in statements
+            if statement.get('Sid') not in remove_sids
+            ]
+
+
+def _get_bucket_policy(s3, bucket_name):
+    try:
+        return json.loads(s3.get_bucket_policy(Bucket=bucket_name)['Policy'])
+    except ClientError as e:
+        if e.response['Error'].get('Code') == 'NoSuchBucketPolicy':
+            return {'Version': '2012-10-17', 'Statement': []}
+        raise
+
+
+def update_s3_bucket_policy(
+        bucket_name, add=None, replace=None, remove_sids=None, max_attempts=3,
+        region='eu-central-1', aws_credentials=None
+        ):
+    """
+    Apply many policy statement changes to a bucket with a single read and
+    write. Added statements are merged into the existing statement with the
+    same Sid (or, without a Sid, the same effect, actions, resources and
+    conditions) by extending its AWS principals, account ids are written as
+    root ARNs like s3 stores them. The result is verified by reading the
+    policy again, and the update retried when a concurrent update
+    overwrote it.
+    :param bucket_name: string
+                        Name of the bucket resource
+    :param add: list
+                Statements to add, or to merge principals into
+    :param replace: list
+                    Statements replacing the ones with the same Sid, every
+                    one of them needs a Sid
+    :param remove_sids: list
+                        Sids of the statements to remove
+    :param max_attempts: int
+                         Number of read-modify-write attempts
+    :param region: string
+                   Region for the deployment
+    :param aws_credentials: object
+                            AWS credentials object
+    :return: dict
+             Status (UPDATED or UNCHANGED), number of Attempts and the
+             resulting Policy
+    """
+    add = _as_list(add)
+    replace = _as_list(replace)
+    remove_sids = _as_list(remove_sids)
+    s3 = get_boto3_client(
+            's3', region_name=region,
+            aws_credentials=aws_credentials
+            )
+
+    for attempt in range(1, max_attempts + 1):
+        current_policy = _get_bucket_policy(s3, bucket_name)
+        statements = _apply_policy_changes(
+                current_policy.get('Statement', []), add, replace, remove_sids
+                )
+        if _canonical_statements(statements) == _canonical_statements(
+                current_policy.get('Statement', [])
+                ):
+            return {
+                    'Status': 'UNCHANGED',
+                    'Attempts': attempt,
+                    'Policy': current_policy
+                    }
+        bucket_policy = {
+                'Version': current_policy.get('Version', '2012-10-17'),
+                'Statement': statements
+                }
+        if statements:
+            s3.put_bucket_policy(
+                    Bucket=bucket_name, Policy=json.dumps(bucket_policy)
+                    )
+        else:
+            s3.delete_bucket_policy(Bucket=bucket_name)
+
+        written = _get_bucket_policy(s3, bucket_name)
+        if _canonical_statements(written.get('Statement', [])) == \
+                _canonical_statements(statements):
+            return {
+                    'Status': 'UPDATED',
+                    'Attempts': attempt,
+                    'Policy': written
+                    }
+
+    raise RuntimeError(
+            f"{bucket_name} bucket policy was changed concurrently, the "
+            f"update couldn't be verified after {max_attempts} attempts"
+            )
+
+
+def update_s3_bucket_policies(
+        bucket_names, add=None, replace=None, remove_sids=None,
+        max_workers=8, region='eu-central-1', aws_credentials=None
+        ):
+    """
+    Apply the same policy statement changes to many buckets concurrently,
+    see update_s3_bucket_policy
+    :param bucket_names: list
+                         Names of the bucket resources
+    :param add: list
+                Statements to add, or to merge principals into
+    :param replace: list
+                    Statements replacing the ones with the same Sid
+    :param remove_sids: list
+                        Sids of the statements to remove
+    :param max_workers: int
+                        Maximum number of buckets updated at once
+    :param region: string
+                   Region for the deployment
+    :param aws_credentials: object
+                            AWS credentials object
+    :return: dict
+             Result per bucket name, with Status FAILED and the Error for
+             the buckets which couldn't be updated
+    """
+    def update(bucket_name):
+        try:
+            return update_s3_bucket_policy(
+                    bucket_name, add=add, replace=replace,
+                    remove_sids=remove_sids, region=region,
+                    aws_credentials=aws_credentials
+                    )
+        except Exception as e:
+            return {'Status': 'FAILED', 'Error': e}
+
+    bucket_names = list(dict.fromkeys(bucket_names))
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers
+            ) as executor:
+        return dict(zip(bucket_names, executor.map(update, bucket_names)))
+
+
+def _call_with_target(operation, aws_credentials, region_name, kwargs):
+    """
+    Call the operation with the credentials and the region, passed as
+    region_name or region depending on what the operation accepts
+    """
+    kwargs = dict(kwargs)
+    kwargs['aws_credentials'] = aws_credentials
+    parameters = inspect.signature(operation).parameters
+    if 'region_name' in parameters:
+        kwargs['region_name'] = region_name
+    elif 'region' in parameters:
+        kwargs['region'] = region_name
+    else:
+        kwargs['region_name'] = region_name
+    return operation(**kwargs)
+
+
+def run_for_accounts(
+        operation, targets, role_name=None, operation_kwargs=None,
+        max_workers=16, max_calls_per_second=None,
+        region_name='eu-central-1'
+        ):
+    """
+    Run the same operation against many accounts and regions concurrently,
+    e.g. run_for_accounts(trigger_glue_crawler, targets,
+    operation_kwargs={"gc_name": "crawler"}). The role of every account is
+    assumed once and its credentials refresh themselves, the clients are
+    reused through get_boto3_client.
+    :param operation: callable
+                      Function accepting aws_credentials and the region as
+                      region_name or region, like the helpers of this module
+    :param targets: list
+                    Account ids, or (account_id, role_name, region) tuples,
+                    or dicts with account_id, role_name and region keys.
+                    Every target must end up with an account id, a role and
+                    a region, otherwise ValueError is raised before any
+                    operation runs
+    :param role_name: string
+                      Role name for the targets without one
+    :param operation_kwargs: dict
+                             Additional arguments for the operation
+    :param max_workers: int
+                        Maximum number of concurrent operations
+    :param max_calls_per_second: float
+                                 Rate limit of the operations per account,
+                                 None for no limit
+    :param region_name: string
+                        Region for the targets without one
+    :return: dict
+             Results in target order with AccountId, RoleName, Region,
+             Status (SUCCEEDED or FAILED), Result, Error and Duration, the
+             Matrix of statuses by account and region, and Stats
+    """
+    operation_kwargs = operation_kwargs if operation_kwargs else {}
+    normalized = []
+    for target in targets:
+        if isinstance(target, dict):
+            normalized_target = (
+                    target.get('account_id'),
+                    target.get('role_name', role_name),
+                    target.get('region', region_name)
+                    )
+        elif isinstance(target, (tuple, list)):
+            if not 1 <= len(target) <= 3:
+                raise ValueError(
+                        f"Invalid target: {target!r}, expected "
+                        f"(account_id, role_name, region) with at least the "
+                        f"account id"
+                        )
+            normalized_target = \
+                tuple(target) + (role_name, region_name)[len(target) - 1:]
+        else:
+            normalized_target = (target, role_name, region_name)
+        account_id, target_role, target_region = normalized_target
+        if not account_id:
+            raise ValueError(f"Invalid target: {target!r}, no account id")
+        if not target_role:
+            raise ValueError(
+                    f"Invalid target: {target!r}, no role name and no "
+                    f"default role_name given"
+                    )
+        if not target_region:
+            raise ValueError(
+                    f"Invalid target: {target!r}, no region and no default "
+                    f"region_name given"
+                    )
+        normalized.append(normalized_target)
+
+    limiters = {}
+    if max_calls_per_second:
+        for account_id, _, _ in normalized:
+            limiters.setdefault(
+                    account_id, _RateLimiter(max_calls_per_second)
+                    )
+
+    def run(target):
+        account_id, target_role, target_region = target
+        started = time.monotonic()
+        result, error = None, None
+        try:
+            aws_credentials = get_refreshable_cross_account_credentials(
+                    account_id, target_role, region_name=target_region
+                    )
+            if account_id in limiters:
+                limiters[account_id].acquire()
+            result = _call_with_target(
+                    operation, aws_credentials, target_region,
+                    operation_kwargs
+                    )
+        except Exception as e:
+            error = e
+        return {
+                'AccountId': account_id,
+                'RoleName': target_role,
+                'Region': target_region,
+                'Status': 'FAILED' if error else 'SUCCEEDED',
+                'Result': result,
+                'Error': error,
+                'Duration': time.monotonic() - started
+                }
+
+    started = time.monotonic()
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers
+            ) as executor:
+        results = list(executor.map(run, normalized))
+
+    matrix = {}
+    for result in results:
+        matrix.setdefault(result['AccountId'], {})[result['Region']] = \
+            result['Status']
+    stats = {
+            'Count': len(results),
+            'Failed': sum(1 for result in results if result['Error']),
+            'Duration': time.monotonic() - started
+            }
+    stats.update(_get_latency_stats(
+            [result['Duration'] for result in results]
+            ))
+    return {'Results': results, 'Matrix': matrix, 'Stats': stats}
@@ -1,6 +1,7 @@
-import uuid
 from aws_cdk import aws_ec2 as ec2
 
+from pl_x_cdk_utils.helpers import find_or_create, get_logical_id
+
 
 def retrieve_vpc(construct, vpc_id, id=None):
     """
@@ -12,14 +13,20 @@ def retrieve_vpc(construct, vpc_id, id=None):
     vpc_id : string
              VPC id
     id : string
-         Logical id
+         Logical id, derived from the vpc id if not given. Repeated
+         lookups of the same id in a scope return the first one
 
     Returns
     -------
 
     """
-    id = id if id else f"ec2-vpc-profile-{uuid.uuid4()}"
-    vpc = ec2.Vpc.from_lookup(construct, id, vpc_id=vpc_id)
+    id = id if id else get_logical_id("ec2-vpc-profile", vpc_id)
+    vpc = find_or_create(
+            construct, id, f"vpc:{vpc_id}",
+            lambda scope, logical_id: ec2.Vpc.from_lookup(
+                    scope, logical_id, vpc_id=vpc_id
+                    )
+            )
     return vpc
 
 
@@ -35,12 +42,18 @@ def get_default_vpc(construct):
     """
     try:
         # First try to get the default VPC
-        vpc = ec2.Vpc.from_lookup(
+        vpc = find_or_create(
             construct,
             "default-vpc",
-            is_default=True,
+            "vpc:default",
+            lambda scope, logical_id: ec2.Vpc.from_lookup(
+                scope, logical_id, is_default=True
+            ),
         )
         return vpc
+    except ValueError:
+        # the id is taken by another lookup, not a missing default VPC
+        raise
     except Exception:
         # If default VPC doesn't exist, create a new VPC
         # This is a fallback for accounts where default VPC was deleted
@@ -53,11 +66,12 @@ def get_default_vpc(construct):
         return vpc
 
 
-def get_subnets(construct, vpc_id, subnet_type="public"):
+def get_subnets(construct, vpc_id, subnet_type="public", vpc=None):
     """
-    Get the subnets for the VPC
+    Get the subnets for the VPC, vpc is used instead of looking up vpc_id
+    again when given
     """
-    vpc = retrieve_vpc(construct, vpc_id)
+    vpc = vpc if vpc else retrieve_vpc(construct, vpc_id)
     if subnet_type == "public":
         return vpc.public_subnets
     elif subnet_type == "private":
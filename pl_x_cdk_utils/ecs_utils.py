@@ -1,6 +1,6 @@
-import uuid
 from aws_cdk import aws_ecs as ecs
 
+from .helpers import get_unique_logical_id
 from .logs_utils import create_log_group
 
 
@@ -22,7 +22,9 @@ def get_ecs_cluster(construct, id=None, cluster_name=None, vpc=None):
     -------
 
     """
-    id = id if id else f"ecs-cluster-profile-{uuid.uuid4()}"
+    id = id if id else get_unique_logical_id(
+            construct, "ecs-cluster-profile", cluster_name, vpc
+            )
     ecs_cluster = ecs.Cluster(construct, id=id,
                               cluster_name=cluster_name, vpc=vpc)
     return ecs_cluster
@@ -52,7 +54,10 @@ def get_fargate_task_definition(construct, family=None,
     -------
 
     """
-    id = id if id else f"ecs-fargate-task-profile-{uuid.uuid4()}"
+    id = id if id else get_unique_logical_id(
+            construct, "ecs-fargate-task-profile",
+            family, memory_limit_mib, cpu, task_role
+            )
     task_definition = ecs.FargateTaskDefinition(
             construct, id, family=family,
             memory_limit_mib=memory_limit_mib, cpu=cpu, task_role=task_role
@@ -79,7 +84,10 @@ def get_capacity_provider(construct, autoscaling_group, id=None,
     -------
 
     """
-    id = id if id else f"ecs-capacity-provider-profile-{uuid.uuid4()}"
+    id = id if id else get_unique_logical_id(
+            construct, "ecs-capacity-provider-profile",
+            autoscaling_group, capacity_provider_name
+            )
     capacity_provider = ecs.AsgCapacityProvider(
             construct, id,
             auto_scaling_group=autoscaling_group,
@@ -1,14 +1,6 @@
 from aws_cdk.aws_kinesisfirehose import CfnDeliveryStream as Firehose
 
-
-dynamic_output_path = (
-    "/year=!{timestamp:yyyy}/month=!{timestamp:MM}/!"
-    "{timestamp:dd}_rand=!{firehose:random-string}"
-)
-dynamic_error_path = (
-    "_failures/!{firehose:error-output-type}/year=!"
-    "{timestamp:yyyy}/month=!{timestamp:MM}/!{timestamp:dd}"
-)
+from pl_x_cdk_utils.helpers import dynamic_error_path, dynamic_output_path
 
 
 def get_delivery_stream_for_s3_destination(construct, name, config, id=None):
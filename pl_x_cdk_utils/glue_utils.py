@@ -141,7 +141,7 @@ def create_glue_table(
 def prepare_glue_table_columns(
     col_details,
     struct_cols={},
-    key_type=glue.Schema.STRING,
+    key_type=None,
     input_string="",
     is_primitive=False,
 ):
@@ -152,7 +152,8 @@ def prepare_glue_table_columns(
     :param struct_cols: dict
                         More Columns to be added for struct data type (name and type)
     :param key_type: glue Schema Object
-                        Optional field for map column schema type
+                        Optional field for map column schema type, string
+                        if not given
     :param input_string: string
                         Glue InputString for map/array type
     :param is_primitive: boolean
@@ -184,7 +185,9 @@ def prepare_glue_table_columns(
             )
         elif col_type.lower() in "map":
             temp["type"] = glue.Schema.map(
-                key_type=key_type, input_string=input_string, is_primitive=is_primitive
+                key_type=key_type if key_type else glue.Schema.STRING,
+                input_string=input_string,
+                is_primitive=is_primitive,
             )
         elif col_type.lower() in "array":
             temp["type"] = glue.Schema.array(
@@ -232,11 +235,11 @@ def create_glue_python_etl_job(
     glue_role: iam.Role,
     default_arguments: dict = {},
     spark_ui_enabled: bool = True,
-    glue_version: glue.GlueVersion = glue.GlueVersion.V3_0,
+    glue_version: glue.GlueVersion = None,
     tags: dict = {},
     worker_count: int = 2,
-    worker_type: glue.WorkerType = glue.WorkerType.G_1_X,
-    timeout: cdk.Duration = cdk.Duration.minutes(60),
+    worker_type: glue.WorkerType = None,
+    timeout: cdk.Duration = None,
 ) -> glue.Job:
     """Create glue Python etl job.
 
@@ -250,15 +253,18 @@ def create_glue_python_etl_job(
         glue_role (iam.Role): role for glue job
         default_arguments (dict): default arguments for glue job
         spark_ui_enabled (bool): flag to enable/disable spark ui
-        glue_version (glue.GlueVersion): glue version
+        glue_version (glue.GlueVersion): glue version, 3.0 if not given
         tags (dict): tags configuration
         worker_count (int): glue job worker count
-        worker_type (glue.WorkerType): job worker type
-        timeout (cdk.Duration): timeout duration
+        worker_type (glue.WorkerType): job worker type, G.1X if not given
+        timeout (cdk.Duration): timeout duration, 60 minutes if not given
 
     Returns:
         glue.Job: create glue job object
     """
+    glue_version = glue_version if glue_version else glue.GlueVersion.V3_0
+    worker_type = worker_type if worker_type else glue.WorkerType.G_1_X
+    timeout = timeout if timeout else cdk.Duration.minutes(60)
     job = glue.Job(
         construct,
         f"{job_name}_{id}",
@@ -1,4 +1,23 @@
+import datetime
 import os
+import re
+
+dynamic_output_path = (
+    "/year=!{timestamp:yyyy}/month=!{timestamp:MM}/!"
+    "{timestamp:dd}_rand=!{firehose:random-string}"
+)
+dynamic_error_path = (
+    "_failures/!{firehose:error-output-type}/year=!"
+    "{timestamp:yyyy}/month=!{timestamp:MM}/!{timestamp:dd}"
+)
+
+_FIREHOSE_PLACEHOLDER = re.compile(r"!\{(\w+):([^}]+)\}")
+_FIREHOSE_TIMESTAMP_FORMATS = {
+    "yyyy": "%Y",
+    "MM": "%m",
+    "dd": "%d",
+    "HH": "%H",
+}
 
 
 def prepare_arg_for_jar_step(
@@ -79,3 +98,192 @@ def check_policy_statement_syntax(policy_statements):
             mal_statements.append(statement)
         current_sids.append(statement["Sid"])
     return valid_principal, working_statements, mal_statements, current_sids
+
+
+def render_partition_prefix(template: str, timestamp: datetime.datetime) -> str:
+    """Render a firehose style partition template for a timestamp.
+
+    Rendering stops at the first placeholder that can't be derived from the
+    timestamp (e.g. !{firehose:random-string}), so the result is the longest
+    S3 prefix shared by every object written for that timestamp.
+
+    Args:
+        template (str): partition template, e.g. dynamic_output_path
+        timestamp (datetime.datetime): timestamp of the partition
+
+    Returns:
+        str: rendered prefix
+    """
+    rendered = []
+    position = 0
+    for match in _FIREHOSE_PLACEHOLDER.finditer(template):
+        rendered.append(template[position:match.start()])
+        namespace, pattern = match.groups()
+        if namespace != "timestamp":
+            return "".join(rendered)
+        for token, directive in _FIREHOSE_TIMESTAMP_FORMATS.items():
+            pattern = pattern.replace(token, directive)
+        rendered.append(timestamp.strftime(pattern))
+        position = match.end()
+    rendered.append(template[position:])
+
+    return "".join(rendered)
+
+
+def get_partition_prefixes_for_date_range(
+    prefix: str,
+    start: datetime.datetime,
+    end: datetime.datetime,
+    template: str = dynamic_output_path,
+    predicate=None,
+) -> list:
+    """Enumerate the partition prefixes between two timestamps.
+
+    Args:
+        prefix (str): base path the template is appended to
+        start (datetime.datetime): first timestamp, inclusive
+        end (datetime.datetime): last timestamp, inclusive
+        template (str): firehose style partition template
+        predicate (callable, optional): filter called with each candidate
+        timestamp, only the ones it returns True for are kept
+
+    Returns:
+        list: distinct prefixes in chronological order
+    """
+    if not isinstance(start, datetime.datetime):
+        start = datetime.datetime.combine(start, datetime.time.min)
+    if not isinstance(end, datetime.datetime):
+        end = datetime.datetime.combine(end, datetime.time.max)
+    hourly = "HH" in template
+    step = datetime.timedelta(hours=1) if hourly else datetime.timedelta(days=1)
+    current = (
+        start.replace(minute=0, second=0, microsecond=0)
+        if hourly
+        else start.replace(hour=0, minute=0, second=0, microsecond=0)
+    )
+
+    prefixes = []
+    seen = set()
+    while current <= end:
+        if predicate is None or predicate(current):
+            partition = prefix + render_partition_prefix(template, current)
+            if partition not in seen:
+                seen.add(partition)
+                prefixes.append(partition)
+        current += step
+
+    return prefixes
+
+
+def _describe_for_id(value):
+    # constructs are described by their path, jsii objects by their string
+    # form, never by repr which holds the memory address
+    node = getattr(value, "node", None)
+    if node is not None and hasattr(node, "path"):
+        return node.path
+    if hasattr(value, "to_string"):
+        return value.to_string()
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [_describe_for_id(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): _describe_for_id(item) for key, item in value.items()}
+    return type(value).__name__
+
+
+def get_logical_id(prefix: str, *parts) -> str:
+    """Build a logical id derived from the content of a construct.
+
+    The same arguments give the same id on every synth, so the template
+    stays stable between deploys.
+
+    Args:
+        prefix (str): readable start of the id, e.g. "ec2-vpc-profile"
+        *parts: values the construct is built from, constructs are taken
+        by their path
+
+    Returns:
+        str: prefix followed by a short hash of the parts
+    """
+    # imported here to keep helpers cheap to import for runtime code
+    import hashlib
+    import json
+
+    content = json.dumps(
+        [_describe_for_id(part) for part in parts], sort_keys=True, default=str
+    )
+    digest = hashlib.sha256(content.encode("utf-8")).hexdigest()[:12]
+
+    return f"{prefix}-{digest}"
+
+
+def get_unique_logical_id(construct, prefix: str, *parts) -> str:
+    """Content derived logical id that is still free in the scope.
+
+    Identical arguments in the same scope get a numbered suffix in the
+    order of the calls, e.g. "-2", instead of clashing.
+
+    Args:
+        construct (Construct): scope the construct is created in
+        prefix (str): readable start of the id
+        *parts: values the construct is built from
+
+    Returns:
+        str: logical id not used by another child of the scope
+    """
+    logical_id = get_logical_id(prefix, *parts)
+    candidate = logical_id
+    counter = 1
+    while construct.node.try_find_child(candidate) is not None:
+        counter += 1
+        candidate = f"{logical_id}-{counter}"
+
+    return candidate
+
+
+_LOOKUP_REGISTRY_ATTRIBUTE = "_pl_x_cdk_utils_lookups"
+
+
+def find_or_create(construct, logical_id: str, lookup: str, create):
+    """Return the construct of an identical lookup in the scope or create it.
+
+    Makes lookups (from_lookup, from_*_arn, ...) memoized per scope. The
+    lookups are recorded in a plain attribute of the scope object, nothing
+    is added to the construct tree. A second call with the same id and
+    lookup returns the construct of the first one, the same id used for
+    anything else raises.
+
+    Args:
+        construct (Construct): scope of the construct
+        logical_id (str): logical id of the construct
+        lookup (str): what is looked up, e.g. "bucket:<name>", calls with
+        the same lookup are identical
+        create (callable): called with the scope and the id when the
+        scope has no such child yet
+
+    Returns:
+        Construct: existing or new construct
+
+    Raises:
+        ValueError: the logical id is used by a different construct
+    """
+    registry = construct.__dict__.setdefault(_LOOKUP_REGISTRY_ATTRIBUTE, {})
+    if logical_id in registry:
+        registered, existing = registry[logical_id]
+        if registered != lookup:
+            raise ValueError(
+                f"{logical_id} is already used in {construct.node.path} by "
+                f"{registered}, not by {lookup}"
+            )
+        return existing
+    if construct.node.try_find_child(logical_id) is not None:
+        raise ValueError(
+            f"{logical_id} is already used in {construct.node.path} by "
+            f"another construct, not by {lookup}"
+        )
+
+    created = create(construct, logical_id)
+    registry[logical_id] = (lookup, created)
+
+    return created
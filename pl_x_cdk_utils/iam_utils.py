@@ -1,5 +1,7 @@
 from aws_cdk import aws_iam as iam
 
+from pl_x_cdk_utils.helpers import find_or_create
+
 
 def get_policy_statement(actions, resources=["*"]):
     """
@@ -70,13 +72,16 @@ def get_role_from_arn(
     instance_profile=False,
 ):
     """
-    Get role object from the arn with given role name
+    Get role object from the arn with given role name, the same lookup in
+    the same scope returns the existing object
     :param construct: object
                       Stack Scope
     :param role_name: string
                       IAM role name
     :param id: string
-                logical id of the cdk construct
+                logical id of the cdk construct, profile-for-role-<name>
+                by default for roles and instance profiles alike, looking
+                up both for the same name in a scope needs an explicit id
     :return: object
              IAM role object
     """
@@ -87,7 +92,14 @@ def get_role_from_arn(
     else:
         role_arn = f"arn:aws:iam::{construct.account}:role/{role_name}"
 
-    role = iam.Role.from_role_arn(construct, param_id, role_arn=role_arn)
+    role = find_or_create(
+        construct,
+        param_id,
+        f"role:{role_arn}",
+        lambda scope, logical_id: iam.Role.from_role_arn(
+            scope, logical_id, role_arn=role_arn
+        ),
+    )
 
     return role
 
@@ -1,5 +1,7 @@
 from aws_cdk import Duration, aws_lambda as _lambda
 
+from pl_x_cdk_utils.helpers import find_or_create
+
 
 def implement_lambda_function(
     construct,
@@ -107,7 +109,8 @@ def implement_lambda_layer(
 
 def get_layer_from_arn(construct, layer_name, version, id=None):
     """
-    Get lambda layer by ARN
+    Get lambda layer by ARN, the same lookup in the same scope returns the
+    existing object
     :param construct: object
                       Stack Scope
     :param layer_name: string
@@ -120,18 +123,24 @@ def get_layer_from_arn(construct, layer_name, version, id=None):
              Lambda layer object
     """
     param_id = id if id else f"profile-for-lambda-layer-{layer_name}"
-    lambda_layer = _lambda.LayerVersion.from_layer_version_arn(
+    lambda_layer = find_or_create(
         construct,
         param_id,
-        f"arn:aws:lambda:{construct.region}:{construct.account}:layer"
-        f":{layer_name}:{version}",
+        f"layer:{layer_name}:{version}",
+        lambda scope, logical_id: _lambda.LayerVersion.from_layer_version_arn(
+            scope,
+            logical_id,
+            f"arn:aws:lambda:{construct.region}:{construct.account}:layer"
+            f":{layer_name}:{version}",
+        ),
     )
     return lambda_layer
 
 
 def get_lambda_from_arn(construct, function_name, id=None):
     """
-    Get lambda function by ARN
+    Get lambda function by ARN, the same lookup in the same scope returns
+    the existing object
     :param construct: object
                       Stack Scope
     :param function_name: string
@@ -142,9 +151,15 @@ def get_lambda_from_arn(construct, function_name, id=None):
              Lambda function object
     """
     param_id = id if id else f"profile-for-lambda-function-{function_name}"
-    lambda_function = _lambda.Function.from_function_arn(
+    lambda_function = find_or_create(
         construct,
         param_id,
-        f"arn:aws:lambda:{construct.region}:{construct.account}:function:{function_name}",
+        f"function:{function_name}",
+        lambda scope, logical_id: _lambda.Function.from_function_arn(
+            scope,
+            logical_id,
+            f"arn:aws:lambda:{construct.region}:{construct.account}"
+            f":function:{function_name}",
+        ),
     )
     return lambda_function
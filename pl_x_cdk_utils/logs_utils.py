@@ -4,6 +4,8 @@ from aws_cdk import (
     aws_logs_destinations as destinations
 )
 
+from pl_x_cdk_utils.helpers import find_or_create
+
 
 def create_log_group(construct, name, id=None,
                      removal_policy=RemovalPolicy.DESTROY):
@@ -30,7 +32,8 @@ def create_log_group(construct, name, id=None,
 
 def get_log_group_from_name(construct, name, id=None):
     """
-    get log group with given name
+    get log group with given name, the same lookup in the same scope returns
+    the existing object
     :param construct: object
                       Stack Scope
     :param name: string
@@ -41,8 +44,13 @@ def get_log_group_from_name(construct, name, id=None):
              AWS CDK log group object
     """
     param_id = id if id else f"profile-for-log-{name}"
-    log_group = logs.LogGroup.from_log_group_name(
-        construct, param_id, log_group_name=name
+    log_group = find_or_create(
+        construct,
+        param_id,
+        f"log-group:{name}",
+        lambda scope, logical_id: logs.LogGroup.from_log_group_name(
+            scope, logical_id, log_group_name=name
+        ),
     )
 
     return log_group
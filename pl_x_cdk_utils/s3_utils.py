@@ -1,9 +1,12 @@
 from aws_cdk import aws_s3 as s3
 
+from pl_x_cdk_utils.helpers import find_or_create
+
 
 def get_bucket_object_from_name(construct, bucket_name, id=None):
     """
-    Get bucket object with provided bucket name
+    Get bucket object with provided bucket name, the same lookup in the same
+    scope returns the existing object
     :param construct: object
                       Stack Scope
     :param bucket_name: string
@@ -14,7 +17,14 @@ def get_bucket_object_from_name(construct, bucket_name, id=None):
              Bucket object
     """
     param_id = id if id else f"profile-for-bucket-{bucket_name}"
-    bucket_object = s3.Bucket.from_bucket_name(construct, param_id, bucket_name)
+    bucket_object = find_or_create(
+        construct,
+        param_id,
+        f"bucket:{bucket_name}",
+        lambda scope, logical_id: s3.Bucket.from_bucket_name(
+            scope, logical_id, bucket_name
+        ),
+    )
     return bucket_object
 
 
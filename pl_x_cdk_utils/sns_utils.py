@@ -1,5 +1,7 @@
 from aws_cdk import aws_sns as sns
 
+from pl_x_cdk_utils.helpers import find_or_create
+
 
 def get_sns_topic(
     construct, topic_name, display_name="Subscription Topic", fifo=False, id=None
@@ -46,10 +48,16 @@ def get_sns_topic_from_arn(construct, topic_name, id=None):
     SNS topic object
     """
     param_id = id if id else f"Topic{topic_name}"
-    topic = sns.Topic.from_topic_arn(
+    topic = find_or_create(
         construct,
-        id=param_id,
-        topic_arn=f"arn:aws:sns:{construct.region}:{construct.account}:{topic_name}",
+        param_id,
+        f"topic:{topic_name}",
+        lambda scope, logical_id: sns.Topic.from_topic_arn(
+            scope,
+            id=logical_id,
+            topic_arn=f"arn:aws:sns:{construct.region}:{construct.account}"
+            f":{topic_name}",
+        ),
     )
 
     return topic
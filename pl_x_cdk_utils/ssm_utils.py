@@ -2,6 +2,8 @@ from aws_cdk import (
     aws_ssm as ssm,
 )
 
+from pl_x_cdk_utils.helpers import find_or_create
+
 
 def put_ssm_string_parameter(
     construct,
@@ -49,7 +51,8 @@ def retrieve_ssm_string_parameter_value(
     construct, parameter_name, parameter=False, id=None
 ):
     """
-
+    Retrieve SSM string parameter, the same lookup in the same scope reuses
+    the existing parameter object
     :param construct: object
                       Stack Scope
     :param parameter_name: string
@@ -62,19 +65,20 @@ def retrieve_ssm_string_parameter_value(
              AWS SSM parameter token object used as string during synth
     """
     param_id = id if id else f"profile-for-ssm-retrieve-{parameter_name}"
-    val = (
-        ssm.StringParameter.from_string_parameter_attributes(
-            construct,
-            param_id,
-            parameter_name=parameter_name,
-        )
-        if parameter
-        else ssm.StringParameter.from_string_parameter_attributes(
-            construct,
-            f"profile-for-ssm-retrieve-{parameter_name}",
-            parameter_name=parameter_name,
-        ).string_value
+    # the parameter object and its value share one lookup per scope
+    ssm_parameter = find_or_create(
+        construct,
+        param_id,
+        f"string-parameter:{parameter_name}",
+        lambda scope, logical_id: (
+            ssm.StringParameter.from_string_parameter_attributes(
+                scope,
+                logical_id,
+                parameter_name=parameter_name,
+            )
+        ),
     )
+    val = ssm_parameter if parameter else ssm_parameter.string_value
 
     return val
 
@@ -25,14 +25,137 @@ def get_parallel_step(next_state=None, catch=None, branches={}):
     return parallel_state
 
 
-def get_map_state(iteration_step, next_state=None, catch=None,
-                  items_path="$.args", max_con=100, map_result="$.map"):
-    map_json = {
-        "Type": "Map",
-        "ItemsPath": items_path,
-        "Iterator": iteration_step,
-        "ResultPath": map_result if map_result else None
+DISTRIBUTED_MAP_MAX_CONCURRENCY = 10000
+ITEM_READER_INPUT_TYPES = {
+    "csv": "CSV",
+    "json": "JSON",
+    "jsonl": "JSONL",
+    "manifest": "MANIFEST",
+}
+
+
+def _get_path_param(params, key, value):
+    # values starting with $ are read from the state input
+    if isinstance(value, str) and value.startswith("$"):
+        params[f"{key}.$"] = value
+    else:
+        params[key] = value
+
+
+def get_item_reader(bucket, key=None, prefix=None, input_type=None,
+                    csv_headers=None, max_items=None):
+    if input_type is None:
+        # listing of the objects under the prefix, one item per object
+        item_reader = {
+            "Resource": "arn:aws:states:::s3:listObjectsV2",
+            "Parameters": {}
+        }
+        _get_path_param(item_reader["Parameters"], "Bucket", bucket)
+        if prefix:
+            _get_path_param(item_reader["Parameters"], "Prefix", prefix)
+        reader_config = {}
+    else:
+        if input_type not in ITEM_READER_INPUT_TYPES:
+            raise ValueError(f"Invalid item reader input type: {input_type}")
+        if not key:
+            raise ValueError(f"key is required for the {input_type} input type")
+        item_reader = {
+            "Resource": "arn:aws:states:::s3:getObject",
+            "Parameters": {}
+        }
+        _get_path_param(item_reader["Parameters"], "Bucket", bucket)
+        _get_path_param(item_reader["Parameters"], "Key", key)
+        reader_config = {"InputType": ITEM_READER_INPUT_TYPES[input_type]}
+        if input_type == "csv":
+            if csv_headers:
+                reader_config["CSVHeaderLocation"] = "GIVEN"
+                reader_config["CSVHeaders"] = csv_headers
+            else:
+                reader_config["CSVHeaderLocation"] = "FIRST_ROW"
+    if max_items:
+        reader_config["MaxItems"] = max_items
+    if reader_config:
+        item_reader["ReaderConfig"] = reader_config
+
+    return item_reader
+
+
+def get_item_batcher(max_items_per_batch=None, max_input_bytes_per_batch=None,
+                     batch_input=None):
+    item_batcher = {}
+    if max_items_per_batch:
+        item_batcher["MaxItemsPerBatch"] = max_items_per_batch
+    if max_input_bytes_per_batch:
+        item_batcher["MaxInputBytesPerBatch"] = max_input_bytes_per_batch
+    if batch_input:
+        item_batcher["BatchInput"] = batch_input
+
+    return item_batcher
+
+
+def get_result_writer(bucket, prefix=None):
+    result_writer = {
+        "Resource": "arn:aws:states:::s3:putObject",
+        "Parameters": {}
     }
+    _get_path_param(result_writer["Parameters"], "Bucket", bucket)
+    if prefix:
+        _get_path_param(result_writer["Parameters"], "Prefix", prefix)
+
+    return result_writer
+
+
+def get_map_state(iteration_step, next_state=None, catch=None,
+                  items_path="$.args", max_con=None, map_result="$.map",
+                  distributed=False, execution_type="EXPRESS",
+                  item_reader=None, item_batcher=None, result_writer=None,
+                  item_selector=None, tolerated_failure_percentage=None,
+                  tolerated_failure_count=None, label=None):
+    if max_con is None:
+        # 100 inline, the 10,000 child executions of the service distributed
+        max_con = DISTRIBUTED_MAP_MAX_CONCURRENCY if distributed else 100
+    if distributed:
+        if not iteration_step:
+            raise ValueError("iteration_step is required for a distributed map")
+        if max_con and max_con > DISTRIBUTED_MAP_MAX_CONCURRENCY:
+            raise ValueError(
+                f"max_con can't exceed {DISTRIBUTED_MAP_MAX_CONCURRENCY}")
+        # child workflow executions instead of the inline iterator
+        map_json = {
+            "Type": "Map",
+            "ItemProcessor": {
+                "ProcessorConfig": {
+                    "Mode": "DISTRIBUTED",
+                    "ExecutionType": execution_type
+                },
+                **iteration_step
+            },
+            "ResultPath": map_result if map_result else None
+        }
+        if item_reader:
+            map_json["ItemReader"] = item_reader
+        else:
+            map_json["ItemsPath"] = items_path
+        if item_batcher:
+            map_json["ItemBatcher"] = item_batcher
+        if result_writer:
+            map_json["ResultWriter"] = result_writer
+        if item_selector:
+            map_json["ItemSelector"] = item_selector
+        if tolerated_failure_percentage is not None:
+            map_json["ToleratedFailurePercentage"] = \
+                tolerated_failure_percentage
+        if tolerated_failure_count is not None:
+            map_json["ToleratedFailureCount"] = tolerated_failure_count
+        if label:
+            map_json["Label"] = label
+    else:
+        map_json = {
+            "Type": "Map",
+            "ItemsPath": items_path,
+            "Iterator": iteration_step,
+            "ResultPath": map_result if map_result else None
+        }
     if max_con:
         map_json['MaxConcurrency'] = max_con
     if next_state:
@@ -1,6 +1,8 @@
 from aws_cdk import (
+    ArnFormat,
     Duration,
     Stack,
+    aws_iam as iam,
     aws_ecs as ecs,
     aws_stepfunctions as sfn,
     aws_stepfunctions_tasks as sfn_tasks,
@@ -14,6 +16,10 @@ from aws_cdk.aws_stepfunctions_tasks import (
 
 from pl_x_cdk_utils.helpers import prepare_s3_path
 from pl_x_cdk_utils.logs_utils import create_log_group
+from pl_x_cdk_utils.step_function_json_utils import (
+    DISTRIBUTED_MAP_MAX_CONCURRENCY,
+    get_map_state as get_map_state_json,
+)
 
 
 def deploy_state_machine(
@@ -25,6 +31,9 @@ def deploy_state_machine(
     log_group=None,
     log_level=sfn.LogLevel.ALL,
     timeout=None,
+    distributed_map=False,
+    item_reader_bucket=None,
+    result_writer_bucket=None,
 ):
     """
      Deploy state machine
@@ -42,6 +51,15 @@ def deploy_state_machine(
                        Log object
      :param log_level: object
                        Log level object
+     :param distributed_map: bool
+                             The definition has a distributed map, grants
+                             the role what it needs, see grant_distributed_map
+     :param item_reader_bucket: object
+                                Bucket the distributed map reads its items
+                                from
+     :param result_writer_bucket: object
+                                  Bucket the distributed map writes its
+                                  results to
     :return: object
              State machine object
     """
@@ -70,9 +88,93 @@ def deploy_state_machine(
             logs=sfn.LogOptions(destination=log_group, level=log_level),
             timeout=timeout,
         )
+    if distributed_map or item_reader_bucket or result_writer_bucket:
+        grant_distributed_map(
+            construct,
+            state_machine,
+            name,
+            item_reader_bucket=item_reader_bucket,
+            result_writer_bucket=result_writer_bucket,
+        )
     return state_machine
 
 
+def grant_distributed_map(
+    construct,
+    state_machine,
+    name,
+    item_reader_bucket=None,
+    result_writer_bucket=None,
+):
+    """
+    Grant the role of a state machine what its distributed map states need.
+    A distributed map is a CustomState, cdk adds nothing for it. The tasks
+    of the item_processor run with the same role, their permissions still
+    have to be granted by the caller.
+    :param construct: object
+                      Stack Scope
+    :param state_machine: object
+                          State machine object
+    :param name: string
+                 Name of the state machine, the arn is built from it to
+                 avoid a circular dependency with the role
+    :param item_reader_bucket: object
+                               Bucket of the ItemReader, s3:ListBucket and
+                               s3:GetObject are granted on it
+    :param result_writer_bucket: object
+                                 Bucket of the ResultWriter, s3:PutObject is
+                                 granted on it
+    """
+    stack = Stack.of(construct)
+    state_machine.add_to_role_policy(
+        iam.PolicyStatement(
+            actions=["states:StartExecution"],
+            resources=[
+                stack.format_arn(
+                    service="states",
+                    resource="stateMachine",
+                    resource_name=name,
+                    arn_format=ArnFormat.COLON_RESOURCE_NAME,
+                )
+            ],
+        )
+    )
+    # the child executions of the map runs
+    state_machine.add_to_role_policy(
+        iam.PolicyStatement(
+            actions=["states:DescribeExecution", "states:StopExecution"],
+            resources=[
+                stack.format_arn(
+                    service="states",
+                    resource="execution",
+                    resource_name=f"{name}/*",
+                    arn_format=ArnFormat.COLON_RESOURCE_NAME,
+                )
+            ],
+        )
+    )
+    if item_reader_bucket:
+        state_machine.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["s3:ListBucket"],
+                resources=[item_reader_bucket.bucket_arn],
+            )
+        )
+        state_machine.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["s3:GetObject"],
+                resources=[item_reader_bucket.arn_for_objects("*")],
+            )
+        )
+    if result_writer_bucket:
+        state_machine.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["s3:PutObject"],
+                resources=[result_writer_bucket.arn_for_objects("*")],
+            )
+        )
+
+
 def get_state_machine_from_arn(construct, state_machine_name, id=None):
     """
     Get state machine by ARN
@@ -213,9 +315,7 @@ def run_ecs_task(
     state_name,
     cluster,
     task_definition,
-    launch_target=sfn_tasks.EcsFargateLaunchTarget(
-        platform_version=ecs.FargatePlatformVersion.LATEST
-    ),
+    launch_target=None,
     container_overrides=None,
     timeout=None,
     integration_pattern=None,
@@ -242,7 +342,8 @@ def run_ecs_task(
     task_definition : object
               Task definition object for ECS Task
     launch_target: object
-               Target object for the ECS task
+               Target object for the ECS task, Fargate on the latest
+               platform version if not given
     container_overrides: List of objects
                         List of container attributes for the task
     timeout: object
@@ -272,6 +373,13 @@ def run_ecs_task(
     -------
     State object
     """
+    launch_target = (
+        launch_target
+        if launch_target
+        else sfn_tasks.EcsFargateLaunchTarget(
+            platform_version=ecs.FargatePlatformVersion.LATEST
+        )
+    )
 
     invoke_ecs_task_step = sfn_tasks.EcsRunTask(
         construct,
@@ -349,12 +457,19 @@ def get_map_state(
     items_path="$.args",
     input_path="$",
     result_path="$.map_resp",
-    max_concurrency=6,
+    max_concurrency=None,
     parameters={},
     result_selector={},
+    distributed=False,
+    item_processor=None,
+    item_reader=None,
+    item_batcher=None,
+    result_writer=None,
+    tolerated_failure_percentage=None,
+    execution_type="EXPRESS",
 ):
     """
-    Get map state
+    Get map state, inline or distributed
     Parameters
     ----------
     construct : object
@@ -368,15 +483,64 @@ def get_map_state(
     result_path : string
                  Result path for the result after the trigger
     max_concurrency : int
-                      Max concurrent calls over the iterations
+                      Max concurrent calls over the iterations, 6 inline
+                      and 10,000 distributed by default
     parameters : dict
                 Parameters for the map state
     result_selector : dict
                 Selector for the map state's output
+    distributed : bool
+                  Run the iterations as child workflow executions, up to
+                  10,000 in parallel
+    item_processor : dict
+                     ASL with StartAt and States run for each item, required
+                     for distributed
+    item_reader : dict
+                  Items read from S3 instead of items_path, see
+                  step_function_json_utils.get_item_reader
+    item_batcher : dict
+                   Batching of the items, see
+                   step_function_json_utils.get_item_batcher
+    result_writer : dict
+                    S3 destination of the results, see
+                    step_function_json_utils.get_result_writer
+    tolerated_failure_percentage : int
+                                   Failed items allowed before the map fails
+    execution_type : string
+                     EXPRESS or STANDARD child executions
     Returns
     -------
-    State object
+    State object, a CustomState for distributed. cdk grants nothing for
+    it, deploy the state machine with distributed_map=True and the item
+    reader and result writer buckets, the tasks of item_processor need
+    their own grants
     """
+    if max_concurrency is None:
+        max_concurrency = DISTRIBUTED_MAP_MAX_CONCURRENCY if distributed else 6
+    if distributed:
+        if not item_processor:
+            raise ValueError("item_processor is required for a distributed map")
+        # no distributed map construct in this cdk version
+        state_json = get_map_state_json(
+            item_processor,
+            items_path=items_path,
+            max_con=max_concurrency,
+            map_result=result_path,
+            distributed=True,
+            execution_type=execution_type,
+            item_reader=item_reader,
+            item_batcher=item_batcher,
+            result_writer=result_writer,
+            item_selector=parameters,
+            tolerated_failure_percentage=tolerated_failure_percentage,
+        )
+        # next and end are rendered by the state machine
+        state_json.pop("End")
+        state_json["InputPath"] = input_path
+        if result_selector:
+            state_json["ResultSelector"] = result_selector
+        return sfn.CustomState(construct, state_name, state_json=state_json)
+
     state = sfn.Map(
         construct,
         state_name,
@@ -5,17 +5,24 @@ NAME = "pl_x_cdk_utils"
 DESCRIPTION = "Public VNR package with AWS-CDK built in functions and " \
               "boto3 helpers"
 URL = "https://github.com/vnrag/pl-x-cdk-utils"
-VERSION = "0.1.1"
+VERSION = "0.2.0"
 REQUIRES_PYTHON = ">=3.8.0"
 
-# Packages required
+# Packages required, boto3_utils and helpers only need these
 REQUIRED = [
         "boto3",
-        "aws-cdk-lib==2.21.1",
-        "constructs>=10.0.0,<11.0.0",
-        "aws_cdk.aws_glue_alpha",
         ]
 
+# Packages for the CDK modules, lambda layers can leave them out
+EXTRAS = {
+        "cdk": [
+                "aws-cdk-lib==2.21.1",
+                "constructs>=10.0.0,<11.0.0",
+                "aws_cdk.aws_glue_alpha",
+                ],
+        }
+EXTRAS["all"] = EXTRAS["cdk"]
+
 setup(
         name=NAME,
         version=VERSION,
@@ -25,8 +32,9 @@ setup(
         python_requires=REQUIRES_PYTHON,
         url=URL,
         license="MIT",
-        packages=find_packages(exclude=("test",)),
+        packages=find_packages(exclude=("test", "tests", "tests.*")),
         install_requires=REQUIRED,
+        extras_require=EXTRAS,
         include_package_data=True,
         classifiers=[
                 "Programming Language :: Python :: 3.9",
@@ -0,0 +1,49 @@
+import pytest
+
+from pl_x_cdk_utils import boto3_utils
+
+REGION = "eu-central-1"
+
+
+@pytest.fixture
+def aws(monkeypatch):
+    """Mocked AWS account with fresh module caches"""
+    moto = pytest.importorskip("moto")
+    for name, value in {
+        "AWS_ACCESS_KEY_ID": "testing",
+        "AWS_SECRET_ACCESS_KEY": "testing",
+        "AWS_SESSION_TOKEN": "testing",
+        "AWS_DEFAULT_REGION": REGION,
+    }.items():
+        monkeypatch.setenv(name, value)
+    monkeypatch.delenv("AWS_PROFILE", raising=False)
+    boto3_utils.clear_boto3_client_cache()
+    boto3_utils.clear_ssm_cache()
+    with moto.mock_aws():
+        yield
+    boto3_utils.clear_boto3_client_cache()
+    boto3_utils.clear_ssm_cache()
+
+
+@pytest.fixture
+def calls(aws):
+    """AWS calls made during the test, by service.Operation"""
+    metrics = boto3_utils.add_instrumentation_backend(
+        boto3_utils.InMemoryMetrics()
+    )
+
+    def count(operation):
+        return metrics.summary().get(operation, {}).get("Count", 0)
+
+    yield count
+    boto3_utils.remove_instrumentation_backend(metrics)
+
+
+@pytest.fixture
+def bucket(aws):
+    client = boto3_utils.get_boto3_client("s3", region_name=REGION)
+    client.create_bucket(
+        Bucket="test-bucket",
+        CreateBucketConfiguration={"LocationConstraint": REGION},
+    )
+    return "test-bucket"
@@ -0,0 +1,1570 @@
+import datetime
+import gzip
+import io
+import json
+import mmap
+import os
+import sys
+import threading
+import time
+
+import pytest
+from botocore.awsrequest import AWSResponse
+from botocore.credentials import RefreshableCredentials
+from botocore.exceptions import ClientError, EndpointConnectionError
+from botocore.response import StreamingBody
+from botocore.stub import ANY, Stubber
+
+from pl_x_cdk_utils import boto3_utils
+from tests.conftest import REGION
+
+
+# clients
+
+
+def test_clients_are_cached_by_service_region_and_options(aws):
+    client = boto3_utils.get_boto3_client("s3", region_name=REGION)
+
+    assert boto3_utils.get_boto3_client("s3", region_name=REGION) is client
+    assert boto3_utils.get_boto3_client("s3", region_name="eu-west-1") \
+        is not client
+    assert boto3_utils.get_boto3_client("ssm", region_name=REGION) \
+        is not client
+    assert boto3_utils.get_boto3_client(
+        "s3", region_name=REGION, config_options={"read_timeout": 5}
+    ) is not client
+
+
+def test_clients_are_cached_by_credentials(aws):
+    credentials = {
+        "Credentials": {
+            "AccessKeyId": "key",
+            "SecretAccessKey": "secret",
+            "SessionToken": "token",
+        }
+    }
+    client = boto3_utils.get_boto3_client(
+        "s3", region_name=REGION, aws_credentials=credentials
+    )
+
+    assert boto3_utils.get_boto3_client(
+        "s3", region_name=REGION, aws_credentials=dict(credentials)
+    ) is client
+    assert boto3_utils.get_boto3_client("s3", region_name=REGION) \
+        is not client
+
+
+def test_per_thread_clients_are_reused_within_their_thread(aws):
+    clients = {}
+
+    def get_clients(name):
+        clients[name] = [
+            boto3_utils.get_boto3_client(
+                "s3", region_name=REGION, per_thread=True
+            )
+            for _ in range(2)
+        ]
+
+    threads = [
+        threading.Thread(target=get_clients, args=(name,))
+        for name in ("first", "second")
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert clients["first"][0] is clients["first"][1]
+    assert clients["second"][0] is clients["second"][1]
+    assert clients["first"][0] is not clients["second"][0]
+    assert boto3_utils.get_boto3_client("s3", region_name=REGION) \
+        is not clients["first"][0]
+
+
+def test_client_cache_drops_least_recently_used(aws, monkeypatch):
+    monkeypatch.setattr(boto3_utils, "CLIENT_CACHE_MAX_SIZE", 2)
+    first = boto3_utils.get_boto3_client("s3", region_name="eu-west-1")
+    second = boto3_utils.get_boto3_client("s3", region_name="eu-west-2")
+    # the first one becomes the most recently used
+    assert boto3_utils.get_boto3_client("s3", region_name="eu-west-1") \
+        is first
+    boto3_utils.get_boto3_client("s3", region_name="eu-west-3")
+
+    assert len(boto3_utils._client_cache) == 2
+    assert boto3_utils.get_boto3_client("s3", region_name="eu-west-1") \
+        is first
+    assert boto3_utils.get_boto3_client("s3", region_name="eu-west-2") \
+        is not second
+
+
+def test_client_cache_drops_clients_of_expired_credentials(aws):
+    expired = {
+        "Credentials": {
+            "AccessKeyId": "key",
+            "SecretAccessKey": "secret",
+            "SessionToken": "token",
+            "Expiration": datetime.datetime.now(datetime.timezone.utc)
+            - datetime.timedelta(minutes=1),
+        }
+    }
+    boto3_utils.get_boto3_client(
+        "s3", region_name=REGION, aws_credentials=expired
+    )
+    boto3_utils.get_boto3_client("s3", region_name=REGION)
+
+    assert len(boto3_utils._client_cache) == 1
+
+def test_cross_account_credentials_are_cached_until_they_expire(calls):
+    first = boto3_utils.get_cross_account_credentials(
+        "111111111111", "deployer"
+    )
+
+    assert boto3_utils.get_cross_account_credentials(
+        "111111111111", "deployer"
+    ) is first
+    assert calls("sts.AssumeRole") == 1
+
+    # within the expiry margin they are renewed
+    first["Credentials"]["Expiration"] = datetime.datetime.now(
+        datetime.timezone.utc
+    ) + datetime.timedelta(seconds=60)
+    renewed = boto3_utils.get_cross_account_credentials(
+        "111111111111", "deployer"
+    )
+
+    assert renewed is not first
+    assert calls("sts.AssumeRole") == 2
+    boto3_utils.get_cross_account_credentials(
+        "111111111111", "deployer", use_cache=False
+    )
+    assert calls("sts.AssumeRole") == 3
+
+
+def test_refreshable_credentials_refresh_themselves(calls):
+    credentials = boto3_utils.get_refreshable_cross_account_credentials(
+        "111111111111", "deployer"
+    )
+
+    assert isinstance(credentials, RefreshableCredentials)
+    assert boto3_utils.get_refreshable_cross_account_credentials(
+        "111111111111", "deployer"
+    ) is credentials
+    assert credentials.get_frozen_credentials().access_key
+    assert calls("sts.AssumeRole") == 1
+
+    credentials._expiry_time = datetime.datetime.now(
+        datetime.timezone.utc
+    ) - datetime.timedelta(minutes=1)
+    credentials.get_frozen_credentials()
+
+    assert calls("sts.AssumeRole") == 2
+    # the client of the credentials stays cached across the refresh
+    client = boto3_utils.get_boto3_client(
+        "s3", region_name=REGION, aws_credentials=credentials
+    )
+    assert boto3_utils.get_boto3_client(
+        "s3", region_name=REGION, aws_credentials=credentials
+    ) is client
+
+
+# listings
+
+
+def put_objects(bucket, keys, body=b"data"):
+    client = boto3_utils.get_boto3_client("s3", region_name=REGION)
+    for key in keys:
+        client.put_object(Bucket=bucket, Key=key, Body=body)
+
+
+def test_iterate_s3_objects_follows_every_page(bucket, calls):
+    keys = [f"data/{i:05d}.json" for i in range(1205)]
+    put_objects(bucket, keys)
+
+    listed = [obj["Key"] for obj in boto3_utils.iterate_s3_objects(
+        bucket, "data/", region_name=REGION
+    )]
+    limited = list(boto3_utils.iterate_s3_objects(
+        bucket, "data/", start_after="data/00099.json", max_keys=1001,
+        region_name=REGION
+    ))
+
+    assert listed == keys
+    assert calls("s3.ListObjectsV2") == 4
+    assert len(limited) == 1001
+    assert limited[0]["Key"] == "data/00100.json"
+    assert set(limited[0]) == {"Key", "Size", "ETag", "LastModified"}
+
+
+def test_iterate_s3_sub_folders(bucket, calls):
+    put_objects(bucket, [f"data/{i:03d}/file.json" for i in range(150)])
+
+    folders = list(boto3_utils.iterate_s3_sub_folders(
+        bucket, "data/", page_size=100, region_name=REGION
+    ))
+
+    assert folders == [f"data/{i:03d}/" for i in range(150)]
+    assert calls("s3.ListObjectsV2") == 2
+
+
+@pytest.fixture
+def partitioned_bucket(bucket):
+    put_objects(bucket, [
+        "data/year=2023/month=12/day=31/file.json",
+        "data/year=2024/month=01/day=01/file.json",
+        "data/year=2024/month=01/day=02/file.json",
+        "data/year=2024/month=02/day=01/file.json",
+    ])
+    return bucket
+
+
+def test_walk_s3_prefixes(partitioned_bucket):
+    walked = set(boto3_utils.walk_s3_prefixes(
+        partitioned_bucket, "data/", region_name=REGION
+    ))
+
+    assert len(walked) == 9
+    assert ("data/year=2024/", 1) in walked
+    assert ("data/year=2024/month=01/", 2) in walked
+    assert ("data/year=2024/month=01/day=02/", 3) in walked
+
+
+def test_walk_s3_prefixes_leaves_only(partitioned_bucket):
+    leaves = set(boto3_utils.walk_s3_prefixes(
+        partitioned_bucket, "data/", leaves_only=True, region_name=REGION
+    ))
+
+    assert leaves == {
+        ("data/year=2023/month=12/day=31/", 3),
+        ("data/year=2024/month=01/day=01/", 3),
+        ("data/year=2024/month=01/day=02/", 3),
+        ("data/year=2024/month=02/day=01/", 3),
+    }
+
+
+def test_walk_s3_prefixes_stops_at_max_depth(partitioned_bucket, calls):
+    leaves = set(boto3_utils.walk_s3_prefixes(
+        partitioned_bucket, "data/", max_depth=2, leaves_only=True,
+        region_name=REGION
+    ))
+
+    assert leaves == {
+        ("data/year=2023/month=12/", 2),
+        ("data/year=2024/month=01/", 2),
+        ("data/year=2024/month=02/", 2),
+    }
+    # the root and the years, the months are not listed
+    assert calls("s3.ListObjectsV2") == 3
+
+
+def test_list_s3_objects_for_date_range_lists_only_the_range(bucket, calls):
+    put_objects(bucket, [
+        f"data/year=2024/month={month:02d}/{day:02d}_rand=abc/file.json"
+        for month, day in [(1, 28), (1, 29), (1, 30), (1, 31), (2, 1)]
+    ])
+
+    objects = list(boto3_utils.list_s3_objects_for_date_range(
+        bucket, "data", datetime.datetime(2024, 1, 30),
+        datetime.datetime(2024, 2, 1), region_name=REGION
+    ))
+
+    assert [obj["Key"] for obj in objects] == [
+        "data/year=2024/month=01/30_rand=abc/file.json",
+        "data/year=2024/month=01/31_rand=abc/file.json",
+        "data/year=2024/month=02/01_rand=abc/file.json",
+    ]
+    assert calls("s3.ListObjectsV2") == 3
+
+
+def test_list_s3_objects_for_date_range_predicate(bucket, calls):
+    put_objects(bucket, [
+        "data/year=2024/month=01/06_rand=abc/file.json",
+        "data/year=2024/month=01/08_rand=abc/file.json",
+    ])
+
+    objects = list(boto3_utils.list_s3_objects_for_date_range(
+        bucket, "data", datetime.datetime(2024, 1, 1),
+        datetime.datetime(2024, 1, 31),
+        predicate=lambda timestamp: timestamp.weekday() == 0,
+        region_name=REGION
+    ))
+
+    assert [obj["Key"] for obj in objects] == [
+        "data/year=2024/month=01/08_rand=abc/file.json"
+    ]
+    # the five mondays of january
+    assert calls("s3.ListObjectsV2") == 5
+
+def test_list_s3_objects_for_date_range_bounds_the_listings(
+        bucket, monkeypatch):
+    put_objects(bucket, [
+        f"data/year=2024/month=01/{day:02d}_rand=abc/file.json"
+        for day in range(1, 32)
+    ])
+    listed = []
+    iterate_s3_objects = boto3_utils.iterate_s3_objects
+
+    def record(bucket, partition, **kwargs):
+        listed.append(partition)
+        return iterate_s3_objects(bucket, partition, **kwargs)
+
+    monkeypatch.setattr(boto3_utils, "iterate_s3_objects", record)
+    objects = boto3_utils.list_s3_objects_for_date_range(
+        bucket, "data", datetime.datetime(2024, 1, 1),
+        datetime.datetime(2024, 1, 31), max_workers=2, region_name=REGION
+    )
+
+    first = next(objects)
+    time.sleep(0.2)
+    assert first["Key"] == "data/year=2024/month=01/01_rand=abc/file.json"
+    assert len(listed) <= 3
+    assert [obj["Key"][24:26] for obj in objects] == [
+        f"{day:02d}" for day in range(2, 32)
+    ]
+    assert len(listed) == 31
+
+
+# ssm
+
+
+@pytest.fixture
+def ssm_cache(monkeypatch):
+    cache = boto3_utils._TTLCache(
+        ttl=boto3_utils.SSM_CACHE_TTL, max_size=boto3_utils.SSM_CACHE_MAX_SIZE
+    )
+    monkeypatch.setattr(boto3_utils, "_ssm_cache", cache)
+    return cache
+
+
+def put_parameters(values):
+    client = boto3_utils.get_boto3_client("ssm", region_name=REGION)
+    for name, value in values.items():
+        client.put_parameter(
+            Name=name, Value=value, Type="String", Overwrite=True
+        )
+
+
+def test_get_ssm_values_batches_and_caches(calls, ssm_cache):
+    values = {f"/app/param-{i}": f"value-{i}" for i in range(25)}
+    put_parameters(values)
+
+    found = boto3_utils.get_ssm_values(list(values) + ["/app/missing"])
+
+    assert found == values
+    assert calls("ssm.GetParameters") == 3
+    assert boto3_utils.get_ssm_values(list(values)) == values
+    assert boto3_utils.get_ssm_value("/app/param-3") == "value-3"
+    assert calls("ssm.GetParameters") == 3
+    assert calls("ssm.GetParameter") == 0
+
+
+def test_get_ssm_values_by_path(calls, ssm_cache):
+    put_parameters({"/app/a": "1", "/app/nested/b": "2", "/other/c": "3"})
+
+    assert boto3_utils.get_ssm_values_by_path("/app") == {
+        "/app/a": "1", "/app/nested/b": "2"
+    }
+    assert boto3_utils.get_ssm_values_by_path("/app", recursive=False) == {
+        "/app/a": "1"
+    }
+    assert boto3_utils.get_ssm_value("/app/nested/b") == "2"
+    assert calls("ssm.GetParametersByPath") == 2
+    assert calls("ssm.GetParameter") == 0
+
+
+def test_ssm_values_expire_after_the_ttl(aws, ssm_cache, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(boto3_utils.time, "monotonic", lambda: clock[0])
+    boto3_utils.configure_ssm_cache(ttl=60)
+    put_parameters({"/app/a": "old"})
+    assert boto3_utils.get_ssm_value("/app/a") == "old"
+    put_parameters({"/app/a": "new"})
+
+    clock[0] += 59
+    assert boto3_utils.get_ssm_value("/app/a") == "old"
+    assert boto3_utils.get_ssm_value("/app/a", use_cache=False) == "new"
+    put_parameters({"/app/a": "newer"})
+    clock[0] += 61
+    assert boto3_utils.get_ssm_value("/app/a") == "newer"
+
+
+def test_configure_ssm_cache_max_size(calls, ssm_cache):
+    put_parameters({"/app/a": "1", "/app/b": "2", "/app/c": "3"})
+    for name in ("/app/a", "/app/b", "/app/c"):
+        boto3_utils.get_ssm_value(name)
+
+    settings = boto3_utils.configure_ssm_cache(max_size=2)
+
+    assert settings == {
+        "ttl": boto3_utils.SSM_CACHE_TTL, "max_size": 2
+    }
+    assert boto3_utils.get_ssm_value("/app/c") == "3"
+    assert calls("ssm.GetParameter") == 3
+    assert boto3_utils.get_ssm_value("/app/a") == "1"
+    assert calls("ssm.GetParameter") == 4
+
+
+# downloads
+
+
+def test_download_s3_object_parallel(bucket, calls):
+    body = os.urandom(2 * 1024 * 1024 + 123)
+    put_objects(bucket, ["big.bin"], body=body)
+
+    downloaded = boto3_utils.download_s3_object_parallel(
+        bucket, "big.bin", part_size=1024 * 1024, region_name=REGION
+    )
+
+    assert bytes(downloaded) == body
+    assert calls("s3.GetObject") == 3
+
+
+def test_download_s3_object_parallel_to_file(bucket, tmp_path):
+    body = os.urandom(1024 * 1024 + 1)
+    put_objects(bucket, ["big.bin"], body=body)
+    file_path = str(tmp_path / "big.bin")
+
+    downloaded = boto3_utils.download_s3_object_parallel(
+        bucket, "big.bin", part_size=256 * 1024, file_path=file_path,
+        region_name=REGION
+    )
+
+    assert isinstance(downloaded, mmap.mmap)
+    assert downloaded[:] == body
+    downloaded.close()
+    with open(file_path, "rb") as f:
+        assert f.read() == body
+
+
+def test_download_s3_object_parallel_empty_object(bucket):
+    put_objects(bucket, ["empty.bin"], body=b"")
+
+    assert boto3_utils.download_s3_object_parallel(
+        bucket, "empty.bin", region_name=REGION
+    ) == bytearray()
+
+
+def test_get_object_from_s3_modes(bucket, tmp_path):
+    put_objects(bucket, ["lines.json"], body=b'{"a": 1}\n\n{"a": 2}\n')
+
+    assert boto3_utils.get_object_from_s3(
+        bucket, "lines.json", region=REGION
+    ) == '{"a": 1}\n\n{"a": 2}\n'
+    assert boto3_utils.get_object_from_s3(
+        bucket, "lines.json", region=REGION, use_cache=True,
+        cache_dir=str(tmp_path)
+    ) == '{"a": 1}\n\n{"a": 2}\n'
+    assert list(boto3_utils.get_object_from_s3(
+        bucket, "lines.json", region=REGION, mode="lines", json_lines=True
+    )) == [{"a": 1}, {"a": 2}]
+    with pytest.raises(ValueError):
+        boto3_utils.get_object_from_s3(
+            bucket, "lines.json", region=REGION, mode="unknown"
+        )
+
+def test_iterate_s3_object_lines_decompresses_gzip(bucket):
+    lines = [json.dumps({"id": i}) for i in range(1000)]
+    body = gzip.compress("\n".join(lines).encode("utf-8"))
+    put_objects(bucket, ["events.json.gz"], body=body)
+    client = boto3_utils.get_boto3_client("s3", region_name=REGION)
+    client.put_object(
+        Bucket=bucket, Key="events", Body=body, ContentEncoding="gzip"
+    )
+
+    for key in ("events.json.gz", "events"):
+        assert list(boto3_utils.iterate_s3_object_lines(
+            bucket, key, json_lines=True, chunk_size=100, region_name=REGION
+        )) == [{"id": i} for i in range(1000)]
+    assert b"".join(boto3_utils.iterate_s3_object_chunks(
+        bucket, "events.json.gz", compression=None, region_name=REGION
+    )) == body
+
+
+def test_iterate_s3_object_lines_keeps_lines_across_chunks(bucket):
+    put_objects(bucket, ["lines.csv"], body=b"a,b\r\nc,d\r\n\r\ne,f")
+
+    assert list(boto3_utils.iterate_s3_object_lines(
+        bucket, "lines.csv", chunk_size=3, region_name=REGION
+    )) == ["a,b", "c,d", "", "e,f"]
+    with pytest.raises(ValueError):
+        list(boto3_utils.iterate_s3_object_chunks(
+            bucket, "lines.csv", compression="brotli", region_name=REGION
+        ))
+
+
+def test_iterate_s3_object_lines_decompresses_zstd(bucket):
+    zstandard = pytest.importorskip("zstandard")
+    body = zstandard.ZstdCompressor().compress(b"first\nsecond\n")
+    put_objects(bucket, ["lines.txt.zst"], body=body)
+
+    assert list(boto3_utils.iterate_s3_object_lines(
+        bucket, "lines.txt.zst", region_name=REGION
+    )) == ["first", "second"]
+
+
+def test_zstd_without_zstandard_names_the_package(bucket, monkeypatch):
+    monkeypatch.setitem(sys.modules, "zstandard", None)
+    put_objects(bucket, ["lines.txt.zst"], body=b"not read")
+
+    with pytest.raises(ImportError, match="pip install zstandard"):
+        list(boto3_utils.iterate_s3_object_chunks(
+            bucket, "lines.txt.zst", region_name=REGION
+        ))
+
+
+def test_cached_object_is_revalidated_with_its_etag(bucket, tmp_path):
+    cache_dir = str(tmp_path)
+    put_objects(bucket, ["config.json"], body=b'{"version": 1}')
+
+    body = boto3_utils.get_cached_object_from_s3(
+        bucket, "config.json", cache_dir=cache_dir, region_name=REGION
+    )
+    assert body[:] == b'{"version": 1}'
+    body.close()
+
+    # a 304 serves the cached file, marked to tell it from a new download
+    body_path, _ = boto3_utils._get_cache_paths(
+        cache_dir, bucket, "config.json", REGION
+    )
+    with open(body_path, "wb") as f:
+        f.write(b'{"version": 0}')
+    body = boto3_utils.get_cached_object_from_s3(
+        bucket, "config.json", cache_dir=cache_dir, region_name=REGION
+    )
+    assert body[:] == b'{"version": 0}'
+    body.close()
+
+    put_objects(bucket, ["config.json"], body=b'{"version": 2}')
+    body = boto3_utils.get_cached_object_from_s3(
+        bucket, "config.json", cache_dir=cache_dir, region_name=REGION
+    )
+    assert body[:] == b'{"version": 2}'
+    body.close()
+
+
+def test_cached_object_without_revalidation(bucket, tmp_path, calls):
+    cache_dir = str(tmp_path)
+    put_objects(bucket, ["config.json"], body=b"cached")
+    boto3_utils.get_cached_object_from_s3(
+        bucket, "config.json", cache_dir=cache_dir, region_name=REGION
+    ).close()
+    put_objects(bucket, ["config.json"], body=b"changed")
+
+    body = boto3_utils.get_cached_object_from_s3(
+        bucket, "config.json", cache_dir=cache_dir, revalidate=False,
+        region_name=REGION
+    )
+
+    assert body[:] == b"cached"
+    body.close()
+    assert calls("s3.GetObject") == 1
+
+
+def test_cache_keeps_objects_under_max_bytes(bucket, tmp_path):
+    cache_dir = str(tmp_path)
+    put_objects(bucket, ["small.txt"], body=b"small")
+    put_objects(bucket, ["big.txt"], body=b"x" * 100)
+
+    boto3_utils.get_cached_object_from_s3(
+        bucket, "small.txt", cache_dir=cache_dir, max_bytes=50,
+        region_name=REGION
+    ).close()
+    big = boto3_utils.get_cached_object_from_s3(
+        bucket, "big.txt", cache_dir=cache_dir, max_bytes=50,
+        region_name=REGION
+    )
+
+    assert big == b"x" * 100
+    assert [name for name in os.listdir(cache_dir)
+            if name.endswith(".body")] == [
+        os.path.basename(boto3_utils._get_cache_paths(
+            cache_dir, bucket, "small.txt", REGION
+        )[0])
+    ]
+    boto3_utils.clear_s3_cache(cache_dir)
+    assert os.listdir(cache_dir) == []
+
+def test_cache_misses_download_outside_the_cache_lock(bucket, tmp_path):
+    cache_dir = str(tmp_path)
+    body = os.urandom(256 * 1024)
+    put_objects(bucket, ["big.bin"], body=body)
+    result = {}
+
+    def read():
+        cached = boto3_utils.get_cached_object_from_s3(
+            bucket, "big.bin", cache_dir=cache_dir, region_name=REGION
+        )
+        result["body"] = cached[:]
+        cached.close()
+
+    with boto3_utils._s3_cache_lock:
+        thread = threading.Thread(target=read)
+        thread.start()
+        deadline = time.monotonic() + 30
+        while not [
+            name for name in os.listdir(cache_dir)
+            if name.endswith(".tmp")
+            and os.path.getsize(os.path.join(cache_dir, name)) == len(body)
+        ]:
+            assert time.monotonic() < deadline, "download waited for the lock"
+            time.sleep(0.01)
+    thread.join()
+
+    assert result["body"] == body
+    assert not [name for name in os.listdir(cache_dir)
+                if name.endswith(".tmp")]
+
+
+def test_compute_s3_etag_matches_multipart_uploads(bucket, tmp_path):
+    file_path = tmp_path / "big.bin"
+    file_path.write_bytes(os.urandom(6 * 1024 * 1024))
+    transfer_config = boto3_utils.get_transfer_config(
+        multipart_threshold=5 * 1024 * 1024,
+        multipart_chunksize=5 * 1024 * 1024
+    )
+
+    result = boto3_utils.upload_file_to_s3(
+        str(file_path), bucket, "big.bin", region=REGION,
+        transfer_config=transfer_config
+    )
+
+    assert result["Bytes"] == 6 * 1024 * 1024
+    assert result["ETag"] == boto3_utils._compute_s3_etag(
+        str(file_path), transfer_config
+    )
+    assert result["ETag"].endswith('-2"')
+
+
+# uploads
+
+
+@pytest.fixture
+def local_dir(tmp_path):
+    directory = tmp_path / "site"
+    (directory / "css").mkdir(parents=True)
+    (directory / "index.html").write_text("<html></html>")
+    (directory / "css" / "style.css").write_text("body {}")
+    (directory / "robots.txt").write_text("User-agent: *")
+    return directory
+
+
+def test_sync_directory_to_s3_uploads_only_changes(bucket, local_dir):
+    first = boto3_utils.sync_directory_to_s3(
+        str(local_dir), bucket, "site", region=REGION
+    )
+    assert first["uploaded"] == [
+        "site/css/style.css", "site/index.html", "site/robots.txt"
+    ]
+
+    second = boto3_utils.sync_directory_to_s3(
+        str(local_dir), bucket, "site", region=REGION
+    )
+    assert second["uploaded"] == []
+    assert len(second["unchanged"]) == 3
+
+    (local_dir / "index.html").write_text("<html>changed</html>")
+    (local_dir / "robots.txt").unlink()
+    dry_run = boto3_utils.sync_directory_to_s3(
+        str(local_dir), bucket, "site", delete=True, dry_run=True,
+        region=REGION
+    )
+    third = boto3_utils.sync_directory_to_s3(
+        str(local_dir), bucket, "site", delete=True, region=REGION
+    )
+
+    for result in (dry_run, third):
+        assert result["uploaded"] == ["site/index.html"]
+        assert result["deleted"] == ["site/robots.txt"]
+        assert result["unchanged"] == ["site/css/style.css"]
+    assert third["Bytes"] == len("<html>changed</html>")
+    assert [obj["Key"] for obj in boto3_utils.iterate_s3_objects(
+        bucket, "site/", region_name=REGION
+    )] == ["site/css/style.css", "site/index.html"]
+
+
+# lambda
+
+
+def lambda_invoker(max_workers=16, timeout=None):
+    """The client iterate_lambda_invocations gets from the cache"""
+    config_options = {"retries": {"total_max_attempts": 1}}
+    if timeout:
+        config_options["read_timeout"] = timeout
+    return boto3_utils.get_boto3_client(
+        "lambda", region_name=REGION,
+        max_pool_connections=max(
+            max_workers, boto3_utils.DEFAULT_MAX_POOL_CONNECTIONS
+        ),
+        config_options=config_options
+    )
+
+
+def invoke_response(payload, function_error=None):
+    body = json.dumps(payload).encode("utf-8")
+    response = {
+        "StatusCode": 200,
+        "Payload": StreamingBody(io.BytesIO(body), len(body)),
+    }
+    if function_error:
+        response["FunctionError"] = function_error
+    return response
+
+
+def invoke_params(payload, invocation_type="RequestResponse"):
+    return {
+        "FunctionName": "worker",
+        "InvocationType": invocation_type,
+        "Payload": json.dumps(payload),
+    }
+
+
+def test_invoke_lambda_bulk_aggregates_the_outcomes(aws, monkeypatch):
+    monkeypatch.setattr(boto3_utils, "_backoff_delay", lambda attempt: 0)
+    payloads = [{"n": 0}, {"n": 1}, {"n": 2}]
+    with Stubber(lambda_invoker(max_workers=1)) as stubber:
+        stubber.add_response(
+            "invoke", invoke_response({"n": 0}), invoke_params({"n": 0})
+        )
+        stubber.add_client_error(
+            "invoke", "TooManyRequestsException",
+            expected_params=invoke_params({"n": 1})
+        )
+        stubber.add_response(
+            "invoke", invoke_response({"n": 1}), invoke_params({"n": 1})
+        )
+        stubber.add_response(
+            "invoke", invoke_response({"errorMessage": "boom"}, "Unhandled"),
+            invoke_params({"n": 2})
+        )
+
+        result = boto3_utils.invoke_lambda_bulk(
+            "worker", payloads, max_workers=1, region_name=REGION
+        )
+
+        stubber.assert_no_pending_responses()
+    assert result["Results"] == [{"n": 0}, {"n": 1}, None]
+    assert list(result["Errors"]) == [2]
+    assert isinstance(result["Errors"][2], boto3_utils.LambdaFunctionError)
+    assert result["Errors"][2].payload == {"errorMessage": "boom"}
+    assert result["Stats"]["Count"] == 3
+    assert result["Stats"]["Failed"] == 1
+    assert result["Stats"]["Retries"] == 1
+
+
+def test_failed_invocations_are_not_retried(aws):
+    client = lambda_invoker(max_workers=1, timeout=5)
+    with Stubber(client) as stubber:
+        stubber.add_client_error(
+            "invoke", "ServiceException", http_status_code=500,
+            expected_params=invoke_params({"n": 0})
+        )
+
+        result = boto3_utils.invoke_lambda_bulk(
+            "worker", [{"n": 0}], max_workers=1, timeout=5,
+            region_name=REGION
+        )
+
+        stubber.assert_no_pending_responses()
+    assert result["Errors"][0].response["Error"]["Code"] == \
+        "ServiceException"
+    # timed out calls aren't retried by botocore either
+    assert client.meta.config.retries["total_max_attempts"] == 1
+    assert client.meta.config.read_timeout == 5
+
+
+def test_iterate_lambda_invocations_bounds_the_payloads_in_flight(aws):
+    consumed = []
+
+    def payloads():
+        for n in range(6):
+            consumed.append(n)
+            yield {"n": n}
+
+    with Stubber(lambda_invoker(max_workers=1)) as stubber:
+        for n in range(6):
+            stubber.add_response(
+                "invoke", {"StatusCode": 202},
+                invoke_params({"n": n}, "Event")
+            )
+
+        outcomes = boto3_utils.iterate_lambda_invocations(
+            "worker", payloads(), invocation_type="Event", max_workers=1,
+            region_name=REGION
+        )
+        first = next(outcomes)
+        assert len(consumed) <= 3
+        rest = list(outcomes)
+
+    assert first["Index"] == 0
+    assert sorted(outcome["Index"] for outcome in rest) == [1, 2, 3, 4, 5]
+    assert all(outcome["Result"] is None for outcome in rest)
+
+
+def list_keys(bucket, prefix=""):
+    return [obj["Key"] for obj in boto3_utils.iterate_s3_objects(
+        bucket, prefix, region_name=REGION
+    )]
+
+
+def test_offload_payload_to_s3_round_trip(bucket):
+    small = {"n": 1}
+    large = {"items": ["x" * 100] * 20}
+
+    assert boto3_utils.offload_payload_to_s3(
+        small, bucket, threshold=1024, region_name=REGION
+    ) is small
+    pointer = boto3_utils.offload_payload_to_s3(
+        large, bucket, threshold=1024, region_name=REGION
+    )
+
+    assert boto3_utils.is_claim_check(pointer)
+    assert list_keys(bucket) == [
+        pointer[boto3_utils.CLAIM_CHECK_KEY]["Key"]
+    ]
+    assert pointer[boto3_utils.CLAIM_CHECK_KEY]["Key"].startswith(
+        boto3_utils.CLAIM_CHECK_PREFIX
+    )
+    lazy = boto3_utils.resolve_claim_check(
+        pointer, lazy=True, region_name=REGION
+    )
+    assert lazy["items"] == large["items"]
+    assert boto3_utils.resolve_claim_check(
+        pointer, delete=True, region_name=REGION
+    ) == large
+    assert list_keys(bucket) == []
+    assert boto3_utils.resolve_claim_check(small) is small
+
+
+@pytest.fixture
+def claim_check_limit(monkeypatch):
+    monkeypatch.setattr(boto3_utils, "LAMBDA_SYNC_PAYLOAD_LIMIT", 2048)
+    monkeypatch.setattr(boto3_utils, "LAMBDA_ASYNC_PAYLOAD_LIMIT", 2048)
+
+
+def test_invoke_lambda_deletes_the_claim_checks_it_read(
+        bucket, claim_check_limit):
+    payload = {"items": ["x" * 100] * 20}
+    response_pointer = boto3_utils.offload_payload_to_s3(
+        {"result": ["y" * 100] * 20}, bucket, threshold=1024,
+        region_name=REGION
+    )
+    with Stubber(boto3_utils.get_boto3_client(
+        "lambda", region_name=REGION
+    )) as stubber:
+        stubber.add_response(
+            "invoke", invoke_response(response_pointer),
+            {"FunctionName": "worker", "InvocationType": "RequestResponse",
+             "Payload": ANY}
+        )
+
+        result = boto3_utils.invoke_lambda(
+            "worker", payload, region_name=REGION,
+            claim_check_bucket=bucket
+        )
+
+    assert result == {"result": ["y" * 100] * 20}
+    assert list_keys(bucket) == []
+
+
+def test_event_claim_checks_are_kept_for_lambda_retries(
+        bucket, claim_check_limit):
+    with Stubber(boto3_utils.get_boto3_client(
+        "lambda", region_name=REGION
+    )) as stubber:
+        stubber.add_response(
+            "invoke", {"StatusCode": 202},
+            {"FunctionName": "worker", "InvocationType": "Event",
+             "Payload": ANY}
+        )
+
+        assert boto3_utils.invoke_lambda(
+            "worker", {"items": ["x" * 100] * 20}, invocation_type="Event",
+            region_name=REGION, claim_check_bucket=bucket
+        ) is None
+
+    assert len(list_keys(bucket, boto3_utils.CLAIM_CHECK_PREFIX)) == 1
+
+
+def test_inline_payloads_are_serialized_once(
+        bucket, claim_check_limit, monkeypatch):
+    payload = {"n": 1}
+    expected_params = invoke_params(payload)
+    serialized = []
+    dumps = json.dumps
+
+    def record(value, *args, **kwargs):
+        if value is payload:
+            serialized.append(value)
+        return dumps(value, *args, **kwargs)
+
+    monkeypatch.setattr(boto3_utils.json, "dumps", record)
+    with Stubber(boto3_utils.get_boto3_client(
+        "lambda", region_name=REGION
+    )) as stubber:
+        stubber.add_response(
+            "invoke", invoke_response({"ok": True}), expected_params
+        )
+
+        assert boto3_utils.invoke_lambda(
+            "worker", payload, region_name=REGION, claim_check_bucket=bucket
+        ) == {"ok": True}
+
+    assert len(serialized) == 1
+    assert list_keys(bucket) == []
+
+
+# glue
+
+
+@pytest.fixture
+def glue_table(aws):
+    client = boto3_utils.get_boto3_client("glue", region_name=REGION)
+    client.create_database(DatabaseInput={"Name": "db"})
+    client.create_table(DatabaseName="db", TableInput={
+        "Name": "events",
+        "PartitionKeys": [
+            {"Name": "year", "Type": "string"},
+            {"Name": "month", "Type": "string"},
+        ],
+        "StorageDescriptor": {
+            "Columns": [{"Name": "id", "Type": "string"}],
+            "Location": "s3://test-bucket/events/",
+        },
+    })
+    return client
+
+
+def get_partitions(client):
+    return {
+        tuple(partition["Values"]): partition["StorageDescriptor"]["Location"]
+        for partition in client.get_partitions(
+            DatabaseName="db", TableName="events"
+        )["Partitions"]
+    }
+
+
+def test_register_glue_partitions_hive_style(glue_table):
+    keys = [
+        "events/year=2024/month=01/a.json",
+        "events/year=2024/month=01/b.json",
+        {"Key": "events/year=2024/month=02/a.json"},
+        "events/year=2024/a.json",
+    ]
+
+    result = boto3_utils.register_glue_partitions(
+        "db", "events", "test-bucket", keys, region_name=REGION
+    )
+
+    assert sorted(result["created"]) == [("2024", "01"), ("2024", "02")]
+    assert result["skipped"] == ["events/year=2024/a.json"]
+    assert result["Errors"] == []
+    assert get_partitions(glue_table) == {
+        ("2024", "01"): "s3://test-bucket/events/year=2024/month=01/",
+        ("2024", "02"): "s3://test-bucket/events/year=2024/month=02/",
+    }
+
+    again = boto3_utils.register_glue_partitions(
+        "db", "events", "test-bucket", keys, region_name=REGION
+    )
+    assert again["created"] == []
+    assert sorted(again["existing"]) == [("2024", "01"), ("2024", "02")]
+
+
+def test_register_glue_partitions_from_a_template(glue_table):
+    keys = [
+        "events/2024/01/01_rand=abc/a.json",
+        "events/2024/01/02_rand=def/a.json",
+        "events/2024/02/01_rand=abc/a.json",
+    ]
+
+    result = boto3_utils.register_glue_partitions(
+        "db", "events", "test-bucket", keys,
+        template="events/{year}/{month}/{day}_rand={rand}",
+        region_name=REGION
+    )
+
+    assert result["created"] == [("2024", "02")]
+    # one partition can't point to the folders of two days
+    assert result["conflicts"] == [("2024", "01")]
+    assert get_partitions(glue_table) == {
+        ("2024", "02"): "s3://test-bucket/events/2024/02/01_rand=abc/"
+    }
+
+
+def test_register_glue_partitions_retries(glue_table, monkeypatch):
+    monkeypatch.setattr(boto3_utils, "_backoff_delay", lambda attempt: 0)
+    table = glue_table.get_table(DatabaseName="db", Name="events")["Table"]
+    with Stubber(glue_table) as stubber:
+        stubber.add_response("get_table", {"Table": table})
+        stubber.add_response("batch_get_partition", {
+            "Partitions": [{"Values": ["2024", "01"]}],
+            "UnprocessedKeys": [{"Values": ["2024", "02"]}],
+        })
+        stubber.add_response(
+            "batch_get_partition", {"Partitions": []},
+            {
+                "DatabaseName": "db",
+                "TableName": "events",
+                "PartitionsToGet": [{"Values": ["2024", "02"]}],
+            },
+        )
+        stubber.add_response("batch_create_partition", {"Errors": [{
+            "PartitionValues": ["2024", "03"],
+            "ErrorDetail": {"ErrorCode": "ThrottlingException"},
+        }]})
+        stubber.add_response("batch_create_partition", {})
+
+        result = boto3_utils.register_glue_partitions(
+            "db", "events", "test-bucket", [
+                f"events/year=2024/month={month}/a.json"
+                for month in ("01", "02", "03")
+            ], max_workers=1, region_name=REGION
+        )
+
+        stubber.assert_no_pending_responses()
+    assert result["existing"] == [("2024", "01")]
+    assert result["created"] == [("2024", "02"), ("2024", "03")]
+    assert result["Errors"] == []
+
+
+def test_register_glue_partitions_reports_unprocessed(glue_table):
+    table = glue_table.get_table(DatabaseName="db", Name="events")["Table"]
+    with Stubber(glue_table) as stubber:
+        stubber.add_response("get_table", {"Table": table})
+        stubber.add_response("batch_get_partition", {
+            "Partitions": [],
+            "UnprocessedKeys": [{"Values": ["2024", "01"]}],
+        })
+
+        result = boto3_utils.register_glue_partitions(
+            "db", "events", "test-bucket",
+            ["events/year=2024/month=01/a.json"], max_retries=0,
+            region_name=REGION
+        )
+
+    assert result["created"] == []
+    assert result["Errors"][0]["PartitionValues"] == ["2024", "01"]
+    assert result["Errors"][0]["ErrorDetail"]["ErrorCode"] == \
+        "UnprocessedKeys"
+
+
+@pytest.fixture
+def crawlers(aws):
+    client = boto3_utils.get_boto3_client("glue", region_name=REGION)
+    client.create_database(DatabaseInput={"Name": "db"})
+    for name in ("first", "second"):
+        client.create_crawler(
+            Name=name,
+            Role="arn:aws:iam::123456789012:role/crawler",
+            DatabaseName="db",
+            Targets={"S3Targets": [{"Path": f"s3://test-bucket/{name}/"}]},
+        )
+    return ["first", "second"]
+
+
+def test_trigger_glue_crawlers_coalesces_running_crawls(crawlers, calls):
+    started = boto3_utils.trigger_glue_crawlers(
+        crawlers + ["first"], region_name=REGION
+    )
+
+    assert {name: result["Status"] for name, result in started.items()} == {
+        "first": "STARTED", "second": "STARTED"
+    }
+    assert calls("glue.StartCrawler") == 2
+
+    again = boto3_utils.trigger_glue_crawlers(
+        crawlers + ["missing"], region_name=REGION
+    )
+
+    assert again["first"]["Status"] == "COALESCED"
+    assert again["second"]["Status"] == "COALESCED"
+    assert again["missing"]["Status"] == "FAILED"
+    assert again["missing"]["Error"].response["Error"]["Code"] == \
+        "EntityNotFoundException"
+
+
+def test_trigger_glue_crawlers_times_out(crawlers):
+    report = boto3_utils.trigger_glue_crawlers(
+        crawlers, wait=True, timeout=0, poll_interval=1, region_name=REGION
+    )
+
+    assert [result["Status"] for result in report.values()] == [
+        "TIMEOUT", "TIMEOUT"
+    ]
+
+def test_trigger_glue_crawlers_waits_for_coalesced_crawls(crawlers):
+    client = boto3_utils.get_boto3_client(
+        "glue", region_name=REGION,
+        max_pool_connections=boto3_utils.DEFAULT_MAX_POOL_CONNECTIONS
+    )
+    earlier = datetime.datetime.now(
+        datetime.timezone.utc
+    ) - datetime.timedelta(minutes=5)
+    with Stubber(client) as stubber:
+        stubber.add_client_error(
+            "start_crawler", "CrawlerRunningException",
+            expected_params={"Name": "first"}
+        )
+        # the running crawl finished before the first poll
+        stubber.add_response("batch_get_crawlers", {"Crawlers": [{
+            "Name": "first",
+            "State": "READY",
+            "LastCrawl": {"Status": "SUCCEEDED", "StartTime": earlier},
+        }]})
+
+        report = boto3_utils.trigger_glue_crawlers(
+            ["first"], wait=True, timeout=30, poll_interval=1,
+            region_name=REGION
+        )
+
+    assert report["first"]["Status"] == "SUCCEEDED"
+    assert report["first"]["Duration"] < 30
+
+
+def test_trigger_glue_crawlers_reports_connection_errors(crawlers):
+    client = boto3_utils.get_boto3_client(
+        "glue", region_name=REGION,
+        max_pool_connections=boto3_utils.DEFAULT_MAX_POOL_CONNECTIONS
+    )
+
+    def fail_second(params, **kwargs):
+        if params["Name"] == "second":
+            raise EndpointConnectionError(endpoint_url="https://glue")
+
+    client.meta.events.register(
+        "provide-client-params.glue.StartCrawler", fail_second
+    )
+    try:
+        report = boto3_utils.trigger_glue_crawlers(
+            crawlers, region_name=REGION
+        )
+    finally:
+        client.meta.events.unregister(
+            "provide-client-params.glue.StartCrawler", fail_second
+        )
+
+    assert report["first"]["Status"] == "STARTED"
+    assert report["second"]["Status"] == "FAILED"
+    assert isinstance(report["second"]["Error"], EndpointConnectionError)
+
+
+# quicksight
+
+
+def ingestion(status, **kwargs):
+    return {"Ingestion": dict({
+        "Arn": "arn:aws:quicksight:eu-central-1:123456789012:ingestion",
+        "IngestionStatus": status,
+        "CreatedTime": datetime.datetime(2024, 1, 1),
+    }, **kwargs)}
+
+
+def create_params(dataset_id):
+    return {
+        "DataSetId": dataset_id,
+        "IngestionId": ANY,
+        "AwsAccountId": "123456789012",
+        "IngestionType": "INCREMENTAL_REFRESH",
+    }
+
+
+def describe_params(dataset_id):
+    return {
+        "AwsAccountId": "123456789012",
+        "DataSetId": dataset_id,
+        "IngestionId": ANY,
+    }
+
+
+def test_refresh_quicksight_datasets_keeps_under_the_quota(aws):
+    client = boto3_utils.get_boto3_client("quicksight", region_name=REGION)
+    with Stubber(client) as stubber:
+        stubber.add_response("create_ingestion", {}, create_params("a"))
+        stubber.add_response(
+            "describe_ingestion", ingestion("RUNNING"), describe_params("a")
+        )
+        stubber.add_response("describe_ingestion", ingestion(
+            "COMPLETED", RowInfo={"RowsIngested": 10, "RowsDropped": 1},
+            IngestionTimeInSeconds=42
+        ), describe_params("a"))
+        # the quota is still taken, b waits for the next slot
+        stubber.add_client_error(
+            "create_ingestion", "LimitExceededException",
+            expected_params=create_params("b")
+        )
+        stubber.add_response("create_ingestion", {}, create_params("b"))
+        stubber.add_response("describe_ingestion", ingestion(
+            "FAILED", ErrorInfo={"Message": "bad source"}
+        ), describe_params("b"))
+        stubber.add_client_error(
+            "create_ingestion", "AccessDeniedException",
+            expected_params=create_params("c")
+        )
+
+        report = boto3_utils.refresh_quicksight_datasets(
+            ["a", "b", "a", "c"], "123456789012",
+            ingestion_type="INCREMENTAL_REFRESH", max_concurrent=1,
+            poll_interval=0, region_name=REGION
+        )
+
+        stubber.assert_no_pending_responses()
+    assert list(report) == ["a", "b", "c"]
+    assert report["a"]["Status"] == "COMPLETED"
+    assert report["a"]["RowsIngested"] == 10
+    assert report["a"]["RowsDropped"] == 1
+    assert report["a"]["Duration"] == 42
+    assert report["b"]["Status"] == "FAILED"
+    assert report["b"]["Error"] == "bad source"
+    assert report["c"]["Status"] == "FAILED"
+    assert report["c"]["IngestionId"] is None
+
+
+def test_refresh_quicksight_datasets_times_out(aws):
+    client = boto3_utils.get_boto3_client("quicksight", region_name=REGION)
+    with Stubber(client) as stubber:
+        stubber.add_response("create_ingestion", {}, create_params("a"))
+
+        report = boto3_utils.refresh_quicksight_datasets(
+            ["a", "b"], "123456789012", ingestion_type="INCREMENTAL_REFRESH",
+            max_concurrent=1, timeout=0, poll_interval=1, region_name=REGION
+        )
+
+    assert report["a"]["Status"] == "TIMEOUT"
+    assert report["a"]["IngestionId"]
+    assert report["b"] == {
+        "IngestionId": None,
+        "Status": "TIMEOUT",
+        "RowsIngested": None,
+        "RowsDropped": None,
+        "Duration": None,
+        "Error": None,
+    }
+
+
+# bucket policies
+
+
+def statement(sid, principal, actions=("s3:GetObject",)):
+    return {
+        "Sid": sid,
+        "Effect": "Allow",
+        "Principal": principal,
+        "Action": list(actions),
+        "Resource": "arn:aws:s3:::test-bucket/*",
+    }
+
+
+def read_policy(bucket):
+    client = boto3_utils.get_boto3_client("s3", region_name=REGION)
+    return json.loads(client.get_bucket_policy(Bucket=bucket)["Policy"])
+
+
+def test_update_s3_bucket_policy_merges_principals(bucket):
+    first = "arn:aws:iam::111111111111:root"
+    second = "arn:aws:iam::222222222222:root"
+
+    added = boto3_utils.update_s3_bucket_policy(
+        bucket, add=statement("read", {"AWS": first}), region=REGION
+    )
+    merged = boto3_utils.update_s3_bucket_policy(
+        bucket, add=statement("read", {"AWS": [second, first]}),
+        region=REGION
+    )
+    unchanged = boto3_utils.update_s3_bucket_policy(
+        bucket, add=statement("read", {"AWS": second}), region=REGION
+    )
+
+    assert added["Status"] == "UPDATED"
+    assert merged["Status"] == "UPDATED"
+    assert unchanged["Status"] == "UNCHANGED"
+    statements = read_policy(bucket)["Statement"]
+    assert len(statements) == 1
+    assert sorted(statements[0]["Principal"]["AWS"]) == [first, second]
+
+
+def test_update_s3_bucket_policy_with_public_principal(bucket):
+    boto3_utils.update_s3_bucket_policy(
+        bucket, add=statement("public", "*"), region=REGION
+    )
+    # without a Sid it's merged into the statement with the same scope
+    result = boto3_utils.update_s3_bucket_policy(
+        bucket, add=dict(statement("public", "*"), Sid=None), region=REGION
+    )
+
+    assert result["Status"] == "UNCHANGED"
+    assert read_policy(bucket)["Statement"] == [statement("public", "*")]
+
+
+def test_update_s3_bucket_policy_replace_and_remove(bucket):
+    principal = {"AWS": "arn:aws:iam::111111111111:root"}
+    boto3_utils.update_s3_bucket_policy(bucket, add=[
+        statement("read", principal), statement("list", principal)
+    ], region=REGION)
+
+    boto3_utils.update_s3_bucket_policy(
+        bucket, replace=statement("read", principal, ["s3:*"]),
+        remove_sids="list", region=REGION
+    )
+
+    assert read_policy(bucket)["Statement"] == [
+        statement("read", principal, ["s3:*"])
+    ]
+    with pytest.raises(ValueError):
+        boto3_utils.update_s3_bucket_policy(
+            bucket, replace=dict(statement(None, principal), Sid=None),
+            region=REGION
+        )
+
+    removed = boto3_utils.update_s3_bucket_policy(
+        bucket, remove_sids=["read"], region=REGION
+    )
+    assert removed["Status"] == "UPDATED"
+    with pytest.raises(ClientError):
+        read_policy(bucket)
+
+
+def test_update_s3_bucket_policy_retries_overwritten_updates(bucket):
+    client = boto3_utils.get_boto3_client("s3", region_name=REGION)
+    # a different client, so the competing write isn't intercepted itself
+    competitor = boto3_utils.get_boto3_client(
+        "s3", region_name=REGION, config_options={"read_timeout": 5}
+    )
+    principal = {"AWS": "arn:aws:iam::111111111111:root"}
+    overwrites = [statement("other", principal)]
+
+    def overwrite(**kwargs):
+        if overwrites:
+            competitor.put_bucket_policy(Bucket=bucket, Policy=json.dumps({
+                "Version": "2012-10-17", "Statement": [overwrites.pop()]
+            }))
+
+    client.meta.events.register("after-call.s3.PutBucketPolicy", overwrite)
+    try:
+        result = boto3_utils.update_s3_bucket_policy(
+            bucket, add=statement("read", principal), region=REGION
+        )
+        assert result["Status"] == "UPDATED"
+        assert result["Attempts"] == 2
+        assert [item["Sid"] for item in read_policy(bucket)["Statement"]] \
+            == ["other", "read"]
+
+        overwrites.extend([statement("other", principal)] * 2)
+        with pytest.raises(RuntimeError):
+            boto3_utils.update_s3_bucket_policy(
+                bucket, add=statement("write", principal), max_attempts=2,
+                region=REGION
+            )
+    finally:
+        client.meta.events.unregister(
+            "after-call.s3.PutBucketPolicy", overwrite
+        )
+
+
+def test_update_s3_bucket_policies(aws, bucket):
+    result = boto3_utils.update_s3_bucket_policies(
+        [bucket, bucket, "missing-bucket"],
+        add=statement("read", {"AWS": "arn:aws:iam::111111111111:root"}),
+        region=REGION
+    )
+
+    assert list(result) == [bucket, "missing-bucket"]
+    assert result[bucket]["Status"] == "UPDATED"
+    assert result["missing-bucket"]["Status"] == "FAILED"
+
+def test_account_id_principals_are_compared_as_root_arns(bucket):
+    client = boto3_utils.get_boto3_client("s3", region_name=REGION)
+    get_bucket_policy = client.get_bucket_policy
+
+    def rewrite_account_ids(**kwargs):
+        # s3 stores account ids as root ARNs, moto doesn't
+        response = get_bucket_policy(**kwargs)
+        response["Policy"] = response["Policy"].replace(
+            '"111111111111"', '"arn:aws:iam::111111111111:root"'
+        )
+        return response
+
+    client.get_bucket_policy = rewrite_account_ids
+    try:
+        added = boto3_utils.update_s3_bucket_policy(
+            bucket, add=statement("read", {"AWS": "111111111111"}),
+            region=REGION
+        )
+        again = boto3_utils.update_s3_bucket_policy(
+            bucket, add=statement("read", {"AWS": ["111111111111"]}),
+            region=REGION
+        )
+    finally:
+        del client.get_bucket_policy
+
+    assert added["Status"] == "UPDATED"
+    assert added["Attempts"] == 1
+    assert again["Status"] == "UNCHANGED"
+    assert read_policy(bucket)["Statement"][0]["Principal"] == {
+        "AWS": "arn:aws:iam::111111111111:root"
+    }
+
+
+# accounts
+
+
+def list_bucket_names(aws_credentials=None, region_name=None):
+    client = boto3_utils.get_boto3_client(
+        "s3", region_name=region_name, aws_credentials=aws_credentials
+    )
+    return aws_credentials, client
+
+
+def test_run_for_accounts_with_refreshable_credentials(aws, calls):
+    result = boto3_utils.run_for_accounts(list_bucket_names, [
+        "111111111111",
+        ("222222222222", "other-role"),
+        {"account_id": "111111111111", "region": "eu-west-1"},
+        "111111111111",
+    ], role_name="deployer", region_name=REGION)
+
+    results = result["Results"]
+    assert [item["Status"] for item in results] == ["SUCCEEDED"] * 4
+    assert [item["RoleName"] for item in results] == [
+        "deployer", "other-role", "deployer", "deployer"
+    ]
+    assert result["Matrix"] == {
+        "111111111111": {REGION: "SUCCEEDED", "eu-west-1": "SUCCEEDED"},
+        "222222222222": {REGION: "SUCCEEDED"},
+    }
+    assert result["Stats"]["Count"] == 4
+    assert result["Stats"]["Failed"] == 0
+
+    credentials = [item["Result"][0] for item in results]
+    assert all(
+        isinstance(item, RefreshableCredentials) for item in credentials
+    )
+    assert credentials[0] is credentials[3]
+    assert credentials[0] is not credentials[1]
+    assert credentials[0].get_frozen_credentials().access_key
+    # one role assumption and one client per account, role and region
+    assert calls("sts.AssumeRole") == 3
+    assert results[0]["Result"][1] is results[3]["Result"][1]
+
+
+def test_run_for_accounts_reports_failures(aws):
+    def operation(region, aws_credentials=None):
+        if region == "eu-west-1":
+            raise RuntimeError("failed")
+        return region
+
+    result = boto3_utils.run_for_accounts(
+        operation, [("111111111111", "deployer", "eu-west-1"),
+                    ("111111111111", "deployer", REGION)],
+        max_calls_per_second=100
+    )
+
+    assert [item["Status"] for item in result["Results"]] == [
+        "FAILED", "SUCCEEDED"
+    ]
+    assert str(result["Results"][0]["Error"]) == "failed"
+    assert result["Results"][1]["Result"] == REGION
+    assert result["Stats"]["Failed"] == 1
+
+@pytest.mark.parametrize("targets, role_name, message", [
+    (["111111111111"], None, "no role name"),
+    ([("111111111111", None)], None, "no role name"),
+    ([()], "deployer", "expected"),
+    ([("111111111111", "deployer", REGION, "extra")], None, "expected"),
+    ([{"role_name": "deployer"}], None, "no account id"),
+])
+def test_run_for_accounts_rejects_invalid_targets(targets, role_name,
+                                                  message):
+    def operation(region, aws_credentials=None):
+        raise AssertionError("must not run")
+
+    with pytest.raises(ValueError, match=message):
+        boto3_utils.run_for_accounts(
+            operation, targets, role_name=role_name
+        )
+
+
+def test_configuring_the_clients_replaces_the_cached_ones(aws, monkeypatch):
+    monkeypatch.setattr(
+        boto3_utils, "_client_settings", dict(boto3_utils._client_settings)
+    )
+    client = boto3_utils.get_boto3_client("s3", region_name=REGION)
+
+    settings = boto3_utils.configure_boto3_clients(read_timeout=5)
+
+    assert settings["read_timeout"] == 5
+    new_client = boto3_utils.get_boto3_client("s3", region_name=REGION)
+    assert new_client is not client
+    assert new_client.meta.config.read_timeout == 5
+
+def test_rate_limits_take_a_token_per_attempt(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setattr(
+        boto3_utils, "_client_settings", dict(boto3_utils._client_settings)
+    )
+    monkeypatch.setattr(boto3_utils, "_rate_limiters", {})
+    monkeypatch.setattr("botocore.endpoint.time.sleep", lambda seconds: None)
+    boto3_utils.clear_boto3_client_cache()
+
+    class CountingLimiter:
+        acquired = 0
+
+        def acquire(self):
+            CountingLimiter.acquired += 1
+
+    boto3_utils.configure_boto3_clients(
+        retry_mode="standard", max_attempts=3, rate_limits={"sts": 1}
+    )
+    boto3_utils._rate_limiters["sts"] = CountingLimiter()
+    client = boto3_utils.get_boto3_client("sts", region_name=REGION)
+
+    class RawBody:
+        def __init__(self, body):
+            self.body = body
+
+        def stream(self, **kwargs):
+            yield self.body
+
+    statuses = iter([500, 500, 200])
+
+    def respond(request, **kwargs):
+        status = next(statuses)
+        body = (
+            b"<GetCallerIdentityResponse><GetCallerIdentityResult>"
+            b"<Account>111111111111</Account>"
+            b"</GetCallerIdentityResult></GetCallerIdentityResponse>"
+            if status == 200 else b"<ErrorResponse/>"
+        )
+        return AWSResponse(request.url, status, {}, RawBody(body))
+
+    client.meta.events.register("before-send.sts", respond)
+    try:
+        response = client.get_caller_identity()
+    finally:
+        boto3_utils.clear_boto3_client_cache()
+
+    assert response["Account"] == "111111111111"
+    assert CountingLimiter.acquired == 3
+
+
+def test_in_memory_metrics_keep_fixed_buckets(calls):
+    metrics = boto3_utils.InMemoryMetrics(buckets=(0.1, 1))
+    for latency in (0.05, 0.5, 0.5, 5):
+        metrics({
+            "Service": "s3",
+            "Operation": "GetObject",
+            "Latency": latency,
+            "Retries": 1,
+            "RequestBytes": 10,
+            "ResponseBytes": None,
+            "StatusCode": 200,
+            "Error": None,
+        })
+
+    summary = metrics.summary()["s3.GetObject"]
+
+    assert summary["Count"] == 4
+    assert summary["Retries"] == 4
+    assert summary["RequestBytes"] == 40
+    assert summary["Histogram"] == {0.1: 1, 1: 2, float("inf"): 1}
+    assert summary["P50"] == 1
+    assert summary["P99"] == 5
@@ -0,0 +1,227 @@
+import json
+
+import pytest
+
+cdk = pytest.importorskip("aws_cdk")
+
+from aws_cdk import (  # noqa: E402
+    aws_ec2 as ec2,
+    aws_s3 as s3,
+    aws_stepfunctions as sfn,
+)
+from aws_cdk.assertions import Match, Template  # noqa: E402
+
+from pl_x_cdk_utils import (  # noqa: E402
+    ec2_utils,
+    ecs_utils,
+    helpers,
+    iam_utils,
+    s3_utils,
+    step_function_json_utils,
+    stepfunctions_utils,
+)
+from tests.conftest import REGION  # noqa: E402
+
+ACCOUNT = "123456789012"
+
+
+def new_stack():
+    app = cdk.App()
+    return cdk.Stack(
+        app, "stack", env=cdk.Environment(account=ACCOUNT, region=REGION)
+    )
+
+
+# logical ids
+
+
+def test_logical_ids_are_derived_from_the_content():
+    stack = new_stack()
+
+    first = helpers.get_logical_id("profile", "name", 1, stack)
+    second = helpers.get_logical_id("profile", "name", 1, new_stack())
+
+    assert first == second
+    assert first.startswith("profile-")
+    assert first != helpers.get_logical_id("profile", "name", 2, stack)
+
+
+def test_identical_arguments_get_a_numbered_suffix():
+    stack = new_stack()
+
+    first = ecs_utils.get_ecs_cluster(stack, cluster_name="cluster")
+    second = ecs_utils.get_ecs_cluster(stack, cluster_name="cluster")
+
+    assert second.node.id == f"{first.node.id}-2"
+
+
+def test_templates_are_stable_between_synths():
+    def synth():
+        stack = new_stack()
+        vpc = ec2.Vpc(stack, "vpc", max_azs=1, nat_gateways=0)
+        ecs_utils.get_ecs_cluster(stack, cluster_name="cluster", vpc=vpc)
+        ecs_utils.get_fargate_task_definition(stack, family="family")
+        return Template.from_stack(stack).to_json()
+
+    assert synth() == synth()
+
+
+def test_repeated_vpc_lookups_return_the_first_one():
+    stack = new_stack()
+
+    vpc = ec2_utils.retrieve_vpc(stack, "vpc-1")
+    again = ec2_utils.retrieve_vpc(stack, "vpc-1")
+    other = ec2_utils.retrieve_vpc(stack, "vpc-2")
+
+    assert vpc.node.id == helpers.get_logical_id("ec2-vpc-profile", "vpc-1")
+    assert again is vpc
+    assert [child.node.id for child in stack.node.children] == [
+        vpc.node.id,
+        other.node.id,
+    ]
+
+
+# lookups
+
+
+def test_repeated_lookups_return_the_same_construct():
+    stack = new_stack()
+
+    bucket = s3_utils.get_bucket_object_from_name(stack, "bucket")
+    role = iam_utils.get_role_from_arn(stack, "role")
+
+    assert s3_utils.get_bucket_object_from_name(stack, "bucket") is bucket
+    assert iam_utils.get_role_from_arn(stack, "role") is role
+    assert role.node.id == "profile-for-role-role"
+    # nothing but the lookups is added to the tree or the template
+    assert [child.node.id for child in stack.node.children] == [
+        "profile-for-bucket-bucket",
+        "profile-for-role-role",
+    ]
+    assert Template.from_stack(stack).to_json().get("Resources", {}) == {}
+
+
+def test_conflicting_lookups_raise():
+    stack = new_stack()
+    iam_utils.get_role_from_arn(stack, "role")
+    s3.Bucket(stack, "profile-for-bucket-bucket")
+
+    with pytest.raises(ValueError, match="role:"):
+        iam_utils.get_role_from_arn(stack, "role", instance_profile=True)
+    with pytest.raises(ValueError, match="another construct"):
+        s3_utils.get_bucket_object_from_name(stack, "bucket")
+    profile = iam_utils.get_role_from_arn(
+        stack, "role", id="profile", instance_profile=True
+    )
+    assert profile.role_arn.endswith(":instance-profile/role")
+
+
+# distributed map
+
+
+def deploy_distributed_map(**kwargs):
+    stack = new_stack()
+    reader = s3.Bucket(stack, "reader")
+    writer = s3.Bucket(stack, "writer")
+    state = stepfunctions_utils.get_map_state(
+        stack,
+        "map",
+        distributed=True,
+        item_processor={
+            "StartAt": "pass",
+            "States": {"pass": {"Type": "Pass", "End": True}},
+        },
+        item_reader=step_function_json_utils.get_item_reader(
+            "reader", prefix="in/"
+        ),
+        result_writer=step_function_json_utils.get_result_writer(
+            "writer", prefix="out/"
+        ),
+        **kwargs,
+    )
+    stepfunctions_utils.deploy_state_machine(
+        stack,
+        "machine",
+        state,
+        distributed_map=True,
+        item_reader_bucket=reader,
+        result_writer_bucket=writer,
+    )
+    return Template.from_stack(stack)
+
+
+def get_definition(template):
+    machine = template.find_resources("AWS::StepFunctions::StateMachine")
+    definition = list(machine.values())[0]["Properties"]["DefinitionString"]
+    return json.loads(definition)
+
+
+def test_distributed_map_state_json():
+    template = deploy_distributed_map()
+
+    state = get_definition(template)["States"]["map"]
+    assert state["ItemProcessor"]["ProcessorConfig"] == {
+        "Mode": "DISTRIBUTED",
+        "ExecutionType": "EXPRESS",
+    }
+    assert state["ItemProcessor"]["StartAt"] == "pass"
+    assert state["ItemReader"]["Resource"] == (
+        "arn:aws:states:::s3:listObjectsV2"
+    )
+    assert state["ResultWriter"]["Parameters"] == {
+        "Bucket": "writer",
+        "Prefix": "out/",
+    }
+    assert state["MaxConcurrency"] == 10000
+    assert state["End"] is True
+    assert "ItemsPath" not in state
+
+
+def test_distributed_map_keeps_a_given_concurrency():
+    template = deploy_distributed_map(max_concurrency=50)
+
+    assert get_definition(template)["States"]["map"]["MaxConcurrency"] == 50
+
+
+def test_distributed_map_role_is_granted_the_map_run():
+    template = deploy_distributed_map()
+
+    statements = list(
+        template.find_resources("AWS::IAM::Policy").values()
+    )[0]["Properties"]["PolicyDocument"]["Statement"]
+    actions = {
+        action
+        for statement in statements
+        for action in (
+            statement["Action"]
+            if isinstance(statement["Action"], list)
+            else [statement["Action"]]
+        )
+    }
+    assert {
+        "states:StartExecution",
+        "states:DescribeExecution",
+        "states:StopExecution",
+        "s3:ListBucket",
+        "s3:GetObject",
+        "s3:PutObject",
+    } <= actions
+    start = next(
+        statement
+        for statement in statements
+        if statement["Action"] == "states:StartExecution"
+    )
+    # built from the name, not a reference to the state machine
+    assert "machine" in json.dumps(start["Resource"])
+    template.has_resource_properties(
+        "AWS::StepFunctions::StateMachine",
+        {"StateMachineName": "machine", "RoleArn": Match.any_value()},
+    )
+
+
+def test_inline_map_keeps_its_concurrency():
+    stack = new_stack()
+    state = stepfunctions_utils.get_map_state(stack, "map")
+    state.iterator(sfn.Pass(stack, "pass"))
+
+    assert state.to_state_json()["MaxConcurrency"] == 6
@@ -0,0 +1,69 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip("aws_cdk")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# runs in a new interpreter, the modules must not be imported yet
+COUNT_JSII_CALLS = """
+import collections
+import importlib
+import json
+import pkgutil
+
+import jsii
+
+calls = collections.Counter()
+
+
+def counting(name, call):
+    def wrapper(*args, **kwargs):
+        calls[name] += 1
+        return call(*args, **kwargs)
+
+    return wrapper
+
+
+# the generated bindings call these through the jsii module
+for name in ("create", "get", "set", "sget", "sset", "invoke", "sinvoke"):
+    setattr(jsii, name, counting(name, getattr(jsii, name)))
+
+import pl_x_cdk_utils
+
+for module in pkgutil.iter_modules(pl_x_cdk_utils.__path__):
+    importlib.import_module(f"pl_x_cdk_utils.{module.name}")
+print(json.dumps(calls))
+"""
+
+
+def run_counting(code):
+    env = dict(
+        os.environ,
+        PYTHONPATH=ROOT,
+        JSII_SILENCE_WARNING_UNTESTED_NODE_VERSION="1",
+        JSII_SILENCE_WARNING_DEPRECATED_NODE_VERSION="1",
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, env=env
+    )
+    assert result.returncode == 0, result.stderr
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def test_importing_the_modules_creates_no_jsii_objects():
+    assert run_counting(COUNT_JSII_CALLS) == {}
+
+
+def test_jsii_calls_are_counted():
+    code = COUNT_JSII_CALLS.replace(
+        "print(json.dumps(calls))",
+        "from aws_cdk import Duration\n"
+        "Duration.seconds(1)\n"
+        "print(json.dumps(calls))",
+    )
+    assert run_counting(code) == {"sinvoke": 1}